@@ -0,0 +1,128 @@
+import csv
+import json
+
+import tablib
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from aso.models import Order, OrderTracking, Product
+
+from .models import User
+
+# Admin data exports.
+#
+# Each dataset is a flat values_list() projection read with
+# iterator(chunk_size=...), so no model instances or nested serializers are
+# built and CSV/NDJSON output streams with flat memory. Orders come out as
+# one row per line item, with the order columns repeated.
+
+
+def product_rows():
+    headers = [
+        'id', 'product_number', 'title', 'categories', 'current_price', 'original_price', 'discount_percent',
+        'rating', 'reviews_count', 'badge', 'main_image', 'display_product', 'created_at', 'updated_at',
+    ]
+    queryset = Product.objects.order_by('id').values_list(
+        'id', 'product_number', 'title', 'card__category_names', 'current_price', 'original_price',
+        'discount_percent', 'rating', 'reviews_count', 'badge', 'main_image', 'display_product',
+        'created_at', 'updated_at',
+    )
+    rows = (
+        # The card keeps category names as "|Aso Oke|Formal Wear|"
+        (row[:3] + (", ".join(filter(None, (row[3] or "").split("|"))),) + row[4:])
+        for row in queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+    return headers, rows
+
+
+def order_rows():
+    headers = [
+        'order_number', 'created_at', 'customer_email', 'customer_first_name', 'customer_last_name', 'status',
+        'subtotal', 'shipping_fee', 'discount', 'total', 'tracking_number', 'carrier', 'delivery_date',
+        'product_id', 'product_title', 'quantity', 'price',
+    ]
+    latest_status = OrderTracking.objects.filter(order=OuterRef('pk')).order_by('-id').values('status')[:1]
+    queryset = (
+        # An order without tracking events yet is "placed", as on the order pages
+        Order.objects.annotate(status=Coalesce(Subquery(latest_status), Value('placed')))
+        .order_by('id', 'items__id')
+        .values_list(
+            'order_number', 'created_at', 'user__email', 'user__first_name', 'user__last_name', 'status',
+            'subtotal', 'shipping_fee', 'discount', 'total', 'tracking_number', 'carrier', 'delivery_date',
+            'items__product_id', 'items__product__title', 'items__quantity', 'items__price',
+        )
+    )
+    return headers, queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def customer_rows():
+    headers = [
+        'id', 'email', 'first_name', 'last_name', 'phone', 'date_joined', 'is_active', 'orders_count', 'total_spent',
+    ]
+    orders = Order.objects.filter(user=OuterRef('pk')).order_by().values('user')
+    queryset = (
+        # Shoppers only: staff, admins and riders have accounts too
+        User.objects.exclude(is_staff=True)
+        .exclude(is_superuser=True)
+        .exclude(groups__name__iexact='admin')
+        .exclude(groups__name__iexact='rider')
+        .annotate(
+            orders_count=Subquery(orders.annotate(count=Count('id')).values('count')),
+            total_spent=Subquery(
+                orders.annotate(total=Sum('total')).values('total'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+        )
+        .order_by('id')
+        .values_list(
+            'id', 'email', 'first_name', 'last_name', 'phone', 'date_joined', 'is_active',
+            'orders_count', 'total_spent',
+        )
+    )
+    return headers, queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+DATASETS = {
+    'products': product_rows,
+    'orders': order_rows,
+    'customers': customer_rows,
+}
+
+
+class _Echo:
+    # csv.writer only needs write(); hand each line straight back
+    def write(self, value):
+        return value
+
+
+def csv_lines(headers, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(headers)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(headers, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def xlsx_content(headers, rows):
+    """
+    XLSX is a zip archive that tablib builds in memory, so unlike CSV and
+    NDJSON it can't be streamed; use those for very large tables.
+    """
+    dataset = tablib.Dataset(headers=headers)
+    for row in rows:
+        # Excel has no timezone-aware dates
+        dataset.append([value.replace(tzinfo=None) if getattr(value, 'tzinfo', None) else value for value in row])
+    return dataset.export('xlsx')
+
+
+FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', xlsx_content),
+}
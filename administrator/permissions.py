@@ -93,4 +93,19 @@ class IsSuperAdminPermission(BasePermission):
             self.message = "Your access has been blocked. Please contact support."
             return False
 
-        return True
\ No newline at end of file
+        return True
+
+
+class IsAdminGroupPermission(BasePermission):
+
+    def has_permission(self, request, view):
+        user = request.user
+
+        if not user.is_authenticated:
+            return False
+
+        if not user.groups.filter(name__iexact='admin').exists():
+            self.message = "Not authorized"
+            return False
+
+        return True
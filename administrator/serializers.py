@@ -2,7 +2,8 @@ from rest_framework import serializers
 from rest_framework.exceptions import ParseError
 
 from administrator.models import User
-from aso.models import Category, Order, OrderFeedBack, OrderItem, OrderReturn, OrderTracking, PaymentDetail, Product, ProductColor, ProductDetail, ProductImage, ProductSize, ShippingAddress
+from aso.repricing import create_campaign
+from aso.models import Category, Order, OrderFeedBack, OrderItem, OrderReturn, OrderTracking, PaymentDetail, PriceCampaign, Product, ProductColor, ProductDetail, ProductImage, ProductSize, ShippingAddress
 
 
 class RegUserSerializer(serializers.ModelSerializer):
@@ -303,4 +304,43 @@ class UserOrderListSerializer(serializers.ModelSerializer):
     def get_groups(self, obj):
         return list(obj.groups.values_list('name', flat=True))
         
-    
\ No newline at end of file
+    
+
+class PriceCampaignSerializer(serializers.ModelSerializer):
+    category = serializers.ListField(child=serializers.CharField(), required=False, write_only=True)
+    badge = serializers.ListField(child=serializers.ChoiceField(choices=Product.Badge), required=False, write_only=True)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, write_only=True)
+    all_products = serializers.BooleanField(default=False, write_only=True)
+    discount_percent = serializers.IntegerField(min_value=0, max_value=100)
+    starts_at = serializers.DateTimeField(required=False)
+
+    class Meta:
+        model = PriceCampaign
+        fields = [
+            'id', 'name', 'discount_percent', 'category', 'badge', 'ids', 'all_products', 'filters',
+            'starts_at', 'ends_at', 'status', 'products_count', 'created_at', 'applied_at', 'reverted_at',
+        ]
+        read_only_fields = ['filters', 'status', 'products_count', 'created_at', 'applied_at', 'reverted_at']
+
+    def validate(self, attrs):
+        all_products = attrs.pop('all_products', False)
+        filters = {name: attrs.pop(name) for name in ('category', 'badge', 'ids') if attrs.get(name)}
+        if not filters and not all_products:
+            raise serializers.ValidationError("Choose a category, badge or ids, or set all_products.")
+
+        starts_at = attrs.get('starts_at') or timezone.now()
+        if attrs.get('ends_at') and attrs['ends_at'] <= starts_at:
+            raise serializers.ValidationError({"ends_at": "Must be after the start."})
+        attrs['filters'] = filters
+        return attrs
+
+    def create(self, validated_data):
+        request = self.context.get('request')
+        return create_campaign(
+            name=validated_data['name'],
+            discount_percent=validated_data['discount_percent'],
+            filters=validated_data['filters'],
+            starts_at=validated_data.get('starts_at'),
+            ends_at=validated_data.get('ends_at'),
+            user=request.user if request else None,
+        )
@@ -21,9 +21,13 @@ urlpatterns = [
             [
                 path("dashboard/", DashboardAPIView.as_view()),
                 path("products/", ProductAPIView.as_view()),
+                path("products/reprice/", RepriceProductsAPIView.as_view()),
+                path("price-campaigns/", PriceCampaignListView.as_view()),
+                path("price-campaigns/<int:pk>/revert/", RevertPriceCampaignAPIView.as_view()),
                 path("orders/", OrderListView.as_view()),
                 path('update-order/', UpdateOrderTrackingAPIView.as_view()),
                 path('customers/', UserOrderListView.as_view()),
+                path('export/<str:dataset>/', ExportAPIView.as_view()),
                 
             ]
         )
@@ -2,7 +2,7 @@ from django.contrib.auth.hashers import make_password
 from django.core.mail import send_mail
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.http import HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
 from datetime import datetime
 from django.db.models import Q
@@ -12,6 +12,7 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_decode
 import textwrap
 from urllib.parse import urlencode
+from tablib.exceptions import UnsupportedFormat
 
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
@@ -19,11 +20,14 @@ from rest_framework.response import Response
 from rest_framework import status, generics
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 
-from aso.models import OrderTracking, Product
+from aso.models import OrderTracking, PriceCampaign, Product
+from aso.repricing import cancel_campaign, revert_campaign
+from aso.search import search_products
 from aso.serializers import OrderSerializer
 from utils.magic_link import generate_magic_token, validate_magic_token
 
 
+from .exports import DATASETS, FORMATS
 from .models import User, UserVerification
 from .swagger import TaggedAutoSchema
 from .serializers import *
@@ -459,11 +463,7 @@ class ProductAPIView(generics.ListAPIView):
         if category:
             queryset = queryset.filter(category__name__icontains=category)
         if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(product_number__icontains=search) |
-                Q(category__name__icontains=search)
-            )
+            queryset = search_products(queryset, search)
 
         return queryset
 
@@ -554,3 +554,103 @@ class UserOrderListView(generics.ListAPIView):
         if queryset is None:
             queryset = queryset.filter(id=search)
         return queryset.distinct()
+    
+    
+    
+class ExportAPIView(APIView):
+    """
+    Download products, orders (one row per line item) or customers as
+    ?file_format=csv (default), ndjson or xlsx.
+    """
+    permission_classes = [IsAuthenticated]
+    swagger_schema = TaggedAutoSchema
+
+    def get(self, request, dataset):
+        admin = self.request.user
+
+        # Only allow if user is an admin
+        if not admin.groups.filter(name__iexact='admin').exists():
+            return Response({"error": "Not authorized"}, status=401)
+
+        if dataset not in DATASETS:
+            return Response({"error": f"Unknown export '{dataset}'"}, status=status.HTTP_404_NOT_FOUND)
+        file_format = request.query_params.get('file_format', 'csv')
+        if file_format not in FORMATS:
+            return Response(
+                {"error": f"file_format must be one of {', '.join(FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        content_type, render = FORMATS[file_format]
+        headers, rows = DATASETS[dataset]()
+        if file_format == 'xlsx':
+            try:
+                response = HttpResponse(render(headers, rows), content_type=content_type)
+            except UnsupportedFormat as exc:
+                return Response({"error": str(exc)}, status=status.HTTP_501_NOT_IMPLEMENTED)
+        else:
+            response = StreamingHttpResponse(render(headers, rows), content_type=content_type)
+
+        filename = f"{dataset}-{timezone.now():%Y%m%d-%H%M%S}.{file_format}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    
+    
+class RepriceProductsAPIView(generics.GenericAPIView):
+    """
+    Discount a product selection with one UPDATE, now or from starts_at,
+    and revert it at ends_at (python manage.py run_price_campaigns).
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = PriceCampaignSerializer
+    swagger_schema = TaggedAutoSchema
+
+    def post(self, request, *args, **kwargs):
+        admin = self.request.user
+
+        # Only allow if user is an admin
+        if not admin.groups.filter(name__iexact='admin').exists():
+            return Response({"error": "Not authorized"}, status=401)
+
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        campaign = serializer.save()
+        return Response(self.get_serializer(campaign).data, status=status.HTTP_201_CREATED)
+
+
+class PriceCampaignListView(generics.ListAPIView):
+    permission_classes = [IsAuthenticated]
+    serializer_class = PriceCampaignSerializer
+    swagger_schema = TaggedAutoSchema
+    queryset = PriceCampaign.objects.all()
+
+    def get_queryset(self):
+        admin = self.request.user
+
+        # Only allow if user is an admin
+        if not admin.groups.filter(name__iexact='admin').exists():
+            return PriceCampaign.objects.none()
+        return super().get_queryset()
+
+
+class RevertPriceCampaignAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+    swagger_schema = TaggedAutoSchema
+
+    def post(self, request, pk):
+        admin = self.request.user
+
+        # Only allow if user is an admin
+        if not admin.groups.filter(name__iexact='admin').exists():
+            return Response({"error": "Not authorized"}, status=401)
+
+        campaign = get_object_or_404(PriceCampaign, pk=pk)
+        # A campaign that hasn't started is simply cancelled
+        if not cancel_campaign(campaign):
+            if campaign.status != 'active':
+                return Response(
+                    {"error": f"A {campaign.status} campaign can't be reverted"}, status=status.HTTP_400_BAD_REQUEST
+                )
+            revert_campaign(campaign)
+        campaign.refresh_from_db()
+        return Response(PriceCampaignSerializer(campaign).data, status=status.HTTP_200_OK)
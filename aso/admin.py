@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Cart, CartItem, Order, OrderFeedBack, OrderItem, OrderReturn, OrderTracking, PaymentDetail, Product, ProductColor, ProductSize, ProductDetail, ProductImage, Category, ShippingAddress, WatchList
+from .models import Cart, CartItem, Order, OrderFeedBack, OrderItem, OrderReturn, OrderTracking, PaymentDetail, Product, ProductColor, ProductSize, ProductDetail, ProductImage, Category, Promotion, ShippingAddress, WatchList
 
 class ProductColorInline(admin.TabularInline):
     model = ProductColor
@@ -88,4 +88,12 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 admin.site.register(WatchList)
-admin.site.register(Category)
\ No newline at end of file
+admin.site.register(Category)
+
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'is_active', 'starts_at', 'ends_at')
+    list_filter = ('kind', 'is_active')
+    search_fields = ('name',)
+    filter_horizontal = ('products', 'categories')
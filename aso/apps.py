@@ -7,3 +7,7 @@ class AsoConfig(AppConfig):
     
     def ready(self):
         import aso.signals
+        from django.db.models.signals import post_migrate
+        from aso.related import seed_related_products
+
+        post_migrate.connect(seed_related_products, sender=self)
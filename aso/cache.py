@@ -0,0 +1,199 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+# Shared versions
+#
+# Counters in the CacheVersion table, bumped in the same transaction as the
+# change they announce (by the signals in aso/signals.py and the bulk
+# paths). Every worker process reads the same row, so one bump invalidates
+# the response cache, facet cache and ETags of all of them; the Django
+# cache is per process unless CACHES says otherwise, so it can't hold them.
+
+CATALOG = "catalog"
+PROMOTIONS = "promotions"
+VERSIONS = (CATALOG, PROMOTIONS)
+
+
+def _fresh_version():
+    # Seeded from the clock so a recreated row never reuses an old number
+    return int(time.time() * 1000)
+
+
+def read_versions(request=None):
+    """
+    ``{name: (version, changed_at)}`` of every counter, in one query read
+    once per ``request``. Missing rows are created on first use.
+    """
+    from .models import CacheVersion
+
+    versions = getattr(request, "_versions", None)
+    if versions is not None:
+        return versions
+
+    rows = CacheVersion.objects.values_list("name", "version", "changed_at")
+    versions = {name: (version, changed_at) for name, version, changed_at in rows}
+    missing = [name for name in VERSIONS if name not in versions]
+    if missing:
+        now = timezone.now()
+        CacheVersion.objects.bulk_create(
+            [CacheVersion(name=name, version=_fresh_version(), changed_at=now) for name in missing],
+            ignore_conflicts=True,
+        )
+        versions = {name: (version, changed_at) for name, version, changed_at in rows.all()}
+    if request is not None:
+        request._versions = versions
+    return versions
+
+
+def read_version(name, request=None):
+    """``(version, changed_at)`` of the ``name`` counter."""
+    return read_versions(request)[name]
+
+
+def bump_version(name):
+    """
+    Move the ``name`` counter on. Called inside the writing transaction, so
+    the new version becomes visible together with the rows it describes.
+    """
+    from .models import CacheVersion
+
+    if not CacheVersion.objects.filter(pk=name).update(version=F("version") + 1, changed_at=timezone.now()):
+        read_version(name)
+
+
+def catalog_stamp(request=None):
+    """``(version, changed_at)`` of the catalog."""
+    return read_version(CATALOG, request)
+
+
+def catalog_version(request=None):
+    return catalog_stamp(request)[0]
+
+
+def catalog_changed_at(request=None):
+    return catalog_stamp(request)[1]
+
+
+def bump_catalog_version():
+    bump_version(CATALOG)
+
+
+# Response cache
+
+class ResponseCache:
+    """
+    In-process LRU of rendered responses, bounded by total body size. Entries
+    belong to one catalog version; the first lookup under a newer version
+    drops them all.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._entries.clear()
+            self._size = 0
+            self._version = version
+
+    def get(self, version, key):
+        with self._lock:
+            self._check_version(version)
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def set(self, version, key, content):
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = content
+            self._size += len(content)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "version": self._version,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+catalog_response_cache = ResponseCache(settings.CATALOG_RESPONSE_CACHE_MAX_BYTES)
+
+
+def request_cache_key(request):
+    params = sorted((name, sorted(values)) for name, values in request.query_params.lists())
+    return request.path, tuple((name, tuple(values)) for name, values in params)
+
+
+def anonymous_catalog_cache(view_method):
+    """
+    Cache the rendered JSON of a catalog GET handler for anonymous shoppers,
+    keyed by path, normalized query string and catalog version. Signed-in
+    users get per-user fields (watchlisted) and always go to the view.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != "GET" or request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+
+        # Read the version first: if the catalog changes while the view
+        # runs, what we store is already stale and will never be served.
+        version = catalog_version(request)
+        key = request_cache_key(request)
+        content = catalog_response_cache.get(version, key)
+        cache_status = "HIT"
+
+        if content is None:
+            response = view_method(self, request, *args, **kwargs)
+            if not isinstance(response, Response) or response.status_code != 200:
+                return response
+            content = JSONRenderer().render(response.data)
+            catalog_response_cache.set(version, key, content)
+            cache_status = "MISS"
+
+        response = HttpResponse(content, content_type="application/json")
+        response["X-Cache"] = cache_status
+        return response
+
+    return wrapper
@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .counters import cart_items_changed, deferred_user_counters
+from .models import Cart, CartItem, Product
+
+# Batched cart edits.
+#
+# A list of operations (the same edits add-to-cart/, cart/update-quantity/,
+# cart/update-desc/, cart/remove-item/ and cart/update-state/ make one at a
+# time) is applied in order to an in-memory copy of the cart, then written
+# with one DELETE, one bulk_create, one bulk_update and one cart UPDATE, all
+# in one transaction. Any invalid operation rolls the whole batch back.
+
+
+class CartBatchError(ValueError):
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+
+def plan_cart_operations(cart, items, operations):
+    """
+    Apply validated ``operations`` (see CartOperationSerializer) in memory
+    to ``cart`` and its ``items`` (``{id: CartItem}``, changed in place).
+    Returns the CartItems to create and the ids of the items changed and
+    removed; raises CartBatchError for the first operation that can't be
+    applied. Shared by the database and Redis cart stores.
+    """
+    by_product = {item.product_id: item for item in items.values()}
+
+    wanted = {op["product_id"] for op in operations if op["op"] == "add"}
+    known = set(Product.objects.filter(id__in=wanted).values_list("id", flat=True))
+
+    new, changed, removed = {}, set(), set()
+    for index, op in enumerate(operations):
+        kind = op["op"]
+        if kind == "set_state":
+            cart.state = op["state"]
+        elif kind == "add":
+            if op["product_id"] not in known:
+                raise CartBatchError(index, "Product not found.")
+            item = by_product.get(op["product_id"]) or new.get(op["product_id"])
+            if item is None:
+                new[op["product_id"]] = CartItem(
+                    cart=cart,
+                    product_id=op["product_id"],
+                    quantity=op.get("quantity") or 1,
+                    desc=op.get("desc") or {},
+                )
+                continue
+            # Already in the cart: same as add-to-cart/, update it
+            if op.get("quantity") is not None:
+                item.quantity = op["quantity"]
+            if op.get("desc"):
+                item.desc = op["desc"]
+            if item.id is not None:
+                changed.add(item.id)
+        else:
+            item = items.get(op["item_id"])
+            if item is None or item.id in removed:
+                raise CartBatchError(index, "Item not found.")
+            if kind == "remove":
+                removed.add(item.id)
+                changed.discard(item.id)
+                del by_product[item.product_id]
+                continue
+            if kind == "update_quantity":
+                item.quantity = op["quantity"]
+            else:
+                item.desc = op["desc"]
+            changed.add(item.id)
+
+    return list(new.values()), changed, removed
+
+
+def apply_cart_operations(cart, operations):
+    """
+    Apply validated ``operations`` to ``cart`` in the database; returns
+    ``{"added", "updated", "removed"}`` counts. Raises CartBatchError for
+    the first operation that can't be applied.
+    """
+    # deferred_user_counters() is also the batch's transaction
+    with deferred_user_counters():
+        items = {item.id: item for item in cart.items.all()}
+        new, changed, removed = plan_cart_operations(cart, items, operations)
+
+        if removed:
+            CartItem.objects.filter(cart=cart, id__in=removed).delete()
+        if new:
+            # bulk_create skips the signals the header counter follows
+            CartItem.objects.bulk_create(new)
+            cart_items_changed(cart.id, len(new))
+        if changed:
+            CartItem.objects.bulk_update([items[item_id] for item_id in changed], ["quantity", "desc"])
+        # Also moves updated_at, which the cart ETag is built from
+        cart.save(update_fields=["state", "updated_at"])
+
+    return {"added": len(new), "updated": len(changed), "removed": len(removed)}
+
+
+def merge_into_cart(user, quantities):
+    """
+    Add the products of ``quantities`` (``{product_id: quantity}``) that
+    aren't in ``user``'s cart yet; products already there are left as they
+    are. Returns the number of items added.
+
+    One read of the cart's product ids and one multi-row INSERT, whatever
+    the number of products. The cart row is locked first, so two merges
+    into the same cart can't both count a product as added.
+    """
+    with transaction.atomic():
+        cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+        existing = set(cart.items.values_list("product_id", flat=True))
+        missing = [
+            CartItem(cart=cart, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+            if product_id not in existing
+        ]
+        if not missing:
+            return 0
+
+        CartItem.objects.bulk_create(missing, ignore_conflicts=True)
+        # bulk_create skips the signals that touch the cart and the header counter
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        cart_items_changed(cart.id, len(missing))
+    return len(missing)
@@ -0,0 +1,81 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from .deliveryFee import DELIVERY_FEES
+from .promotions import PromotionResult, promotion_index
+
+# Cart pricing.
+#
+# A CartPricing is everything a cart costs, worked out once from a single
+# items query (products and their cards joined in). The cart page and
+# checkout read their figures from the same snapshot instead of calling
+# Cart.subtotal()/total() repeatedly, each of which used to re-run the items
+# query and load every product separately.
+
+
+@dataclass(frozen=True)
+class PricedLine:
+    item: object  # CartItem, with item.product loaded
+    unit_price: Decimal
+    quantity: int
+
+    @property
+    def subtotal(self):
+        return self.unit_price * self.quantity
+
+
+@dataclass
+class CartPricing:
+    lines: list = field(default_factory=list)
+    subtotal: Decimal = Decimal("0")
+    shipping: Decimal = Decimal("0")
+    promotions: PromotionResult = field(default_factory=PromotionResult)
+
+    @property
+    def items(self):
+        return [line.item for line in self.lines]
+
+    @property
+    def discount(self):
+        return self.promotions.discount
+
+    @property
+    def total(self):
+        return self.subtotal + self.shipping - self.discount
+
+
+def detail_items(cart):
+    """
+    The cart's items with everything CartItemSerializer renders: product
+    and card joined in, colors and sizes prefetched: three queries,
+    whatever the number of items.
+    """
+    return (
+        cart.items.select_related("product__card")
+        .prefetch_related("product__colors", "product__sizes")
+        .order_by("id")
+    )
+
+
+def price_cart(cart, items=None):
+    """
+    Price ``cart`` with one query. ``items`` may be an already-built
+    queryset of its CartItems (e.g. with extra prefetches); it must
+    select_related('product__card').
+    """
+    if items is None:
+        items = cart.items.select_related("product__card").order_by("id")
+
+    lines = [PricedLine(item=item, unit_price=item.product.current_price, quantity=item.quantity) for item in items]
+    subtotal = sum((line.subtotal for line in lines), Decimal("0"))
+    shipping = Decimal(DELIVERY_FEES.get(cart.state, 0))
+
+    # The product card carries the category ids, so no M2M join is needed
+    promotion_lines = []
+    for line in lines:
+        card = getattr(line.item.product, "card", None)
+        promotion_lines.append(
+            (line.item.product_id, card.category_ids if card else [], line.unit_price, line.quantity)
+        )
+    promotions = promotion_index().evaluate(promotion_lines, cart.state, subtotal, shipping)
+    return CartPricing(lines=lines, subtotal=subtotal, shipping=shipping, promotions=promotions)
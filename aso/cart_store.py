@@ -0,0 +1,264 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+from django.test.signals import setting_changed
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cart_batch import apply_cart_operations, merge_into_cart, plan_cart_operations
+from .cart_pricing import detail_items, price_cart
+from .counters import deferred_user_counters, user_counters
+from .models import Cart, CartItem, Product
+
+# Cart storage.
+#
+# The cart views talk to a cart store rather than to Cart/CartItem
+# directly, so carts can live outside the primary database. Every edit is a
+# list of cart/batch/ operations (aso/cart_batch.py), so both backends
+# share the same rules for what an edit does. settings.CART_STORE picks
+# the backend:
+#
+# - ORMCartStore keeps carts in the Cart and CartItem tables.
+# - RedisCartStore keeps each cart in two Redis hashes that expire when the
+#   cart is left alone, so browsing never writes to the database. The cart
+#   only reaches the database as the Order created at checkout.
+
+
+class BaseCartStore:
+    def priced(self, user, detail=False):
+        """
+        ``(cart, CartPricing)`` for ``user``'s cart, which is created if
+        needed. ``detail`` also loads what the cart page renders.
+        """
+        raise NotImplementedError
+
+    def checkout_cart(self, user):
+        """``(cart, CartPricing)``, or None if ``user`` has no cart."""
+        raise NotImplementedError
+
+    def apply(self, user, operations):
+        """
+        Apply cart/batch/ ``operations`` atomically; returns
+        ``{"added", "updated", "removed"}``. Raises CartBatchError.
+        """
+        raise NotImplementedError
+
+    def merge(self, user, quantities):
+        """Add the products of ``{product_id: quantity}`` not in the cart yet; returns how many."""
+        raise NotImplementedError
+
+    def stamp(self, user):
+        """``(id, updated_at, state)`` for the cart ETag, or None if there is no cart."""
+        raise NotImplementedError
+
+    def header_counts(self, user):
+        """``{"item_count", "watchlist_count"}`` for the header badge."""
+        raise NotImplementedError
+
+    def clear(self, user):
+        """Empty ``user``'s cart once the current transaction commits."""
+        raise NotImplementedError
+
+
+class ORMCartStore(BaseCartStore):
+    def priced(self, user, detail=False):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        return cart, price_cart(cart, detail_items(cart) if detail else None)
+
+    def checkout_cart(self, user):
+        cart = Cart.objects.filter(user=user).first()
+        if cart is None:
+            return None
+        return cart, price_cart(cart)
+
+    def apply(self, user, operations):
+        # Locked like merge_into_cart, so concurrent batches plan against the same items
+        with transaction.atomic():
+            cart, _ = Cart.objects.select_for_update().get_or_create(user=user)
+            return apply_cart_operations(cart, operations)
+
+    def merge(self, user, quantities):
+        return merge_into_cart(user, quantities)
+
+    def stamp(self, user):
+        return Cart.objects.filter(user=user).values_list("id", "updated_at", "state").first()
+
+    def header_counts(self, user):
+        return user_counters(user.id)
+
+    def clear(self, user):
+        with deferred_user_counters():
+            CartItem.objects.filter(cart__user=user).delete()
+            Cart.objects.filter(user=user).delete()
+
+
+class RedisCartStore(BaseCartStore):
+    """
+    ``cart:<user id>`` holds the cart's state, updated_at and the last item
+    id handed out; ``cart:<user id>:items`` maps item ids to
+    ``{"product_id", "quantity", "desc"}`` JSON. Edits read both under
+    WATCH and write them back in one MULTI, retrying if another request
+    changed the cart in between. Carts have no database id, so the cart
+    page shows ``"id": null``.
+    """
+
+    def __init__(self, client=None, ttl=None):
+        self._client = client
+        self.ttl = ttl or settings.CART_REDIS_TTL
+
+    @property
+    def client(self):
+        if self._client is None:
+            import redis
+
+            self._client = redis.Redis.from_url(settings.CART_REDIS_URL, decode_responses=True)
+        return self._client
+
+    def _keys(self, user):
+        key = f"cart:{user.pk}"
+        return key, f"{key}:items"
+
+    def _read(self, client, user):
+        """The stored cart as an unsaved Cart, its ``{id: CartItem}`` and last item id."""
+        meta_key, items_key = self._keys(user)
+        meta, stored = client.hgetall(meta_key), client.hgetall(items_key)
+        if not meta:
+            return None, {}, 0
+
+        cart = Cart(user=user, state=meta.get("state") or None)
+        if meta.get("updated_at"):
+            cart.updated_at = datetime.fromisoformat(meta["updated_at"])
+        items = {}
+        for item_id, value in stored.items():
+            value = json.loads(value)
+            items[int(item_id)] = CartItem(
+                id=int(item_id), cart=cart, product_id=value["product_id"],
+                quantity=value["quantity"], desc=value.get("desc"),
+            )
+        return cart, items, int(meta.get("last_item_id") or 0)
+
+    def _write(self, pipe, user, cart, items, last_item_id):
+        meta_key, items_key = self._keys(user)
+        pipe.hset(meta_key, mapping={
+            "state": cart.state or "",
+            "updated_at": timezone.now().isoformat(),
+            "last_item_id": last_item_id,
+        })
+        pipe.delete(items_key)
+        if items:
+            pipe.hset(items_key, mapping={
+                item.id: json.dumps({"product_id": item.product_id, "quantity": item.quantity, "desc": item.desc})
+                for item in items.values()
+            })
+            pipe.expire(items_key, self.ttl)
+        pipe.expire(meta_key, self.ttl)
+
+    def _edit(self, user, change):
+        """
+        Run ``change(cart, items)``, which returns ``(result, new_items)``
+        after changing the cart and items in place, and store the outcome.
+        """
+        from redis import WatchError
+
+        with self.client.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(*self._keys(user))
+                    cart, items, last_item_id = self._read(pipe, user)
+                    if cart is None:
+                        cart = Cart(user=user)
+                    result, new = change(cart, items)
+                    for item in new:
+                        last_item_id += 1
+                        item.id = last_item_id
+                        items[item.id] = item
+                    pipe.multi()
+                    self._write(pipe, user, cart, items, last_item_id)
+                    pipe.execute()
+                    return result
+                except WatchError:
+                    continue
+
+    def _price(self, cart, items, detail):
+        products = Product.objects.select_related("card")
+        if detail:
+            products = products.prefetch_related("colors", "sizes")
+        products = products.in_bulk({item.product_id for item in items.values()})
+
+        lines = []
+        for item_id in sorted(items):
+            item = items[item_id]
+            # Deleted products drop out, as CartItem rows cascade away
+            if item.product_id in products:
+                item.product = products[item.product_id]
+                lines.append(item)
+        return price_cart(cart, lines)
+
+    def priced(self, user, detail=False):
+        cart, items, _ = self._read(self.client, user)
+        if cart is None:
+            cart = Cart(user=user)
+        return cart, self._price(cart, items, detail)
+
+    def checkout_cart(self, user):
+        cart, items, _ = self._read(self.client, user)
+        if cart is None:
+            return None
+        return cart, self._price(cart, items, detail=False)
+
+    def apply(self, user, operations):
+        def change(cart, items):
+            new, changed, removed = plan_cart_operations(cart, items, operations)
+            for item_id in removed:
+                del items[item_id]
+            return {"added": len(new), "updated": len(changed), "removed": len(removed)}, new
+
+        return self._edit(user, change)
+
+    def merge(self, user, quantities):
+        def change(cart, items):
+            existing = {item.product_id for item in items.values()}
+            known = set(Product.objects.filter(id__in=quantities.keys() - existing).values_list("id", flat=True))
+            new = [
+                CartItem(cart=cart, product_id=product_id, quantity=quantity, desc={})
+                for product_id, quantity in quantities.items()
+                if product_id in known
+            ]
+            return len(new), new
+
+        return self._edit(user, change)
+
+    def stamp(self, user):
+        updated_at, state = self.client.hmget(self._keys(user)[0], "updated_at", "state")
+        if updated_at is None:
+            return None
+        return None, datetime.fromisoformat(updated_at), state or None
+
+    def header_counts(self, user):
+        # The watchlist is still counted in the database
+        return {**user_counters(user.id), "item_count": self.client.hlen(self._keys(user)[1])}
+
+    def clear(self, user):
+        # Redis isn't part of the transaction: keep the cart if the order rolls back
+        transaction.on_commit(lambda: self.client.delete(*self._keys(user)))
+
+
+_store = None
+
+
+def cart_store():
+    """The configured store, created on first use."""
+    global _store
+    if _store is None:
+        _store = import_string(settings.CART_STORE)()
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_cart_store(setting, **kwargs):
+    global _store
+    if setting in ("CART_STORE", "CART_REDIS_URL", "CART_REDIS_TTL"):
+        _store = None
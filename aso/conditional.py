@@ -0,0 +1,120 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .cache import catalog_changed_at, catalog_version
+from .deliveryFee import delivery_fees
+from .cart_store import cart_store
+from .models import Order, Product, WatchList
+from .promotions import promotion_index
+
+# Validators for conditional GET (If-None-Match / If-Modified-Since).
+#
+# Each function works from counters and timestamps only, never from the
+# response body, so a matching request is answered with 304 before any
+# serialization happens.
+
+
+def _etag(*parts):
+    return hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+
+
+def _watchlist_stamp(user):
+    stamp = WatchList.objects.filter(user=user).aggregate(count=Count("id"), last=Max("id"))
+    return user.id, stamp["count"], stamp["last"]
+
+
+def catalog_etag(request, *args, **kwargs):
+    parts = [catalog_version(request)]
+    if request.user.is_authenticated:
+        # Signed-in shoppers also see their own watchlisted flags
+        parts.append(_watchlist_stamp(request.user))
+    return _etag(*parts)
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    if request.user.is_authenticated:
+        # Watchlist removals leave no timestamp behind; rely on the ETag
+        return None
+    return catalog_changed_at(request)
+
+
+def product_displayed(request, product_id):
+    """
+    Whether ``product_id`` is a displayed product; one query per request,
+    shared by the product validators and ProductDetailView.
+    """
+    if not hasattr(request, "_product_displayed"):
+        request._product_displayed = Product.objects.filter(pk=product_id, display_product=True).exists()
+    return request._product_displayed
+
+
+def product_etag(request, id=None, *args, **kwargs):
+    # No validator for a missing or hidden product, so the view's 404 runs
+    if not product_displayed(request, id):
+        return None
+    return _etag(id, catalog_etag(request))
+
+
+def product_last_modified(request, id=None, *args, **kwargs):
+    if not product_displayed(request, id):
+        return None
+    return catalog_last_modified(request)
+
+
+DELIVERY_FEES_ETAG = _etag(delivery_fees)
+
+
+def delivery_fees_etag(request, *args, **kwargs):
+    return DELIVERY_FEES_ETAG
+
+
+def order_etag(request, pk=None, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+
+    stamp = (
+        Order.objects.filter(pk=pk, user=request.user)
+        .annotate(tracking_count=Count("tracking_events"), last_tracking=Max("tracking_events__id"))
+        .values_list(
+            "total", "carrier", "other_info", "delivery_date", "estimated_delivery_date",
+            "tracking_count", "last_tracking",
+        )
+        .first()
+    )
+    if stamp is None:
+        return None
+    # Line items show the product title and image
+    return _etag(pk, stamp, catalog_version(request))
+
+
+def _cart_stamp(request):
+    if not request.user.is_authenticated:
+        return None
+    # Shared by the ETag and Last-Modified functions of the same request
+    if not hasattr(request, "_cart_stamp"):
+        request._cart_stamp = cart_store().stamp(request.user)
+    return request._cart_stamp
+
+
+def cart_etag(request, *args, **kwargs):
+    stamp = _cart_stamp(request)
+    if stamp is None:
+        return None
+    # Item prices come from the catalog, the discount from the live promotions
+    index = promotion_index(request)
+    return _etag(stamp, catalog_version(request), index.version, index.rule_ids)
+
+
+def cart_last_modified(request, *args, **kwargs):
+    stamp = _cart_stamp(request)
+    if stamp is None:
+        return None
+    return max(stamp[1], catalog_changed_at(request), promotion_index(request).built_at)
+
+
+def conditional(etag_func=None, last_modified_func=None):
+    """``django.views.decorators.http.condition`` for view methods."""
+    return method_decorator(condition(etag_func=etag_func, last_modified_func=last_modified_func))
@@ -0,0 +1,181 @@
+import atexit
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounter:
+    """
+    Buffers product page views in memory and adds them to
+    ``Product.reviews_count`` (and the matching ``ProductCard``) every
+    ``interval`` seconds with one ``UPDATE ... SET reviews_count =
+    reviews_count + CASE id WHEN ... END`` per table.
+
+    Recording a view never touches the database, so the detail page stays a
+    pure read. A crash loses at most one interval of counts.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def record(self, product_id, count=1):
+        with self._lock:
+            self._pending[product_id] += count
+            if self._timer is None and self.interval > 0:
+                self._timer = threading.Timer(self.interval, self._flush_in_background)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self):
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write the buffered counts; returns the number of products updated."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return 0
+
+        from .models import Product
+
+        increment = Case(
+            *[When(pk=product_id, then=Value(count)) for product_id, count in pending.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+        try:
+            with transaction.atomic():
+                # Also copied to the cards by the product queryset's update()
+                updated = Product.objects.filter(pk__in=pending, display_product=True).update(
+                    reviews_count=F('reviews_count') + increment
+                )
+        except Exception:
+            # Put the counts back so the next interval retries them
+            with self._lock:
+                self._pending.update(pending)
+            raise
+        return updated
+
+    def _flush_in_background(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing product view counts failed")
+        finally:
+            connections.close_all()
+
+
+product_views = ViewCounter(settings.PRODUCT_VIEW_FLUSH_INTERVAL)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        product_views.flush()
+    except Exception:
+        logger.exception("Flushing product view counts at exit failed")
+
+
+# Header badge counters
+#
+# UserCounter rows move by one with every CartItem/WatchList insert or
+# delete, in the same transaction as the row itself (see aso/signals.py).
+# Bulk paths run inside deferred_user_counters(): the signals only note
+# which users changed, and their counters are recounted with one UPDATE at
+# the end instead of one per row. A cart item's user is looked up while the
+# item's signal runs, as the cart itself may be gone by the end (checkout
+# deletes it).
+
+_deferred = threading.local()
+
+
+def _count(queryset, user_field):
+    counts = queryset.filter(**{user_field: OuterRef("user_id")}).order_by().values(user_field)
+    return Coalesce(Subquery(counts.annotate(count=Count("id")).values("count")), Value(0))
+
+
+def recount_user_counters(user_ids, using="default"):
+    """Set the counters of the given users from real counts."""
+    from .models import CartItem, UserCounter, WatchList
+
+    return UserCounter.objects.using(using).filter(user_id__in=user_ids).update(
+        item_count=_count(CartItem.objects.all(), "cart__user"),
+        watchlist_count=_count(WatchList.objects.all(), "user"),
+    )
+
+
+@contextmanager
+def deferred_user_counters(using="default"):
+    """Recount the touched counters once, at the end of an atomic block."""
+    if getattr(_deferred, "changes", None) is not None:
+        # Already deferring: the outermost block recounts
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # "carts" maps each touched cart to its user
+    _deferred.changes = changes = {"users": set(), "carts": {}}
+    try:
+        with transaction.atomic(using=using):
+            yield
+            _deferred.changes = None
+            user_ids = changes["users"] | {user_id for user_id in changes["carts"].values() if user_id is not None}
+            if user_ids:
+                recount_user_counters(user_ids, using=using)
+    finally:
+        _deferred.changes = None
+
+
+def cart_items_changed(cart_id, delta, using="default"):
+    from .models import Cart, UserCounter
+
+    changes = getattr(_deferred, "changes", None)
+    if changes is not None:
+        if cart_id not in changes["carts"]:
+            changes["carts"][cart_id] = (
+                Cart.objects.using(using).filter(pk=cart_id).values_list("user_id", flat=True).first()
+            )
+        return
+    # A missing row is created with real counts when it is first read
+    UserCounter.objects.using(using).filter(user__cart=cart_id).update(item_count=F("item_count") + delta)
+
+
+def watchlist_changed(user_id, delta, using="default"):
+    from .models import UserCounter
+
+    changes = getattr(_deferred, "changes", None)
+    if changes is not None:
+        changes["users"].add(user_id)
+        return
+    UserCounter.objects.using(using).filter(pk=user_id).update(watchlist_count=F("watchlist_count") + delta)
+
+
+def user_counters(user_id):
+    """``{"item_count", "watchlist_count"}`` for the header badge."""
+    from .models import CartItem, UserCounter, WatchList
+
+    counts = UserCounter.objects.filter(pk=user_id).values("item_count", "watchlist_count").first()
+    if counts is None:
+        counter, _ = UserCounter.objects.get_or_create(
+            user_id=user_id,
+            defaults={
+                "item_count": CartItem.objects.filter(cart__user=user_id).count(),
+                "watchlist_count": WatchList.objects.filter(user=user_id).count(),
+            },
+        )
+        counts = {"item_count": counter.item_count, "watchlist_count": counter.watchlist_count}
+    return counts
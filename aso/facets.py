@@ -0,0 +1,144 @@
+import hashlib
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, IntegerField, Value, When
+from rest_framework import serializers
+
+from .cache import catalog_version
+from .models import Product, ProductCard
+from .search import search_products
+
+# Query parameters that narrow the catalog, in the order they are applied.
+CATALOG_FILTERS = ("category", "badge", "min_price", "max_price", "rating", "search")
+
+# Which filters each facet ignores when counting, so the sidebar still shows
+# the alternatives to the value currently selected.
+FACET_FILTERS = {
+    "category": ("category",),
+    "badge": ("badge",),
+    "price": ("min_price", "max_price"),
+    "rating": ("rating",),
+}
+
+
+# Filters compared with numeric columns
+NUMERIC_FILTERS = ("min_price", "max_price", "rating")
+
+
+def normalize_filters(params):
+    """
+    The catalog filters set in ``params``, numbers parsed as Decimal.
+    Raises ValidationError (a 400) for a filter that isn't a number.
+    """
+    filters = {}
+    for name in CATALOG_FILTERS:
+        value = (params.get(name) or "").strip()
+        if not value:
+            continue
+        if name in NUMERIC_FILTERS:
+            try:
+                value = Decimal(value)
+            except InvalidOperation:
+                value = None
+            if value is None or not value.is_finite():
+                raise serializers.ValidationError({name: "A valid number is required."})
+        filters[name] = value
+    return filters
+
+
+def filter_cards(queryset, filters, skip=()):
+    """Apply the ProductListView filters to a ProductCard queryset."""
+    filters = {name: value for name, value in filters.items() if name not in skip}
+
+    if "min_price" in filters:
+        queryset = queryset.filter(current_price__gte=filters["min_price"])
+    if "max_price" in filters:
+        queryset = queryset.filter(current_price__lte=filters["max_price"])
+    if "rating" in filters:
+        queryset = queryset.filter(rating=filters["rating"])
+    if "category" in filters:
+        # Delimited on both sides, so "Aso" doesn't match "Aso Oke"
+        queryset = queryset.filter(category_names__icontains="|%s|" % filters["category"])
+    if "badge" in filters:
+        queryset = queryset.filter(badge=filters["badge"])
+    if "search" in filters:
+        queryset = search_products(queryset, filters["search"])
+    return queryset
+
+
+def price_bands():
+    edges = sorted(settings.CATALOG_PRICE_BANDS)
+    return list(zip([None] + edges, edges + [None]))
+
+
+def _category_facet(cards):
+    through = Product.category.through.objects.filter(product_id__in=cards.order_by().values("pk"))
+    rows = (
+        through.values("category_id", "category__name")
+        .annotate(count=Count("product_id"))
+        .order_by("category__name")
+    )
+    return [{"id": row["category_id"], "name": row["category__name"], "count": row["count"]} for row in rows]
+
+
+def _value_facet(cards, field):
+    rows = cards.order_by().values(field).annotate(count=Count("pk")).order_by(field)
+    return [{"value": row[field], "count": row["count"]} for row in rows]
+
+
+def _price_facet(cards):
+    bands = price_bands()
+    band = Case(
+        *[
+            When(current_price__lt=upper, then=Value(index))
+            for index, (lower, upper) in enumerate(bands)
+            if upper is not None
+        ],
+        default=Value(len(bands) - 1),
+        output_field=IntegerField(),
+    )
+    counts = dict(
+        cards.order_by().annotate(price_band=band).values("price_band")
+        .annotate(count=Count("pk")).values_list("price_band", "count")
+    )
+    return [
+        {"min": lower, "max": upper, "count": counts.get(index, 0)}
+        for index, (lower, upper) in enumerate(bands)
+    ]
+
+
+def compute_facets(filters):
+    cards = ProductCard.objects.filter(display_product=True)
+
+    def narrowed(facet):
+        return filter_cards(cards, filters, skip=FACET_FILTERS[facet])
+
+    return {
+        "total": filter_cards(cards, filters).order_by().count(),
+        "category": _category_facet(narrowed("category")),
+        "badge": _value_facet(narrowed("badge"), "badge"),
+        "price": _price_facet(narrowed("price")),
+        "rating": _value_facet(narrowed("rating"), "rating"),
+    }
+
+
+def facets_cache_key(filters):
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return "catalog:facets:%s:%s" % (catalog_version(), digest)
+
+
+def catalog_facets(params):
+    """
+    Facet counts for the filter set in ``params``, cached per normalized
+    filter set and catalog version.
+    """
+    filters = normalize_filters(params)
+    key = facets_cache_key(filters)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(filters)
+        cache.set(key, facets, settings.CATALOG_FACETS_CACHE_TIMEOUT)
+    return facets
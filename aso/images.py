@@ -0,0 +1,249 @@
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import bump_catalog_version
+from .jobs import claim_jobs, fail_job, finish_job
+from .models import ImageDerivativeJob, Product, ProductImage
+
+logger = logging.getLogger(__name__)
+
+# Resized copies of product photos.
+#
+# Every variant in settings.PRODUCT_IMAGE_VARIANTS is written in each of
+# IMAGE_FORMATS next to the original, e.g. products/main/kente.jpg gets
+# products/main/kente__card.webp and products/main/kente__card.jpg. What was
+# written is recorded on the owning row as
+#
+#     {"source": "products/main/kente.jpg",
+#      "variants": {"card": {"width": 400, "webp": "...", "jpeg": "..."}, ...}}
+#
+# so serializers can build srcset URLs without touching the storage.
+
+IMAGE_FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "jpeg": ("JPEG", ".jpg"),
+}
+
+
+def variant_path(name, variant, image_format):
+    root, _ = os.path.splitext(name)
+    return "%s__%s%s" % (root, variant, IMAGE_FORMATS[image_format][1])
+
+
+def _encode(image, image_format):
+    buffer = BytesIO()
+    pil_format = IMAGE_FORMATS[image_format][0]
+    image.save(buffer, pil_format, quality=settings.PRODUCT_IMAGE_QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def _write(storage, path, content):
+    # Storage.save() would pick "name_abc123.webp" if the file exists
+    if storage.exists(path):
+        storage.delete(path)
+    return storage.save(path, ContentFile(content))
+
+
+def file_digest(name, storage=default_storage):
+    digest = hashlib.sha256()
+    with storage.open(name, "rb") as source:
+        for chunk in iter(lambda: source.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Write every variant of the stored image ``name`` and return the mapping
+    to record on its row. Images narrower than a variant are never upscaled.
+    Runs in the image worker pool, so it touches the storage only.
+    """
+    with storage.open(name, "rb") as source:
+        image = Image.open(source)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    variants = {}
+    for variant, width in sorted(settings.PRODUCT_IMAGE_VARIANTS.items(), key=lambda item: item[1]):
+        resized = image
+        if image.width > width:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+        entry = {"width": resized.width}
+        for image_format in IMAGE_FORMATS:
+            entry[image_format] = _write(
+                storage, variant_path(name, variant, image_format), _encode(resized, image_format)
+            )
+        variants[variant] = entry
+    return {"source": name, "variants": variants}
+
+
+def delete_variants(storage, recorded):
+    for entry in (recorded or {}).get("variants", {}).values():
+        for image_format in IMAGE_FORMATS:
+            path = entry.get(image_format)
+            if path and storage.exists(path):
+                storage.delete(path)
+
+
+def delete_unused_variants(storage, recorded):
+    """
+    Delete the variants in ``recorded`` unless a product or gallery row
+    still shows their source: rows saved with the same photo share them.
+    """
+    source = (recorded or {}).get("source")
+    if not source:
+        return
+    if Product.objects.filter(main_image=source).exists() or ProductImage.objects.filter(image=source).exists():
+        return
+    delete_variants(storage, recorded)
+
+
+def variants_are_current(field_file, recorded):
+    return bool(field_file) and (recorded or {}).get("source") == field_file.name
+
+
+# Queue
+#
+# Saving an image only queues an ImageDerivativeJob for its path, without
+# reading the file. The process_image_jobs worker hashes the file, reuses
+# the variants of an earlier job for the same content or renders them in a
+# process pool, and writes them back to every row using that image.
+
+def enqueue_variants(field_file, recorded):
+    """
+    Return what the row should record for ``field_file`` now: ``recorded``
+    when it is current, the variants last rendered for the same path, or {}
+    (serve the original) while a job is queued.
+    """
+    if variants_are_current(field_file, recorded):
+        return recorded
+
+    if recorded:
+        # After commit, so a rolled back save keeps its variants
+        storage = field_file.storage
+        transaction.on_commit(lambda: delete_unused_variants(storage, recorded))
+    if not field_file:
+        return {}
+
+    # The worker checks the content hash, and re-renders if the file changed
+    job, created = ImageDerivativeJob.objects.get_or_create(path=field_file.name, content_hash="")
+    if not created and job.status in ("done", "failed", "cancelled"):
+        ImageDerivativeJob.objects.filter(pk=job.pk).update(status="pending", attempts=0)
+
+    rendered = (
+        ImageDerivativeJob.objects.filter(path=field_file.name, status="done", result__isnull=False)
+        .exclude(content_hash="")
+        .order_by("-finished_at")
+        .values_list("result", flat=True)
+        .first()
+    )
+    return rendered or {}
+
+
+def hash_queued_jobs(executor, jobs):
+    """
+    Hash the files of the queued ``jobs`` that don't have a content hash yet
+    (on ``executor``). A job whose content was rendered before is recorded
+    from that result and dropped; returns the jobs still to render.
+    """
+    unhashed = {executor.submit(file_digest, job.path): job for job in jobs if not job.content_hash}
+    to_render = [job for job in jobs if job.content_hash]
+    for future in as_completed(unhashed):
+        job = unhashed[future]
+        try:
+            content_hash = future.result()
+        except OSError as exc:
+            fail_job(job, exc, max_attempts=1)
+            continue
+
+        same = ImageDerivativeJob.objects.filter(path=job.path, content_hash=content_hash)
+        rendered = same.filter(status="done", result__isnull=False).first()
+        if rendered is not None:
+            apply_variants(job.path, rendered.result)
+            job.delete()
+            continue
+        if same.filter(status__in=["pending", "running"]).exists():
+            # Already queued under its hash, e.g. by backfill_image_variants
+            job.delete()
+            continue
+        # A failed or cancelled job for the same content is replaced by this one
+        same.delete()
+        ImageDerivativeJob.objects.filter(pk=job.pk).update(content_hash=content_hash)
+        job.content_hash = content_hash
+        to_render.append(job)
+    return to_render
+
+
+def apply_variants(path, variants):
+    """Record ``variants`` on every product, card and gallery row showing ``path``."""
+    with transaction.atomic():
+        # Copied to the product cards by the product queryset's update()
+        Product.objects.filter(main_image=path).update(main_image_variants=variants)
+        ProductImage.objects.filter(image=path).update(variants=variants)
+        bump_catalog_version()
+
+
+def image_worker_pool(processes=None):
+    # Children must not share the parent's database connections
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=processes or settings.IMAGE_WORKER_PROCESSES, initializer=django.setup)
+
+
+def process_image_jobs(executor, batch_size):
+    """
+    Render one batch of queued jobs on ``executor``; returns how many were
+    claimed (0 when the queue is empty).
+    """
+    jobs = claim_jobs(ImageDerivativeJob.objects.all(), batch_size)
+    futures = {executor.submit(generate_variants, job.path): job for job in hash_queued_jobs(executor, jobs)}
+    for future in as_completed(futures):
+        job = futures[future]
+        try:
+            variants = future.result()
+        except (UnidentifiedImageError, Image.DecompressionBombError) as exc:
+            # Retrying won't make the file readable; keep serving the original
+            fail_job(job, exc, max_attempts=1)
+            continue
+        except Exception as exc:
+            logger.warning("Rendering variants of %s failed", job.path, exc_info=True)
+            fail_job(job, exc)
+            continue
+        apply_variants(job.path, variants)
+        finish_job(job, result=variants)
+    return len(jobs)
+
+
+def srcset(request, field_file, recorded):
+    """
+    ``{"webp": "<url> 400w, <url> 900w, ...", "jpeg": ...}`` for the variants
+    of ``field_file``, or None until they exist (clients fall back to the
+    original URL).
+    """
+    if not variants_are_current(field_file, recorded) or not recorded.get("variants"):
+        return None
+
+    storage = field_file.storage
+    entries = sorted(recorded["variants"].values(), key=lambda entry: entry["width"])
+    result = {}
+    for image_format in IMAGE_FORMATS:
+        urls = []
+        for entry in entries:
+            url = storage.url(entry[image_format])
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls.append("%s %sw" % (url, entry["width"]))
+        result[image_format] = ", ".join(urls)
+    return result
@@ -0,0 +1,316 @@
+import codecs
+import json
+import logging
+import re
+import time
+from itertools import islice
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+
+from .cache import bump_catalog_version
+from .jobs import finish_job, heartbeat
+from .models import Category, ImportJob, Product, ProductColor, ProductDetail, ProductSize, discounted_price
+from .numbers import format_number, product_numbers
+from .serializers import ProductImportSerializer
+from .signals import sync_catalog
+
+logger = logging.getLogger(__name__)
+
+# Bulk product import.
+#
+# The whole batch is validated up front, categories are resolved with one
+# IN query, and each chunk of products is written with one bulk_create per
+# table inside its own transaction. bulk_create skips the model signals, so
+# each chunk refreshes the catalog read models and version itself.
+
+
+def validate_products(items, offset=0):
+    """
+    Split ``items`` into ``(index, validated_data)`` rows and per-index
+    errors. ``offset`` is added to the reported indexes.
+    """
+    return validate_indexed(enumerate(items, start=offset))
+
+
+def validate_indexed(pairs):
+    """validate_products() for explicit ``(index, item)`` pairs."""
+    rows, errors = [], []
+    for index, item in pairs:
+        serializer = ProductImportSerializer(data=item)
+        if serializer.is_valid():
+            rows.append((index, serializer.validated_data))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+    return rows, errors
+
+
+def resolve_categories(names):
+    """Map category names to ids, creating the missing ones."""
+    names = set(names)
+    ids = dict(Category.objects.filter(name__in=names).values_list("name", "id"))
+    missing = names - ids.keys()
+    if missing:
+        # Another import may create the same names concurrently
+        Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+        ids.update(Category.objects.filter(name__in=missing).values_list("name", "id"))
+    return ids
+
+
+def _unique(values, key=lambda value: value):
+    # The (product, label) unique constraints would reject repeats
+    seen = set()
+    for value in values:
+        if key(value) not in seen:
+            seen.add(key(value))
+            yield value
+
+
+def insert_products(rows, category_ids):
+    """Write one chunk of validated rows; returns the new product ids."""
+    numbers = product_numbers.take(len(rows))
+    products = Product.objects.bulk_create([
+        Product(
+            product_number=format_number("#AO-P-", number),
+            title=data["title"],
+            description=data["description"],
+            original_price=data["original_price"],
+            discount_percent=data["discount_percent"],
+            current_price=discounted_price(data["original_price"], data["discount_percent"]),
+            rating=data["rating"],
+            display_product=False,
+        )
+        for number, (_, data) in zip(numbers, rows)
+    ])
+
+    memberships, sizes, colors, details = [], [], [], []
+    for product, (_, data) in zip(products, rows):
+        memberships.extend(
+            Product.category.through(product_id=product.id, category_id=category_ids[name])
+            for name in _unique(data["category"])
+        )
+        sizes.extend(ProductSize(product=product, size_label=label) for label in _unique(data["sizes"]))
+        colors.extend(
+            ProductColor(product=product, color_name=color["name"], hex_code=color.get("hex"))
+            for color in _unique(data["colors"], key=lambda color: color["name"])
+        )
+        details.extend(
+            ProductDetail(
+                product=product, tab=detail["tab"], title=detail["tab"].capitalize(), content=detail["content"]
+            )
+            for detail in data["details"]
+        )
+
+    Product.category.through.objects.bulk_create(memberships)
+    ProductSize.objects.bulk_create(sizes)
+    ProductColor.objects.bulk_create(colors)
+    ProductDetail.objects.bulk_create(details)
+
+    product_ids = [product.id for product in products]
+    sync_catalog(product_ids)
+    bump_catalog_version()
+    return product_ids
+
+
+def chunked(rows, chunk_size=None):
+    chunk_size = chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+def import_products(items, chunk_size=None):
+    """
+    Validate ``items`` and create the valid ones, hidden until activated.
+    Returns ``{"products_created": n, "errors": [{"index", "errors"}]}``.
+    """
+    rows, errors = validate_products(items)
+    category_ids = resolve_categories(name for _, data in rows for name in data["category"])
+
+    created = 0
+    for chunk in chunked(rows, chunk_size):
+        with transaction.atomic():
+            created += len(insert_products(chunk, category_ids))
+    return {"products_created": created, "errors": errors}
+
+
+def import_chunk(items, offset=0):
+    """
+    Validate and create one chunk of ``items`` (the caller owns the
+    transaction); returns ``(index, product_id)`` pairs for the created
+    products and the per-index errors.
+    """
+    return import_indexed(enumerate(items, start=offset))
+
+
+def import_indexed(pairs):
+    """import_chunk() for explicit ``(index, item)`` pairs."""
+    rows, errors = validate_indexed(pairs)
+    if not rows:
+        return [], errors
+    category_ids = resolve_categories(name for _, data in rows for name in data["category"])
+    product_ids = insert_products(rows, category_ids)
+    return [(index, product_id) for (index, _), product_id in zip(rows, product_ids)], errors
+
+
+# NDJSON
+#
+# One product per line, read and written a chunk at a time, so memory stays
+# flat however long the upload is. Results go back as NDJSON too: one line
+# per input line, then a summary line.
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+
+
+def _ndjson_chunks(lines, chunk_size):
+    chunk = []
+    for index, line in enumerate(lines):
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as exc:
+            item = exc
+        chunk.append((index, item))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def import_ndjson(lines, chunk_size=None):
+    """
+    Import the products in ``lines`` (one JSON object each), committing every
+    chunk on its own; yields the NDJSON result lines as it goes. Indexes are
+    0-based line numbers; blank lines are skipped.
+    """
+    created = failed = 0
+    try:
+        for chunk in _ndjson_chunks(lines, chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE):
+            parsed = [(index, item) for index, item in chunk if not isinstance(item, ValueError)]
+            results = [
+                {"index": index, "errors": {"line": [f"Invalid JSON: {item}"]}}
+                for index, item in chunk if isinstance(item, ValueError)
+            ]
+            with transaction.atomic():
+                products, errors = import_indexed(parsed)
+            results.extend({"index": index, "id": product_id} for index, product_id in products)
+            results.extend(errors)
+
+            created += len(products)
+            failed += len(chunk) - len(products)
+            for result in sorted(results, key=lambda result: result["index"]):
+                yield json.dumps(result, default=str) + "\n"
+    except DatabaseError as exc:
+        # The 200 status is already sent: end the stream with an error record
+        # instead. The failed chunk was rolled back; earlier ones are kept.
+        logger.exception("NDJSON product import failed")
+        yield json.dumps({
+            "message": "Import failed", "error": str(exc), "products_created": created, "products_failed": failed,
+        }) + "\n"
+        return
+
+    yield json.dumps({"message": "Import finished", "products_created": created, "products_failed": failed}) + "\n"
+
+
+# Import jobs
+#
+# An ImportJob row points at a stored upload. The process_import_jobs worker
+# commits each chunk in the same transaction as the job's progress, so
+# next_index is always exactly where a resumed job has to pick up.
+
+class ImportFileError(ValueError):
+    pass
+
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+
+
+def iter_upload(upload, read_size=64 * 1024):
+    """
+    Yield the items of the JSON list in the binary file ``upload`` one at a
+    time, reading ``read_size`` characters at a time, so the list itself is
+    never held in memory.
+    """
+    reader = codecs.getreader("utf-8")(upload)
+    buffer, pos, eof = "", 0, False
+    # "start": before the "[", "first": right after it, "item": after an
+    # item, "next": after a comma
+    state = "start"
+    while True:
+        pos = _whitespace.match(buffer, pos).end()
+        if pos == len(buffer):
+            if eof:
+                if state == "start":
+                    raise ImportFileError("The upload must be a list of products")
+                raise ImportFileError("The upload is not valid JSON: the list is never closed")
+            buffer, pos = reader.read(read_size), 0
+            eof = not buffer
+            continue
+
+        char = buffer[pos]
+        if state == "start":
+            if char != "[":
+                raise ImportFileError("The upload must be a list of products")
+            state, pos = "first", pos + 1
+        elif char == "]" and state in ("first", "item"):
+            return
+        elif state == "item":
+            if char != ",":
+                raise ImportFileError(f"The upload is not valid JSON: expected ',' or ']', found {char!r}")
+            state, pos = "next", pos + 1
+        else:
+            try:
+                item, end = _decoder.raw_decode(buffer, pos)
+            except ValueError as exc:
+                if eof:
+                    raise ImportFileError(f"The upload is not valid JSON: {exc}") from exc
+                end = None
+            if end is None or end == len(buffer) and not eof:
+                # The item may be cut off at the end of the buffer: read on
+                more = reader.read(read_size)
+                buffer, pos, eof = buffer[pos:] + more, 0, not more
+                continue
+            yield item
+            state, pos = "item", end
+
+
+def run_import_job(job, chunk_size=None):
+    """
+    Import ``job`` from its next_index on; returns its final status. The
+    upload is read a chunk at a time, so total_rows of an uploaded file is
+    only known once the job is done.
+    """
+    chunk_size = chunk_size or settings.PRODUCT_IMPORT_CHUNK_SIZE
+    row_errors = list(job.row_errors)
+    start = job.next_index
+
+    with job.upload.open("rb") as upload:
+        items = islice(iter_upload(upload), job.next_index, None)
+        while True:
+            if ImportJob.objects.filter(pk=job.pk, cancel_requested=True).exists():
+                heartbeat(job, status="cancelled")
+                return "cancelled"
+
+            began = time.monotonic()
+            chunk = list(islice(items, chunk_size))
+            if not chunk:
+                break
+            with transaction.atomic():
+                created, errors = import_chunk(chunk, offset=start)
+                # Every failure is counted, but only the first ones are kept
+                row_errors.extend(errors[:max(settings.IMPORT_JOB_MAX_ERRORS - len(row_errors), 0)])
+                heartbeat(
+                    job,
+                    next_index=start + len(chunk),
+                    rows_done=F("rows_done") + len(created),
+                    rows_failed=F("rows_failed") + len(errors),
+                    row_errors=row_errors,
+                    elapsed=F("elapsed") + (time.monotonic() - began),
+                )
+            start += len(chunk)
+
+    finish_job(job, total_rows=start)
+    return "done"
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+# Lifecycle of QueuedJob rows (aso/models.py).
+#
+# Any number of worker processes may poll the same table: a job belongs to
+# the worker whose conditional UPDATE flipped it from pending to running, so
+# no row is processed twice and no table lock is needed.
+
+MAX_ATTEMPTS = 3
+
+
+def claim_jobs(queryset, limit):
+    """Mark up to ``limit`` pending jobs of ``queryset`` running; returns them."""
+    candidates = list(
+        queryset.filter(status='pending').order_by('created_at', 'pk').values_list('pk', flat=True)[:limit]
+    )
+    now = timezone.now()
+    claimed = [
+        pk for pk in candidates
+        if queryset.filter(pk=pk, status='pending').update(
+            status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1
+        )
+    ]
+    return list(queryset.filter(pk__in=claimed).order_by('created_at', 'pk'))
+
+
+def finish_job(job, **fields):
+    type(job).objects.filter(pk=job.pk).update(status='done', error='', finished_at=timezone.now(), **fields)
+
+
+def fail_job(job, error, max_attempts=MAX_ATTEMPTS):
+    """Put the job back in the queue, or give up after ``max_attempts``."""
+    attempts = type(job).objects.filter(pk=job.pk).values_list('attempts', flat=True).first() or 0
+    status = 'failed' if attempts >= max_attempts else 'pending'
+    type(job).objects.filter(pk=job.pk).update(status=status, error=str(error), finished_at=timezone.now())
+    return status
+
+
+def heartbeat(job, **fields):
+    """Record progress of a running job (and any ``fields`` with it)."""
+    type(job).objects.filter(pk=job.pk).update(heartbeat_at=timezone.now(), **fields)
+
+
+def requeue_stale_jobs(queryset, timeout):
+    """Return jobs whose worker hasn't been heard from for ``timeout`` seconds."""
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    return queryset.filter(status='running', heartbeat_at__lt=cutoff).update(status='pending')
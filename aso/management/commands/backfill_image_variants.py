@@ -0,0 +1,59 @@
+from concurrent.futures import as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from aso.images import apply_variants, file_digest, image_worker_pool, process_image_jobs
+from aso.models import ImageDerivativeJob, Product, ProductImage
+
+
+class Command(BaseCommand):
+    help = "Queue and render the variants of every product image that doesn't have current ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=settings.IMAGE_WORKER_PROCESSES, help="Size of the process pool."
+        )
+        parser.add_argument("--batch-size", type=int, default=100, help="Jobs claimed per round.")
+
+    def stale_paths(self):
+        rows = list(Product.objects.exclude(main_image="").exclude(main_image__isnull=True)
+                    .values_list("main_image", "main_image_variants"))
+        rows += list(ProductImage.objects.exclude(image="").values_list("image", "variants"))
+        return sorted({path for path, recorded in rows if (recorded or {}).get("source") != path})
+
+    def handle(self, *args, **options):
+        paths = self.stale_paths()
+        if not paths:
+            self.stdout.write("Every image already has its variants.")
+            return
+
+        processed = 0
+        with image_worker_pool(options["processes"]) as executor:
+            # Hashing reads every original, so it is spread over the pool too
+            futures = {executor.submit(file_digest, path): path for path in paths}
+            jobs = []
+            for future in as_completed(futures):
+                try:
+                    jobs.append(ImageDerivativeJob(path=futures[future], content_hash=future.result()))
+                except OSError as exc:
+                    self.stderr.write(f"Skipping {futures[future]}: {exc}")
+            ImageDerivativeJob.objects.bulk_create(jobs, ignore_conflicts=True, batch_size=500)
+
+            keys = {(job.path, job.content_hash) for job in jobs}
+            for job in ImageDerivativeJob.objects.filter(path__in=paths).exclude(status__in=["pending", "running"]):
+                if (job.path, job.content_hash) not in keys:
+                    continue
+                if job.status == "done" and job.result:
+                    # Rendered before (e.g. by an earlier backfill); only needs recording
+                    apply_variants(job.path, job.result)
+                else:
+                    ImageDerivativeJob.objects.filter(pk=job.pk).update(status="pending", attempts=0)
+
+            while True:
+                claimed = process_image_jobs(executor, options["batch_size"])
+                if not claimed:
+                    break
+                processed += claimed
+
+        self.stdout.write(self.style.SUCCESS(f"Queued {len(jobs)} images, rendered {processed}."))
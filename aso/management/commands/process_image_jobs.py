@@ -0,0 +1,35 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from aso.images import image_worker_pool, process_image_jobs
+from aso.jobs import requeue_stale_jobs
+from aso.models import ImageDerivativeJob
+
+
+class Command(BaseCommand):
+    help = "Render queued product image variants in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=settings.IMAGE_WORKER_PROCESSES, help="Size of the process pool."
+        )
+        parser.add_argument("--batch-size", type=int, default=20, help="Jobs claimed per round.")
+        parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        processed = 0
+        with image_worker_pool(options["processes"]) as executor:
+            while True:
+                requeue_stale_jobs(ImageDerivativeJob.objects.all(), settings.IMAGE_JOB_TIMEOUT)
+                claimed = process_image_jobs(executor, options["batch_size"])
+                processed += claimed
+                if claimed:
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} image jobs."))
@@ -0,0 +1,41 @@
+import logging
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from aso.importer import ImportFileError, run_import_job
+from aso.jobs import claim_jobs, fail_job, requeue_stale_jobs
+from aso.models import ImportJob
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Run queued catalog import jobs, one committed chunk at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=settings.PRODUCT_IMPORT_CHUNK_SIZE)
+        parser.add_argument("--poll-interval", type=float, default=5.0, help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--once", action="store_true", help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            requeue_stale_jobs(ImportJob.objects.all(), settings.IMPORT_JOB_TIMEOUT)
+            jobs = claim_jobs(ImportJob.objects.all(), 1)
+            if not jobs:
+                if options["once"]:
+                    break
+                time.sleep(options["poll_interval"])
+                continue
+
+            job = jobs[0]
+            try:
+                outcome = run_import_job(job, chunk_size=options["chunk_size"])
+            except ImportFileError as exc:
+                # Retrying won't fix the file
+                outcome = fail_job(job, exc, max_attempts=1)
+            except Exception as exc:
+                logger.exception("Import job %s failed", job.pk)
+                outcome = fail_job(job, exc)
+            self.stdout.write(f"Import job {job.pk}: {outcome}")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from aso.related import RELATED_PRODUCTS_LIMIT, changed_product_ids, rebuild_related_products
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the precomputed related products used by the product detail page. "
+        "Schedule it with --changed every few minutes and without options nightly."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", nargs="+", type=int, help="Only rebuild these product ids.")
+        parser.add_argument(
+            "--changed",
+            action="store_true",
+            help="Only rebuild products affected by product edits and orders since the last build.",
+        )
+        parser.add_argument("--limit", type=int, default=RELATED_PRODUCTS_LIMIT, help="Neighbours kept per product.")
+
+    def handle(self, *args, **options):
+        product_ids = options["products"]
+        if options["changed"]:
+            product_ids = changed_product_ids()
+            if product_ids is not None and not product_ids:
+                self.stdout.write("Nothing changed since the last build.")
+                return
+
+        count = rebuild_related_products(product_ids, limit=options["limit"])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt related products for {count} products."))
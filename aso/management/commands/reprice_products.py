@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from aso.repricing import create_campaign
+
+
+def _datetime(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise CommandError(f"Not an ISO 8601 date and time: {value}")
+    return parsed
+
+
+class Command(BaseCommand):
+    help = "Discount a selection of products with a single UPDATE, optionally scheduled and reverted later."
+
+    def add_arguments(self, parser):
+        parser.add_argument("discount_percent", type=int, help="0 removes the discount.")
+        parser.add_argument("--name", default="", help="Campaign name shown in the admin.")
+        parser.add_argument("--category", nargs="+", help="Category names.")
+        parser.add_argument("--badge", nargs="+", help="Badges, e.g. New 'Best Seller'.")
+        parser.add_argument("--ids", nargs="+", type=int, help="Product ids.")
+        parser.add_argument("--all", action="store_true", help="Reprice the whole catalog.")
+        parser.add_argument("--starts-at", type=_datetime, help="Apply at this time (run_price_campaigns) instead of now.")
+        parser.add_argument("--ends-at", type=_datetime, help="Revert at this time (run_price_campaigns).")
+
+    def handle(self, *args, **options):
+        if not 0 <= options["discount_percent"] <= 100:
+            raise CommandError("discount_percent must be between 0 and 100.")
+        filters = {name: options[name] for name in ("category", "badge", "ids") if options[name]}
+        if not filters and not options["all"]:
+            raise CommandError("Choose --category, --badge or --ids, or pass --all.")
+
+        campaign = create_campaign(
+            name=options["name"] or f"{options['discount_percent']}% off",
+            discount_percent=options["discount_percent"],
+            filters=filters,
+            starts_at=options["starts_at"],
+            ends_at=options["ends_at"],
+        )
+        if campaign.status == "active":
+            self.stdout.write(self.style.SUCCESS(f"Campaign {campaign.pk}: repriced {campaign.products_count} products."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Campaign {campaign.pk} scheduled for {campaign.starts_at}."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from aso.repricing import run_due_campaigns
+
+
+class Command(BaseCommand):
+    help = "Apply price campaigns whose start has passed and revert those that have ended. Run from cron."
+
+    def handle(self, *args, **options):
+        applied, reverted = run_due_campaigns()
+        self.stdout.write(self.style.SUCCESS(f"Applied {applied} campaigns, reverted {reverted}."))
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# The search table of aso/search.py as it was created; the SQL is spelled
+# out here so later changes to that module can't change this migration.
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS aso_product_search USING fts5("
+    "title, product_number, category_names, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO aso_product_search (rowid, title, product_number, category_names) "
+    "SELECT p.id, p.title, COALESCE(p.product_number, ''), COALESCE(("
+    "SELECT group_concat(c.name, ' ') FROM aso_product_category pc "
+    "JOIN aso_category c ON c.id = pc.category_id WHERE pc.product_id = p.id), '') "
+    "FROM aso_product p",
+]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS aso_product_search ("
+    "product_id bigint PRIMARY KEY REFERENCES aso_product (id) ON DELETE CASCADE, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS aso_product_search_document_gin ON aso_product_search USING GIN (document)",
+    "INSERT INTO aso_product_search (product_id, document) SELECT p.id, "
+    "setweight(to_tsvector('simple', p.title), 'A') || "
+    "setweight(to_tsvector('simple', COALESCE(p.product_number, '')), 'B') || "
+    "setweight(to_tsvector('simple', COALESCE(("
+    "SELECT string_agg(c.name, ' ') FROM aso_product_category pc "
+    "JOIN aso_category c ON c.id = pc.category_id WHERE pc.product_id = p.id), '')), 'C') "
+    "FROM aso_product p",
+]
+
+
+def create_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_CREATE, "postgresql": POSTGRES_CREATE}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE IF EXISTS aso_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0022_remove_orderreturn_item'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_cards(apps, schema_editor):
+    Product = apps.get_model('aso', 'Product')
+    ProductCard = apps.get_model('aso', 'ProductCard')
+
+    categories = {}
+    memberships = Product.category.through.objects.order_by('category__name').values_list(
+        'product_id', 'category_id', 'category__name'
+    )
+    for product_id, category_id, name in memberships:
+        categories.setdefault(product_id, []).append((category_id, name))
+
+    cards = []
+    for product in Product.objects.iterator(chunk_size=500):
+        product_categories = categories.get(product.id, [])
+        description = product.description or ""
+        cards.append(ProductCard(
+            product_id=product.id,
+            title=product.title,
+            short_description=description[:80] + "..." if len(description) > 80 else description,
+            badge=product.badge,
+            main_image=product.main_image.name if product.main_image else None,
+            current_price=product.current_price,
+            original_price=product.original_price,
+            discount_percent=product.discount_percent,
+            rating=product.rating,
+            reviews_count=product.reviews_count,
+            category_ids=[category_id for category_id, _ in product_categories],
+            category_names="|%s|" % "|".join(name for _, name in product_categories) if product_categories else "",
+            display_product=product.display_product,
+            created_at=product.created_at,
+        ))
+        if len(cards) == 500:
+            ProductCard.objects.bulk_create(cards)
+            cards = []
+    ProductCard.objects.bulk_create(cards)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0023_product_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductCard',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='aso.product')),
+                ('title', models.CharField(max_length=255)),
+                ('short_description', models.CharField(blank=True, max_length=83)),
+                ('badge', models.CharField(blank=True, max_length=50)),
+                ('main_image', models.ImageField(blank=True, null=True, upload_to='products/main/')),
+                ('current_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('original_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discount_percent', models.PositiveIntegerField(blank=True, null=True)),
+                ('rating', models.FloatField(default=0.0)),
+                ('reviews_count', models.PositiveIntegerField(default=0)),
+                ('category_ids', models.JSONField(blank=True, default=list)),
+                ('category_names', models.TextField(blank=True)),
+                ('display_product', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['display_product', '-created_at'], name='aso_product_display_8692ab_idx'), models.Index(fields=['current_price'], name='aso_product_current_f0235c_idx'), models.Index(fields=['rating'], name='aso_product_rating_c9262d_idx')],
+            },
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0024_productcard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('built_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_links', to='aso.product')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='aso.product')),
+            ],
+            options={
+                'ordering': ['rank'],
+                'indexes': [models.Index(fields=['product', 'rank'], name='aso_related_product_c4a78f_idx')],
+                'unique_together': {('product', 'related')},
+            },
+        ),
+    ]
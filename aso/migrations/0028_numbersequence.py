@@ -0,0 +1,41 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:23
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def _next_value(model, number_field):
+    # Continue after both the highest id (what the old scheme used) and the
+    # highest number already issued
+    highest = model.objects.aggregate(last=Max('id'))['last'] or 0
+    for number in model.objects.exclude(**{number_field: None}).values_list(number_field, flat=True).iterator():
+        suffix = number.rsplit('-', 1)[-1]
+        if suffix.isdigit():
+            highest = max(highest, int(suffix))
+    return highest + 1
+
+
+def seed_sequences(apps, schema_editor):
+    NumberSequence = apps.get_model('aso', 'NumberSequence')
+    Product = apps.get_model('aso', 'Product')
+    Order = apps.get_model('aso', 'Order')
+    NumberSequence.objects.create(name='product', next_value=_next_value(Product, 'product_number'))
+    NumberSequence.objects.create(name='order', next_value=_next_value(Order, 'order_number'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0027_imagederivativejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NumberSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
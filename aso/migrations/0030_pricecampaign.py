@@ -0,0 +1,57 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0029_importjob'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('discount_percent', models.PositiveIntegerField()),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('starts_at', models.DateTimeField()),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('active', 'Active'), ('reverted', 'Reverted'), ('cancelled', 'Cancelled')], default='scheduled', max_length=20)),
+                ('products_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('applied_at', models.DateTimeField(blank=True, null=True)),
+                ('reverted_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='price_campaigns', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceCampaignItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('previous_discount_percent', models.PositiveIntegerField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='aso.pricecampaign')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_campaign_items', to='aso.product')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pricecampaign',
+            index=models.Index(fields=['status', 'starts_at'], name='aso_priceca_status_73a4f1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pricecampaign',
+            index=models.Index(fields=['status', 'ends_at'], name='aso_priceca_status_5eb37c_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pricecampaignitem',
+            unique_together={('campaign', 'product')},
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0030_pricecampaign'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('kind', models.CharField(choices=[('percent_off', 'Percent off'), ('buy_x_get_y', 'Buy X get Y free'), ('free_shipping', 'Free shipping')], max_length=20)),
+                ('percent_off', models.PositiveIntegerField(blank=True, help_text='percent_off: discount on the line.', null=True)),
+                ('buy_quantity', models.PositiveIntegerField(blank=True, help_text='buy_x_get_y: units paid for (X).', null=True)),
+                ('get_quantity', models.PositiveIntegerField(blank=True, help_text='buy_x_get_y: units free (Y).', null=True)),
+                ('min_subtotal', models.DecimalField(blank=True, decimal_places=2, help_text='free_shipping: cart subtotal needed.', max_digits=10, null=True)),
+                ('states', models.JSONField(blank=True, default=list)),
+                ('starts_at', models.DateTimeField(blank=True, null=True)),
+                ('ends_at', models.DateTimeField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('categories', models.ManyToManyField(blank=True, related_name='promotions', to='aso.category')),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='aso.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.6 on 2026-10-17 21:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aso', '0032_user_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField()),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,11 +1,16 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Length, Substr
 from administrator.models import User
 from django.contrib.auth import get_user_model
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal
 from django.utils import timezone
 from datetime import timedelta
 
 from aso.deliveryFee import DELIVERY_FEES
+from aso.numbers import format_number, order_numbers, product_numbers
+from aso.cart_pricing import price_cart
+from aso.search import index_products
 # Create your models here.
 
 
@@ -17,6 +22,32 @@ class Category(models.Model):
         return self.name
 
 
+def discounted_price(original_price, discount_percent):
+    """The current_price Product.save() derives from a price and a discount."""
+    if not discount_percent:
+        return original_price
+    # Rounded half up to the cent, as the repricing UPDATE does
+    price = Decimal(original_price) * (100 - Decimal(discount_percent)) / 100
+    return price.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    update() skips the save signals that keep the product cards and search
+    documents in step (aso/signals.py), so it refreshes the rows it changed
+    itself. bulk_update() goes through update() too.
+    """
+
+    def update(self, **kwargs):
+        product_ids = list(self.values_list('pk', flat=True))
+        with transaction.atomic(using=self.db, savepoint=False):
+            count = super().update(**kwargs)
+            ProductCard.copy_fields(product_ids, kwargs, using=self.db)
+            if kwargs.keys() & {'title', 'product_number'}:
+                index_products(product_ids, using=self.db)
+        return count
+
+
 class Product(models.Model):
     Badge = [
         ('New', 'New'),
@@ -38,26 +69,23 @@ class Product(models.Model):
 
     badge = models.CharField(max_length=50, blank=True, choices=Badge, default="New")
     main_image = models.ImageField(upload_to='products/main/', null=True, blank=True)
+    # Resized WebP/JPEG copies of main_image, see aso/images.py
+    main_image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     display_product = models.BooleanField(default=True)
+
+    objects = ProductQuerySet.as_manager()
     
     def save(self, *args, **kwargs):
         if not self.product_number:
-            last_product = Product.objects.order_by('-id').first()
-            next_id = 1 if not last_product else last_product.id + 1
-            self.product_number = f"#AO-P-{str(next_id).zfill(4)}"
+            self.product_number = format_number("#AO-P-", product_numbers.take()[0])
             
             
         if self.discount_percent:
-            if self.discount_percent:
-                # Ensure consistent Decimal types
-                discount = Decimal(self.discount_percent) / Decimal('100')
-                self.current_price = self.original_price - (self.original_price * discount)
-            else:
-                self.current_price = self.original_price
+            self.current_price = discounted_price(self.original_price, self.discount_percent)
         else:
             # No discount: set both prices the same
             if self.original_price:
@@ -82,6 +110,180 @@ class Product(models.Model):
         return ", ".join([cat.name for cat in self.category.all()])
 
 
+class NumberSequence(models.Model):
+    """
+    Counter row behind the product and order numbers; aso/numbers.py
+    reserves blocks of it with a single UPDATE.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
+class CacheVersion(models.Model):
+    """
+    Version counters every worker process reads ("catalog", "promotions"):
+    the in-process caches and indexes are keyed by them, see aso/cache.py.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField()
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+
+class ProductCard(models.Model):
+    """
+    Read model for catalog listings: exactly the fields a product card shows,
+    so ProductListView scans one narrow table with no joins and never loads
+    the full description. Kept in sync by ProductCard.refresh() from the
+    product/category signals in aso/signals.py.
+    """
+    SHORT_DESCRIPTION_LENGTH = 80
+
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(max_length=255)
+    short_description = models.CharField(max_length=SHORT_DESCRIPTION_LENGTH + 3, blank=True)
+    badge = models.CharField(max_length=50, blank=True)
+    main_image = models.ImageField(upload_to='products/main/', null=True, blank=True)
+    main_image_variants = models.JSONField(default=dict, blank=True)
+    current_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    original_price = models.DecimalField(max_digits=10, decimal_places=2)
+    discount_percent = models.PositiveIntegerField(null=True, blank=True)
+    rating = models.FloatField(default=0.0)
+    reviews_count = models.PositiveIntegerField(default=0)
+    category_ids = models.JSONField(default=list, blank=True)
+    # "|Aso Oke|Formal Wear|" so the category filter is a single-column icontains
+    category_names = models.TextField(blank=True)
+    display_product = models.BooleanField(default=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['display_product', '-created_at']),
+            models.Index(fields=['current_price']),
+            models.Index(fields=['rating']),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    # Columns copied from Product as they are
+    COPIED_FIELDS = (
+        'title', 'badge', 'main_image', 'main_image_variants', 'current_price', 'original_price',
+        'discount_percent', 'rating', 'reviews_count', 'display_product', 'created_at',
+    )
+    COPY_CHUNK_SIZE = 1000
+
+    @classmethod
+    def copy_fields(cls, product_ids, fields, using='default'):
+        """
+        Bring the cards of ``product_ids`` up to date after ``fields`` of
+        their products changed: copied columns with one UPDATE per chunk,
+        anything derived by rebuilding the cards.
+        """
+        if not product_ids:
+            return
+        if 'description' in fields:
+            cls.refresh(product_ids, using=using)
+            return
+        copied = [name for name in cls.COPIED_FIELDS if name in fields]
+        if not copied:
+            return
+
+        products = Product.objects.using(using).filter(pk=OuterRef('pk'))
+        values = {name: Subquery(products.values(name)[:1]) for name in copied}
+        for start in range(0, len(product_ids), cls.COPY_CHUNK_SIZE):
+            chunk = product_ids[start:start + cls.COPY_CHUNK_SIZE]
+            cls.objects.using(using).filter(pk__in=chunk).update(**values)
+
+    @classmethod
+    def refresh(cls, product_ids, using='default'):
+        """Rebuild the cards of the given products with two reads and one upsert."""
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+
+        categories = {}
+        memberships = (
+            Product.category.through.objects.using(using)
+            .filter(product_id__in=product_ids)
+            .order_by('category__name')
+            .values_list('product_id', 'category_id', 'category__name')
+        )
+        for product_id, category_id, name in memberships:
+            categories.setdefault(product_id, []).append((category_id, name))
+
+        limit = cls.SHORT_DESCRIPTION_LENGTH
+        products = (
+            Product.objects.using(using)
+            .filter(id__in=product_ids)
+            .annotate(description_head=Substr('description', 1, limit), description_length=Length('description'))
+            .values(
+                'id', 'title', 'badge', 'main_image', 'main_image_variants', 'current_price', 'original_price',
+                'discount_percent', 'rating', 'reviews_count', 'display_product', 'created_at',
+                'description_head', 'description_length',
+            )
+        )
+
+        cards = []
+        for row in products:
+            product_categories = categories.get(row['id'], [])
+            short_description = row['description_head'] or ""
+            if (row['description_length'] or 0) > limit:
+                short_description += "..."
+            cards.append(cls(
+                product_id=row['id'],
+                title=row['title'],
+                short_description=short_description,
+                badge=row['badge'],
+                main_image=row['main_image'],
+                main_image_variants=row['main_image_variants'],
+                current_price=row['current_price'],
+                original_price=row['original_price'],
+                discount_percent=row['discount_percent'],
+                rating=row['rating'],
+                reviews_count=row['reviews_count'],
+                category_ids=[category_id for category_id, _ in product_categories],
+                category_names="|%s|" % "|".join(name for _, name in product_categories) if product_categories else "",
+                display_product=row['display_product'],
+                created_at=row['created_at'],
+            ))
+
+        cls.objects.using(using).bulk_create(
+            cards,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=[f.name for f in cls._meta.concrete_fields if not f.primary_key],
+        )
+
+
+class RelatedProduct(models.Model):
+    """
+    Precomputed "you may also like" neighbours of a product, rebuilt by the
+    rebuild_related_products command (see aso/related.py).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    built_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['rank']
+        unique_together = ('product', 'related')
+        indexes = [
+            models.Index(fields=['product', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_id} ({self.score})"
+
+
 class ProductColor(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='colors')
     color_name = models.CharField(max_length=100)
@@ -127,6 +329,8 @@ class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='products/gallery/')
     alt_text = models.CharField(max_length=255, blank=True)
+    # Resized WebP/JPEG copies of image, see aso/images.py
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     
     class Meta:
         indexes = [
@@ -161,8 +365,21 @@ class Cart(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     state = models.CharField(max_length=100, blank=True, null=True)
 
+    def pricing(self):
+        """
+        The cart's CartPricing snapshot (aso/cart_pricing.py), computed once
+        per instance; call refresh_pricing() after changing its items.
+        """
+        if not hasattr(self, '_pricing'):
+            self._pricing = price_cart(self)
+        return self._pricing
+
+    def refresh_pricing(self):
+        self.__dict__.pop('_pricing', None)
+        return self.pricing()
+
     def subtotal(self):
-        return sum(item.subtotal() for item in self.items.all())
+        return self.pricing().subtotal
 
     def shipping_cost(self):
         return Decimal(DELIVERY_FEES.get(self.state, 0))  # static for now
@@ -170,11 +387,14 @@ class Cart(models.Model):
     # def tax(self):
     #     return self.subtotal() * Decimal("0.05")  # 5% tax example
 
+    def promotions(self):
+        return self.pricing().promotions
+
     def discount(self):
-        return Decimal("0.00")  # set by logic/rules
+        return self.pricing().discount
 
     def total(self):
-        return self.subtotal() + self.shipping_cost() - self.discount()
+        return self.pricing().total
 
     def __str__(self):
         return f"{self.user.first_name}'s Cart"
@@ -200,6 +420,20 @@ class CartItem(models.Model):
             models.Index(fields=['cart']),
             models.Index(fields=['product']),
         ]
+
+
+class UserCounter(models.Model):
+    """
+    The header badge counts, kept up to date by the CartItem and WatchList
+    signals (aso/counters.py) so the badge is one primary-key read. Created
+    from real counts the first time it is read.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='counters')
+    item_count = models.IntegerField(default=0)
+    watchlist_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user_id}: {self.item_count} in cart, {self.watchlist_count} watchlisted"
         
         
 
@@ -225,15 +459,13 @@ class Order(models.Model):
 
     
     def save(self, *args, **kwargs):
-        if not self.order_number:
-            last_order = Order.objects.order_by('-id').first()
-            next_id = 1 if not last_order else last_order.id + 1
-            self.order_number = f"#AO-OD-{str(next_id).zfill(4)}"
-
-        if not self.tracking_number:
-            last_order_tracking = Order.objects.order_by('-id').first()
-            next_id = 1 if not last_order_tracking else last_order_tracking.id + 1
-            self.tracking_number = f"#AO-OT-{str(next_id).zfill(4)}"
+        if not self.order_number or not self.tracking_number:
+            # Both numbers of an order share one allocated number
+            next_id = order_numbers.take()[0]
+            if not self.order_number:
+                self.order_number = format_number("#AO-OD-", next_id)
+            if not self.tracking_number:
+                self.tracking_number = format_number("#AO-OT-", next_id)
             
         if self.estimated_delivery_date is None:
             self.estimated_delivery_date = (self.created_at or timezone.now()).date() + timedelta(days=7)
@@ -337,4 +569,170 @@ class OrderReturn(models.Model):
 
     def __str__(self):
         return f"return request for Order {self.order.order_number}"
-    
\ No newline at end of file
+        
+    
+    
+class QueuedJob(models.Model):
+    """
+    Base for rows consumed by a background worker; see aso/jobs.py for how
+    they are claimed, finished and retried.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by long-running jobs; a stale one means the worker died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        abstract = True
+
+
+class ImageDerivativeJob(QueuedJob):
+    """
+    Resizing of one stored image into its variants (aso/images.py). Keyed by
+    path and content hash, so the same photo is rendered once; saving a row
+    queues the path with an empty hash, which the worker fills in.
+    """
+    path = models.CharField(max_length=255)
+    content_hash = models.CharField(max_length=64)
+    result = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('path', 'content_hash')
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.path} ({self.status})"
+
+
+class ImportJob(QueuedJob):
+    """
+    A stored product catalog upload imported by the process_import_jobs
+    worker, one committed chunk at a time. next_index is the first item not
+    yet committed, so a cancelled or interrupted job resumes from there.
+    """
+    upload = models.FileField(upload_to='imports/')
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    total_rows = models.PositiveIntegerField(null=True, blank=True)
+    next_index = models.PositiveIntegerField(default=0)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    # [{"index": 12, "errors": {...}}, ...] as reported by the synchronous import
+    row_errors = models.JSONField(default=list, blank=True)
+    # Seconds spent importing, across resumes
+    elapsed = models.FloatField(default=0.0)
+    cancel_requested = models.BooleanField(default=False)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Import {self.pk} ({self.status})"
+
+    @property
+    def throughput(self):
+        """Rows per second."""
+        rows = self.rows_done + self.rows_failed
+        return round(rows / self.elapsed, 1) if self.elapsed else None
+
+
+class PriceCampaign(models.Model):
+    """
+    A discount applied to a filtered set of products with one UPDATE, and
+    optionally reverted later; see aso/repricing.py. ``filters`` holds the
+    selection: {"category": [names], "badge": [badges], "ids": [ids]}, or
+    {} for the whole catalog.
+    """
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('active', 'Active'),
+        ('reverted', 'Reverted'),
+        ('cancelled', 'Cancelled'),
+    ]
+    name = models.CharField(max_length=255)
+    discount_percent = models.PositiveIntegerField()
+    filters = models.JSONField(default=dict, blank=True)
+    starts_at = models.DateTimeField()
+    ends_at = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    products_count = models.PositiveIntegerField(default=0)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='price_campaigns')
+    created_at = models.DateTimeField(auto_now_add=True)
+    applied_at = models.DateTimeField(null=True, blank=True)
+    reverted_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'starts_at']),
+            models.Index(fields=['status', 'ends_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.discount_percent}% {self.status})"
+
+
+class PriceCampaignItem(models.Model):
+    """The discount a product had before a campaign, restored on revert."""
+    campaign = models.ForeignKey(PriceCampaign, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_campaign_items')
+    previous_discount_percent = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('campaign', 'product')
+
+    def __str__(self):
+        return f"{self.campaign_id} - {self.product_id}"
+
+
+class Promotion(models.Model):
+    """
+    A cart promotion rule. Active rules are compiled into an in-memory index
+    by aso/promotions.py, which Cart.discount() evaluates.
+
+    Scope: the listed products and categories, or every product when both
+    are empty; ``states`` limits the rule to carts shipping to those states
+    (empty means anywhere).
+    """
+    KIND_CHOICES = [
+        ('percent_off', 'Percent off'),
+        ('buy_x_get_y', 'Buy X get Y free'),
+        ('free_shipping', 'Free shipping'),
+    ]
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    percent_off = models.PositiveIntegerField(null=True, blank=True, help_text="percent_off: discount on the line.")
+    buy_quantity = models.PositiveIntegerField(null=True, blank=True, help_text="buy_x_get_y: units paid for (X).")
+    get_quantity = models.PositiveIntegerField(null=True, blank=True, help_text="buy_x_get_y: units free (Y).")
+    min_subtotal = models.DecimalField(
+        max_digits=10, decimal_places=2, null=True, blank=True, help_text="free_shipping: cart subtotal needed."
+    )
+    products = models.ManyToManyField(Product, blank=True, related_name='promotions')
+    categories = models.ManyToManyField(Category, blank=True, related_name='promotions')
+    states = models.JSONField(default=list, blank=True)
+    starts_at = models.DateTimeField(null=True, blank=True)
+    ends_at = models.DateTimeField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return self.name
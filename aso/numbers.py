@@ -0,0 +1,78 @@
+import os
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+
+def reserve_numbers(name, count, using='default'):
+    """
+    Take ``count`` consecutive numbers from the ``name`` counter row and
+    return the first. The UPDATE locks the row until the surrounding
+    transaction ends, so concurrent callers always get disjoint ranges.
+    """
+    from .models import NumberSequence
+
+    sequences = NumberSequence.objects.using(using)
+    with transaction.atomic(using=using):
+        if not sequences.filter(name=name).update(next_value=F('next_value') + count):
+            sequences.get_or_create(name=name)
+            sequences.filter(name=name).update(next_value=F('next_value') + count)
+        end = sequences.filter(name=name).values_list('next_value', flat=True).get()
+    return end - count
+
+
+class NumberAllocator:
+    """
+    Hands out numbers of one counter, reserving ``block_size`` of them per
+    database round trip and keeping the rest in memory for this process.
+
+    A reserved block is only kept once the transaction that reserved it has
+    committed; if it rolls back, so does the counter, and the leftovers are
+    dropped instead of being handed out again. Numbers taken by a rolled
+    back transaction leave gaps, never duplicates.
+    """
+
+    def __init__(self, name, block_size):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._blocks = {}
+
+    def _cached(self, using):
+        # A forked child must not reuse the block its parent holds
+        pid, start, end = self._blocks.pop(using, (None, 0, 0))
+        return (start, end) if pid == os.getpid() else (0, 0)
+
+    def _keep(self, using, start, end):
+        with self._lock:
+            current = self._cached(using)
+            if current[1] - current[0] > end - start:
+                start, end = current
+            self._blocks[using] = (os.getpid(), start, end)
+
+    def take(self, count=1, using='default'):
+        """Return ``count`` unused numbers, in increasing order."""
+        with self._lock:
+            start, end = self._cached(using)
+            taken = list(range(start, min(end, start + count)))
+            if len(taken) == count:
+                self._blocks[using] = (os.getpid(), start + count, end)
+                return taken
+
+        needed = count - len(taken)
+        size = max(needed, self.block_size)
+        first = reserve_numbers(self.name, size, using=using)
+        taken.extend(range(first, first + needed))
+        if needed < size:
+            transaction.on_commit(lambda: self._keep(using, first + needed, first + size), using=using)
+        return taken
+
+
+product_numbers = NumberAllocator('product', settings.NUMBER_BLOCK_SIZE)
+order_numbers = NumberAllocator('order', settings.NUMBER_BLOCK_SIZE)
+
+
+def format_number(prefix, number):
+    return f"{prefix}{str(number).zfill(4)}"
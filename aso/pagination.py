@@ -0,0 +1,177 @@
+import base64
+import binascii
+import datetime
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the list ordering (e.g. ``-created_at``,
+    ``current_price``, ``rating``, ``-delivery_date``) with the primary key as
+    a tiebreaker. Every page is a ``WHERE (key, pk) < (last_key, last_pk)``
+    range scan, so page 500 costs the same as page 1 and no COUNT(*) is run.
+
+    The key column must not contain NULLs.
+    """
+    page_size = PageNumberPagination.page_size
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.key, self.descending = self.get_ordering(request, queryset, view)
+        cursor = self.decode_cursor(request, queryset)
+
+        reverse = cursor is not None and cursor["r"]
+        descending = self.descending != reverse
+        prefix = "-" if descending else ""
+        ordering = [prefix + self.key] if self.key == "pk" else [prefix + self.key, prefix + "pk"]
+        queryset = queryset.order_by(*ordering)
+
+        if cursor is not None:
+            queryset = queryset.filter(self.position_filter(cursor["v"], cursor["pk"], descending))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+
+        self.page = results
+        # Going forwards there is a previous page whenever we came from a
+        # cursor; going backwards there is always a next page (the one we
+        # came from).
+        self.has_next = has_more if not reverse else True
+        self.has_previous = cursor is not None if not reverse else has_more
+        return results
+
+    def get_ordering(self, request, queryset, view):
+        ordering = None
+        for backend in getattr(view, "filter_backends", []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+
+        if not ordering:
+            ordering = queryset.query.order_by or queryset.model._meta.ordering or ["-pk"]
+
+        field = ordering[0]
+        if not isinstance(field, str):
+            raise TypeError("Keyset pagination needs a field name ordering, got %r" % (field,))
+
+        descending = field.startswith("-")
+        key = field.lstrip("-")
+        if key == queryset.model._meta.pk.name:
+            key = "pk"
+        return key, descending
+
+    def position_filter(self, value, pk, descending):
+        op = "lt" if descending else "gt"
+        if self.key == "pk":
+            return Q(**{"pk__%s" % op: pk})
+        return Q(**{"%s__%s" % (self.key, op): value}) | Q(**{self.key: value, "pk__%s" % op: pk})
+
+    def key_field(self, queryset):
+        """The model field (or annotation output field) behind the ordering key."""
+        if self.key == "pk":
+            return queryset.model._meta.pk
+        try:
+            return queryset.model._meta.get_field(self.key)
+        except FieldDoesNotExist:
+            return queryset.query.annotations[self.key].output_field
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")).decode("utf-8"))
+            if not isinstance(cursor, dict) or set(cursor) != {"v", "pk", "r"} or not isinstance(cursor["r"], bool):
+                raise ValueError
+            # The cursor comes from the client: parse its values as the
+            # ordering field would, so a tampered one can't reach the query
+            cursor["pk"] = queryset.model._meta.pk.to_python(cursor["pk"])
+            if self.key != "pk":
+                cursor["v"] = self.key_field(queryset).to_python(cursor["v"])
+            if cursor["pk"] is None or cursor["v"] is None:
+                raise ValueError
+        except (TypeError, ValueError, UnicodeError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def encode_cursor(self, instance, reverse):
+        value = instance.pk if self.key == "pk" else getattr(instance, self.key)
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            value = value.isoformat()
+        elif isinstance(value, Decimal):
+            value = str(value)
+
+        payload = json.dumps({"v": value, "pk": instance.pk, "r": reverse}, separators=(",", ":"))
+        encoded = base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.request.build_absolute_uri(), self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            "results": data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class PageOrCursorPagination(PageNumberPagination):
+    """
+    Page-number pagination (with total ``count``) unless the client opts in to
+    keyset pagination with ``?pagination=cursor`` or by following a ``cursor``
+    link, which is what infinite scroll should use.
+    """
+    mode_query_param = "pagination"
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == "cursor"
+            or KeysetPagination.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = KeysetPagination() if self.use_cursor(request) else None
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -6,6 +6,8 @@ from django.urls import reverse
 import requests as req
 from django.db import transaction
 
+from administrator.models import User
+from aso.cart_store import cart_store
 from aso.models import Cart, Order, OrderItem, OrderTracking, PaymentDetail, ShippingAddress
 
 def initiate(request, user, cart_id, data):
@@ -22,7 +24,9 @@ def initiate(request, user, cart_id, data):
         "reference": ref,
         "metadata": {
             "data": json.loads(json.dumps(data, default=str)),
-            "cart_id":cart_id
+            "cart_id":cart_id,
+            # The Redis cart store has no cart ids; checkout finds the cart by user
+            "user_id": user.id,
         },
         "callback_url": redirect_url,
     }
@@ -53,31 +57,38 @@ def validate(reference):
     if response.status_code == 200 and result['data']['status'] == 'success':
         metadata = result['data'].get('metadata', {})
         cart_id = metadata.get('cart_id')
+        user_id = metadata.get('user_id')
         data = metadata.get('data', {})
         
         try:
             with transaction.atomic():
-                cart = Cart.objects.get(id=cart_id)
-                user = cart.user
+                if user_id is None:
+                    # Started before user_id was sent along
+                    user_id = Cart.objects.values_list('user_id', flat=True).get(id=cart_id)
+                user = User.objects.get(pk=user_id)
+                checkout = cart_store().checkout_cart(user)
+                if checkout is None:
+                    raise Cart.DoesNotExist("Cart not found.")
+                cart, pricing = checkout
 
                 # 1. Create Order
                 order = Order.objects.create(
                     user=user,
-                    subtotal=cart.subtotal(),
-                    shipping_fee=cart.shipping_cost(),
-                    discount=cart.discount(),
-                    total=cart.total(),
+                    subtotal=pricing.subtotal,
+                    shipping_fee=pricing.shipping,
+                    discount=pricing.discount,
+                    total=pricing.total,
                     other_info = data.get("otherInfo")
                 )
 
                 # 2. Create Order Items
-                for item in cart.items.all():
+                for line in pricing.lines:
                     OrderItem.objects.create(
                         order=order,
-                        product=item.product,
-                        quantity=item.quantity,
-                        price=item.product.current_price,  # snapshot
-                        desc = item.desc
+                        product=line.item.product,
+                        quantity=line.quantity,
+                        price=line.unit_price,  # snapshot
+                        desc = line.item.desc
                     )
 
                 # 3. Save Shipping Address
@@ -105,8 +116,7 @@ def validate(reference):
                 )
 
                 # 4. Delete Cart and Items
-                cart.items.all().delete()
-                cart.delete()
+                cart_store().clear(user)
                 
                 
             return {
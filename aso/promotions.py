@@ -0,0 +1,200 @@
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .cache import PROMOTIONS, bump_version, read_version
+
+CENT = Decimal("0.01")
+
+# Promotions index
+#
+# The active Promotion rows are compiled once into dictionaries keyed by
+# product id, category id and state, so evaluating a cart only looks up the
+# rules that can apply to each line: O(items), not O(rules x items). Each
+# process keeps its index until the shared promotions version (a CacheVersion
+# row, bumped by the Promotion signals) moves or a rule's start/end time
+# passes.
+
+def promotions_version(request=None):
+    return read_version(PROMOTIONS, request)[0]
+
+
+def bump_promotions_version():
+    # In the writing transaction, like the catalog version (aso/cache.py)
+    bump_version(PROMOTIONS)
+
+
+@dataclass(frozen=True)
+class Rule:
+    id: int
+    name: str
+    kind: str
+    percent_off: int = 0
+    buy_quantity: int = 0
+    get_quantity: int = 0
+    min_subtotal: Decimal = None
+
+    def line_discount(self, unit_price, quantity):
+        if self.kind == "percent_off":
+            return unit_price * quantity * Decimal(self.percent_off) / Decimal("100")
+        if self.kind == "buy_x_get_y" and self.buy_quantity and self.get_quantity:
+            free_units = quantity // (self.buy_quantity + self.get_quantity) * self.get_quantity
+            return unit_price * free_units
+        return Decimal("0")
+
+
+@dataclass
+class PromotionResult:
+    item_discount: Decimal = Decimal("0.00")
+    shipping_discount: Decimal = Decimal("0.00")
+    # {"id", "name", "amount"} per promotion that took effect
+    applied: list = field(default_factory=list)
+
+    @property
+    def discount(self):
+        return self.item_discount + self.shipping_discount
+
+
+class PromotionIndex:
+    """Line rules by scope, shipping rules by state."""
+
+    def __init__(self, rules, product_ids, category_ids, states, version, valid_until, built_at=None):
+        self.version = version
+        self.valid_until = valid_until
+        # Never earlier than the change that made the previous index stale
+        self.built_at = built_at or timezone.now()
+        self.rule_ids = tuple(sorted(rules))
+        self.by_product = defaultdict(list)
+        self.by_category = defaultdict(list)
+        self.everywhere = []
+        self.shipping_by_state = defaultdict(list)
+        self.shipping_everywhere = []
+
+        for rule_id, rule in rules.items():
+            if rule.kind == "free_shipping":
+                if states[rule_id]:
+                    for state in states[rule_id]:
+                        self.shipping_by_state[state.lower()].append(rule)
+                else:
+                    self.shipping_everywhere.append(rule)
+                continue
+            if not product_ids[rule_id] and not category_ids[rule_id]:
+                self.everywhere.append((rule, states[rule_id]))
+            for product_id in product_ids[rule_id]:
+                self.by_product[product_id].append((rule, states[rule_id]))
+            for category_id in category_ids[rule_id]:
+                self.by_category[category_id].append((rule, states[rule_id]))
+
+    def is_current(self, version, now):
+        return version == self.version and (self.valid_until is None or now < self.valid_until)
+
+    def _line_rules(self, product_id, category_ids):
+        yield from self.by_product.get(product_id, ())
+        for category_id in category_ids:
+            yield from self.by_category.get(category_id, ())
+        yield from self.everywhere
+
+    def evaluate(self, lines, state, subtotal, shipping):
+        """
+        ``lines`` are (product_id, category_ids, unit_price, quantity).
+        Each line gets the single best rule that applies to it; free
+        shipping discounts the whole shipping fee.
+        """
+        state_key = (state or "").lower()
+        amounts = defaultdict(Decimal)
+        names = {}
+
+        item_discount = Decimal("0")
+        for product_id, category_ids, unit_price, quantity in lines:
+            best, best_amount = None, Decimal("0")
+            for rule, states in self._line_rules(product_id, category_ids):
+                if states and state_key not in states:
+                    continue
+                amount = rule.line_discount(unit_price, quantity)
+                if amount > best_amount:
+                    best, best_amount = rule, amount
+            if best is not None:
+                item_discount += best_amount
+                amounts[best.id] += best_amount
+                names[best.id] = best.name
+
+        shipping_discount = Decimal("0")
+        for rule in self.shipping_by_state.get(state_key, []) + self.shipping_everywhere:
+            if shipping and (rule.min_subtotal is None or subtotal >= rule.min_subtotal):
+                shipping_discount = shipping
+                amounts[rule.id] += shipping
+                names[rule.id] = rule.name
+                break
+
+        return PromotionResult(
+            item_discount=min(item_discount, subtotal).quantize(CENT, rounding=ROUND_HALF_UP),
+            shipping_discount=Decimal(shipping_discount).quantize(CENT, rounding=ROUND_HALF_UP),
+            applied=[
+                {"id": rule_id, "name": names[rule_id], "amount": amount.quantize(CENT, rounding=ROUND_HALF_UP)}
+                for rule_id, amount in sorted(amounts.items())
+            ],
+        )
+
+
+def build_index(version, now=None):
+    """Compile the promotions active at ``now``: four queries."""
+    from .models import Promotion
+
+    now = now or timezone.now()
+    promotions = Promotion.objects.filter(is_active=True)
+    live = promotions.filter(
+        Q(starts_at__isnull=True) | Q(starts_at__lte=now),
+        Q(ends_at__isnull=True) | Q(ends_at__gt=now),
+    )
+
+    rules, states = {}, {}
+    for promotion in live:
+        rules[promotion.id] = Rule(
+            id=promotion.id,
+            name=promotion.name,
+            kind=promotion.kind,
+            percent_off=min(promotion.percent_off or 0, 100),
+            buy_quantity=promotion.buy_quantity or 0,
+            get_quantity=promotion.get_quantity or 0,
+            min_subtotal=promotion.min_subtotal,
+        )
+        states[promotion.id] = {state.lower() for state in promotion.states or ()}
+
+    product_ids, category_ids = defaultdict(set), defaultdict(set)
+    for promotion_id, product_id in Promotion.products.through.objects.filter(
+        promotion_id__in=rules
+    ).values_list("promotion_id", "product_id"):
+        product_ids[promotion_id].add(product_id)
+    for promotion_id, category_id in Promotion.categories.through.objects.filter(
+        promotion_id__in=rules
+    ).values_list("promotion_id", "category_id"):
+        category_ids[promotion_id].add(category_id)
+
+    # The index goes stale when the next scheduled rule starts or a live one ends
+    boundaries = []
+    windows = promotions.filter(Q(starts_at__gt=now) | Q(ends_at__gt=now)).values_list("starts_at", "ends_at")
+    for starts_at, ends_at in windows:
+        boundaries.extend(moment for moment in (starts_at, ends_at) if moment is not None and moment > now)
+    return PromotionIndex(rules, product_ids, category_ids, states, version, min(boundaries, default=None), now)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def promotion_index(request=None):
+    """The process's compiled index, rebuilt when rules or their windows change."""
+    global _index
+    version = promotions_version(request)
+    now = timezone.now()
+    index = _index
+    if index is None or not index.is_current(version, now):
+        with _lock:
+            index = _index
+            if index is None or not index.is_current(version, now):
+                index = _index = build_index(version, now)
+    return index
@@ -0,0 +1,171 @@
+from collections import Counter, defaultdict
+from itertools import combinations
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+
+from .models import Order, OrderItem, Product, RelatedProduct
+
+# Related products.
+#
+# The product page reads its neighbours from the RelatedProduct table
+# instead of scoring them per request. The table is built by
+# `manage.py rebuild_related_products`: migrate seeds it once (see
+# seed_related_products), then a scheduled `rebuild_related_products
+# --changed` (e.g. every 15 minutes from cron or the platform scheduler)
+# picks up edited products and new orders, and a nightly full rebuild
+# catches everything else.
+
+# How many neighbours are kept per product
+RELATED_PRODUCTS_LIMIT = 8
+
+# Score = shared categories * CATEGORY_WEIGHT + orders bought together * CO_PURCHASE_WEIGHT
+CATEGORY_WEIGHT = 1.0
+CO_PURCHASE_WEIGHT = 2.0
+
+# Only the newest products of each category compete on category overlap, so
+# a category with thousands of products doesn't make the rebuild quadratic.
+CATEGORY_CANDIDATES = 100
+
+CHUNK_SIZE = 500
+
+
+def _category_maps(product_ids=None):
+    """
+    Categories of the displayed products (of ``product_ids`` when given) and
+    the newest CATEGORY_CANDIDATES displayed members of those categories.
+    """
+    through = Product.category.through.objects.filter(product__display_product=True)
+    categories_of = defaultdict(set)
+    members = defaultdict(list)
+
+    if product_ids is None:
+        for product_id, category_id in through.order_by("-product_id").values_list("product_id", "category_id"):
+            categories_of[product_id].add(category_id)
+            if len(members[category_id]) < CATEGORY_CANDIDATES:
+                members[category_id].append(product_id)
+        return categories_of, members
+
+    for product_id, category_id in through.filter(product_id__in=product_ids).values_list("product_id", "category_id"):
+        categories_of[product_id].add(category_id)
+    candidates = (
+        through.filter(category_id__in={category for ids in categories_of.values() for category in ids})
+        .annotate(position=Window(RowNumber(), partition_by=F("category_id"), order_by=F("product_id").desc()))
+        .filter(position__lte=CATEGORY_CANDIDATES)
+        .order_by("category_id", "position")
+    )
+    for product_id, category_id in candidates.values_list("product_id", "category_id"):
+        members[category_id].append(product_id)
+    return categories_of, members
+
+
+def _co_purchases(product_ids=None):
+    items = OrderItem.objects.all()
+    if product_ids is not None:
+        items = items.filter(order__in=OrderItem.objects.filter(product_id__in=product_ids).values("order_id"))
+
+    baskets = defaultdict(set)
+    for order_id, product_id in items.order_by().values_list("order_id", "product_id").iterator(chunk_size=2000):
+        baskets[order_id].add(product_id)
+
+    pairs = defaultdict(Counter)
+    for basket in baskets.values():
+        for a, b in combinations(basket, 2):
+            pairs[a][b] += 1
+            pairs[b][a] += 1
+    return pairs
+
+
+def score_neighbours(product_id, categories_of, members, pairs, displayed, limit):
+    scores = Counter()
+    for category_id in categories_of.get(product_id, ()):
+        for other in members[category_id]:
+            scores[other] += CATEGORY_WEIGHT
+    for other, count in pairs.get(product_id, {}).items():
+        scores[other] += CO_PURCHASE_WEIGHT * count
+
+    scores.pop(product_id, None)
+    ranked = sorted(
+        ((score, other) for other, score in scores.items() if other in displayed),
+        key=lambda entry: (-entry[0], -entry[1]),
+    )
+    return ranked[:limit]
+
+
+def rebuild_related_products(product_ids=None, limit=RELATED_PRODUCTS_LIMIT):
+    """
+    Recompute the neighbours of ``product_ids`` (every product when None).
+    Returns the number of products rebuilt.
+    """
+    categories_of, members = _category_maps(product_ids)
+    pairs = _co_purchases(product_ids)
+
+    displayed = Product.objects.filter(display_product=True).values_list("id", flat=True)
+    if product_ids is None:
+        targets = sorted(Product.objects.values_list("id", flat=True))
+        displayed = set(displayed)
+    else:
+        targets = sorted(set(product_ids))
+        # Category members are displayed already; only co-purchases need checking
+        bought_with = {other for product_id in targets for other in pairs.get(product_id, ())}
+        displayed = set(displayed.filter(id__in=bought_with))
+        displayed.update(product_id for ids in members.values() for product_id in ids)
+
+    for start in range(0, len(targets), CHUNK_SIZE):
+        chunk = targets[start:start + CHUNK_SIZE]
+        rows = [
+            RelatedProduct(product_id=product_id, related_id=other, score=score, rank=rank)
+            for product_id in chunk
+            for rank, (score, other) in enumerate(
+                score_neighbours(product_id, categories_of, members, pairs, displayed, limit)
+            )
+        ]
+        with transaction.atomic():
+            RelatedProduct.objects.filter(product_id__in=chunk).delete()
+            RelatedProduct.objects.bulk_create(rows)
+    return len(targets)
+
+
+def changed_product_ids():
+    """
+    Products whose neighbours may have moved since the last build: products
+    edited or created since then, products in orders placed since then, and
+    the products sharing a category with an edited one.
+    """
+    last_build = RelatedProduct.objects.aggregate(last=Max("built_at"))["last"]
+    if last_build is None:
+        return None
+
+    touched = set(Product.objects.filter(updated_at__gt=last_build).values_list("id", flat=True))
+    touched.update(
+        OrderItem.objects.filter(order__in=Order.objects.filter(created_at__gt=last_build))
+        .values_list("product_id", flat=True)
+    )
+    if touched:
+        through = Product.category.through.objects
+        touched.update(
+            through.filter(category_id__in=through.filter(product_id__in=touched).values("category_id"))
+            .values_list("product_id", flat=True)
+        )
+    return touched
+
+
+def fully_migrated(using=DEFAULT_DB_ALIAS):
+    """Whether every migration is applied, so the tables match the models."""
+    executor = MigrationExecutor(connections[using])
+    return not executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def seed_related_products(using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate: build the table if it has never been built, so a new
+    deployment has related products before the first scheduled rebuild.
+    Skipped after migrating to an earlier state (``migrate aso 0022``),
+    where the tables it reads may not exist yet.
+    """
+    if using != DEFAULT_DB_ALIAS or not fully_migrated(using) or RelatedProduct.objects.exists():
+        return
+    if Product.objects.filter(display_product=True).exists():
+        rebuild_related_products()
@@ -0,0 +1,131 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, DecimalField, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Round
+from django.db.models.lookups import GreaterThan
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import PriceCampaign, PriceCampaignItem, Product
+
+# Bulk repricing.
+#
+# A PriceCampaign sets discount_percent and current_price on its whole
+# product selection with one UPDATE (which ProductQuerySet copies to the
+# product cards), using the same rule as Product.save(). The discount each
+# product had before is kept in PriceCampaignItem rows, so reverting is one
+# UPDATE too.
+
+
+def discounted_price_expression(discount):
+    """
+    models.discounted_price() as a database expression over
+    ``original_price``. It works in whole cents so the half-up rounding is
+    exact on every backend (SQLite stores decimals as floats).
+    """
+    original = F('original_price')
+    cents = Cast(Round(original * 100), BigIntegerField())
+    # Integer division: adding half a cent first rounds half up
+    discounted_cents = Cast((cents * (100 - discount) + 50) / 100, BigIntegerField())
+    return Case(
+        When(GreaterThan(discount, 0), then=discounted_cents * Value(Decimal('0.01'))),
+        default=original,
+        output_field=DecimalField(max_digits=10, decimal_places=2),
+    )
+
+
+def campaign_products(filters):
+    products = Product.objects.all()
+    if filters.get('category'):
+        products = products.filter(category__name__in=filters['category'])
+    if filters.get('badge'):
+        products = products.filter(badge__in=filters['badge'])
+    if filters.get('ids'):
+        products = products.filter(id__in=filters['ids'])
+    return products
+
+
+def apply_campaign(campaign):
+    """
+    Apply a scheduled campaign now; returns the number of products
+    repriced. Products already under another active campaign are skipped.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not PriceCampaign.objects.filter(pk=campaign.pk, status='scheduled').update(status='active', applied_at=now):
+            return 0
+
+        busy = PriceCampaignItem.objects.filter(campaign__status='active').exclude(campaign=campaign)
+        targets = campaign_products(campaign.filters).exclude(pk__in=busy.values('product_id'))
+        PriceCampaignItem.objects.bulk_create(
+            [
+                PriceCampaignItem(campaign=campaign, product_id=product_id, previous_discount_percent=previous)
+                for product_id, previous in targets.order_by().values_list('id', 'discount_percent').distinct()
+            ],
+            batch_size=1000,
+        )
+
+        selected = PriceCampaignItem.objects.filter(campaign=campaign).values('product_id')
+        discount = Value(campaign.discount_percent)
+        count = Product.objects.filter(pk__in=selected).update(
+            discount_percent=discount, current_price=discounted_price_expression(discount), updated_at=now
+        )
+        PriceCampaign.objects.filter(pk=campaign.pk).update(products_count=count)
+        bump_catalog_version()
+    return count
+
+
+def revert_campaign(campaign):
+    """
+    Restore the discounts an active campaign replaced; returns the number of
+    products reverted. Products whose discount was changed since keep it.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        if not PriceCampaign.objects.filter(pk=campaign.pk, status='active').update(status='reverted', reverted_at=now):
+            return 0
+
+        items = PriceCampaignItem.objects.filter(campaign=campaign)
+        previous = Subquery(items.filter(product=OuterRef('pk')).values('previous_discount_percent')[:1])
+        still_discounted = {'pk__in': items.values('product_id'), 'discount_percent': campaign.discount_percent}
+        count = Product.objects.filter(**still_discounted).update(
+            discount_percent=previous, current_price=discounted_price_expression(previous), updated_at=now
+        )
+        bump_catalog_version()
+    return count
+
+
+def cancel_campaign(campaign):
+    """Drop a campaign that hasn't started; returns whether it was scheduled."""
+    return bool(PriceCampaign.objects.filter(pk=campaign.pk, status='scheduled').update(status='cancelled'))
+
+
+def create_campaign(name, discount_percent, filters, starts_at=None, ends_at=None, user=None):
+    """Record a campaign and apply it straight away unless it starts later."""
+    now = timezone.now()
+    campaign = PriceCampaign.objects.create(
+        name=name,
+        discount_percent=discount_percent,
+        filters=filters,
+        starts_at=starts_at or now,
+        ends_at=ends_at,
+        created_by=user,
+    )
+    if campaign.starts_at <= now:
+        apply_campaign(campaign)
+        campaign.refresh_from_db()
+    return campaign
+
+
+def run_due_campaigns():
+    """Apply campaigns whose start has passed and revert those that ended."""
+    now = timezone.now()
+    applied = reverted = 0
+    for campaign in PriceCampaign.objects.filter(status='scheduled', starts_at__lte=now).order_by('starts_at'):
+        apply_campaign(campaign)
+        applied += 1
+    for campaign in PriceCampaign.objects.filter(status='active', ends_at__lte=now).order_by('ends_at'):
+        revert_campaign(campaign)
+        reverted += 1
+    return applied, reverted
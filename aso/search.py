@@ -0,0 +1,166 @@
+import re
+
+from django.db import connections
+from django.db.models import F, FloatField, Func, Q
+from django.db.models.expressions import RawSQL
+
+# Catalog search index.
+#
+# SQLite keeps an FTS5 virtual table whose rowid is the product id, PostgreSQL
+# keeps a tsvector column behind a GIN index. Both are filled from the product
+# title, product number and category names and kept in sync by the receivers
+# in aso/signals.py; migration 0023 creates and first fills them. Other
+# backends fall back to the old icontains lookups.
+
+SEARCH_TABLE = "aso_product_search"
+
+# bm25 / setweight column weights: title, product_number, category names
+SQLITE_WEIGHTS = (10.0, 5.0, 2.0)
+
+
+def _vendor(using):
+    return connections[using].vendor
+
+
+def search_terms(term):
+    return re.findall(r"\w+", term or "", re.UNICODE)
+
+
+def _sqlite_match(terms):
+    # Quote every token so user input can never be read as FTS5 syntax, and
+    # prefix match so "aso ok" still finds "Aso Oke".
+    return " ".join('"%s"*' % t for t in terms)
+
+
+def _postgres_match(terms):
+    return " & ".join("%s:*" % t for t in terms)
+
+
+class _SearchRank(Func):
+    """
+    The rank of the product id in ``expression``: ``template`` is a
+    subquery over the search table with ``{id}`` for that id and one
+    ``%s`` for ``match``.
+    """
+
+    output_field = FloatField()
+
+    def __init__(self, expression, template, match):
+        super().__init__(expression)
+        self.template, self.match = template, match
+
+    def as_sql(self, compiler, connection, **extra_context):
+        sql, params = compiler.compile(self.source_expressions[0])
+        return "(%s)" % self.template.format(id=sql), (self.match, *params)
+
+
+# icontains lookups used where there is no index; only those naming a field
+# of the searched model apply (Product has category, ProductCard category_names)
+FALLBACK_LOOKUPS = ("title", "product_number", "category__name", "category_names")
+
+
+def search_products(queryset, term, id_field="pk"):
+    """
+    Restrict ``queryset`` to products matching ``term`` and annotate it with
+    ``search_rank`` (lower is more relevant), ordered by relevance.
+
+    ``id_field`` is the field holding the product id, for querysets over
+    models keyed by product rather than Product itself.
+    """
+    terms = search_terms(term)
+    if not terms:
+        return queryset
+
+    vendor = _vendor(queryset.db)
+
+    # Matching products are picked by an id__in subquery over the index and
+    # ranked by a correlated subquery, so the result is a plain queryset
+    # that composes with any other filter, annotation or subquery use.
+    if vendor == "sqlite":
+        match = _sqlite_match(terms)
+        weights = ", ".join(str(w) for w in SQLITE_WEIGHTS)
+        matching = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+        rank = (
+            f"SELECT bm25({SEARCH_TABLE}, {weights}) FROM {SEARCH_TABLE} "
+            f"WHERE {SEARCH_TABLE} MATCH %s AND rowid = {{id}}"
+        )
+    elif vendor == "postgresql":
+        match = _postgres_match(terms)
+        matching = f"SELECT product_id FROM {SEARCH_TABLE} WHERE document @@ to_tsquery('simple', %s)"
+        rank = (
+            f"SELECT -ts_rank(document, to_tsquery('simple', %s)) FROM {SEARCH_TABLE} "
+            "WHERE product_id = {id}"
+        )
+    else:
+        match = None
+
+    if match is not None:
+        return queryset.filter(
+            **{f"{id_field}__in": RawSQL(matching, [match])}
+        ).annotate(
+            search_rank=_SearchRank(F(id_field), rank, match)
+        ).order_by("search_rank")
+
+    fields = {field.name for field in queryset.model._meta.get_fields()}
+    matches = Q()
+    for lookup in FALLBACK_LOOKUPS:
+        if lookup.split("__")[0] in fields:
+            matches |= Q(**{f"{lookup}__icontains": term})
+    return queryset.filter(matches).distinct()
+
+
+def _documents(product_ids, using):
+    from aso.models import Product
+
+    categories = {}
+    through = Product.category.through.objects.using(using)
+    for product_id, name in through.filter(product_id__in=product_ids).values_list("product_id", "category__name"):
+        categories.setdefault(product_id, []).append(name)
+
+    return [
+        (product_id, title or "", number or "", " ".join(categories.get(product_id, [])))
+        for product_id, title, number in Product.objects.using(using).filter(
+            id__in=product_ids
+        ).values_list("id", "title", "product_number")
+    ]
+
+
+def index_products(product_ids, using="default"):
+    """(Re)build the search documents of the given products."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+
+    vendor = _vendor(using)
+    if vendor not in ("sqlite", "postgresql"):
+        return
+
+    rows = _documents(product_ids, using)
+    with connections[using].cursor() as cursor:
+        if vendor == "sqlite":
+            unindex_products(product_ids, using=using)
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, title, product_number, category_names) VALUES (%s, %s, %s, %s)",
+                rows,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (product_id, document) VALUES (%s, "
+                "setweight(to_tsvector('simple', %s), 'A') || "
+                "setweight(to_tsvector('simple', %s), 'B') || "
+                "setweight(to_tsvector('simple', %s), 'C')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+
+def unindex_products(product_ids, using="default"):
+    product_ids = list(product_ids)
+    vendor = _vendor(using)
+    if not product_ids or vendor not in ("sqlite", "postgresql"):
+        return
+
+    column = "rowid" if vendor == "sqlite" else "product_id"
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE {column} IN ({placeholders})", product_ids)
@@ -1,6 +1,25 @@
 from rest_framework import serializers
-from .models import Cart, CartItem, Category, Order, OrderItem, OrderTracking, PaymentDetail, Product, ProductColor, ProductDetail, ProductImage, ProductSize, ShippingAddress, WatchList
+from .models import Cart, CartItem, Category, ImportJob, Order, OrderItem, OrderTracking, PaymentDetail, Product, ProductCard, ProductColor, ProductDetail, ProductImage, ProductSize, RelatedProduct, ShippingAddress, WatchList
 from django.utils.timesince import timesince
+from django.conf import settings
+from .images import srcset
+
+
+def watchlisted_ids(context):
+    """
+    Product ids on the requesting user's watchlist, loaded with a single query
+    and kept on the serializer context so every row of a page shares it.
+    """
+    if "watchlisted_ids" not in context:
+        request = context.get("request")
+        if request and request.user and request.user.is_authenticated:
+            context["watchlisted_ids"] = set(
+                WatchList.objects.filter(user=request.user).order_by().values_list("product_id", flat=True)
+            )
+        else:
+            context["watchlisted_ids"] = set()
+    return context["watchlisted_ids"]
+
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.title')
@@ -88,6 +107,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
 class WatchlistProductSerializer(serializers.ModelSerializer):
     current_price = serializers.SerializerMethodField()
     short_description = serializers.SerializerMethodField()
+    main_image_srcset = serializers.SerializerMethodField()
     watchlisted = serializers.SerializerMethodField()
 
     class Meta:
@@ -98,6 +118,7 @@ class WatchlistProductSerializer(serializers.ModelSerializer):
             'short_description',
             'badge',
             'main_image',
+            'main_image_srcset',
             'current_price',
             'original_price',
             'discount_percent',
@@ -111,12 +132,33 @@ class WatchlistProductSerializer(serializers.ModelSerializer):
     
     def get_short_description(self, obj):
         return obj.description[:80] + "..." if len(obj.description) > 80 else obj.description
+
+    def get_main_image_srcset(self, obj):
+        return srcset(self.context.get('request'), obj.main_image, obj.main_image_variants)
     
     def get_watchlisted(self, obj):
-        request = self.context.get("request")
-        if request and request.user and request.user.is_authenticated:
-            return WatchList.objects.filter(user=request.user, product=obj).exists()
-        return False
+        return obj.id in watchlisted_ids(self.context)
+
+
+class ProductCardSerializer(serializers.ModelSerializer):
+    """Same payload as WatchlistProductSerializer, read from the ProductCard table."""
+    id = serializers.IntegerField(source='product_id')
+    current_price = serializers.SerializerMethodField()
+    main_image_srcset = serializers.SerializerMethodField()
+    watchlisted = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductCard
+        fields = WatchlistProductSerializer.Meta.fields
+
+    def get_current_price(self, obj):
+        return float(obj.current_price)
+
+    def get_main_image_srcset(self, obj):
+        return srcset(self.context.get('request'), obj.main_image, obj.main_image_variants)
+
+    def get_watchlisted(self, obj):
+        return obj.product_id in watchlisted_ids(self.context)
 
     
 
@@ -162,11 +204,16 @@ class CartItemSerializer(serializers.ModelSerializer):
 
 
 class CartDetailSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
+    """
+    Renders the cart from its CartPricing snapshot: pass it in the context
+    as ``pricing``, or it is computed once from the cart.
+    """
+    items = serializers.SerializerMethodField()
     subtotal = serializers.SerializerMethodField()
     # tax = serializers.SerializerMethodField()
     shipping = serializers.SerializerMethodField()
     discount = serializers.SerializerMethodField()
+    promotions = serializers.SerializerMethodField()
     total = serializers.SerializerMethodField()
 
     class Meta:
@@ -178,23 +225,33 @@ class CartDetailSerializer(serializers.ModelSerializer):
             'shipping',
             # 'tax',
             'discount',
+            'promotions',
             'total',
         ]
 
+    def pricing(self, obj):
+        return self.context.get('pricing') or obj.pricing()
+
+    def get_items(self, obj):
+        return CartItemSerializer(self.pricing(obj).items, many=True, context=self.context).data
+
     def get_subtotal(self, obj):
-        return obj.subtotal()
+        return self.pricing(obj).subtotal
 
     def get_shipping(self, obj):
-        return obj.shipping_cost()
+        return self.pricing(obj).shipping
 
     # def get_tax(self, obj):
     #     return obj.tax()
 
     def get_discount(self, obj):
-        return obj.discount()
+        return self.pricing(obj).discount
+
+    def get_promotions(self, obj):
+        return self.pricing(obj).promotions.applied
 
     def get_total(self, obj):
-        return obj.total()
+        return self.pricing(obj).total
     
     
 class CategoriesSerializer(serializers.ModelSerializer):
@@ -216,6 +273,36 @@ class UpdateDescSerializer(serializers.Serializer):
 class DeleteItemFromCartSerializer(serializers.Serializer):
     item_id = serializers.IntegerField()
 
+class CartOperationSerializer(serializers.Serializer):
+    """One edit of a cart/batch/ request."""
+    REQUIRED = {
+        'add': ['product_id'],
+        'update_quantity': ['item_id', 'quantity'],
+        'update_desc': ['item_id', 'desc'],
+        'remove': ['item_id'],
+        'set_state': ['state'],
+    }
+
+    op = serializers.ChoiceField(choices=list(REQUIRED))
+    product_id = serializers.IntegerField(required=False)
+    item_id = serializers.IntegerField(required=False)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    desc = serializers.JSONField(required=False)
+    state = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        missing = [name for name in self.REQUIRED[attrs['op']] if attrs.get(name) is None]
+        if missing:
+            raise serializers.ValidationError({name: 'This field is required.' for name in missing})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = serializers.ListField(
+        child=CartOperationSerializer(), allow_empty=False, max_length=settings.CART_BATCH_MAX_OPERATIONS
+    )
+
+
 class CartAndWatchlistCountSerializer(serializers.Serializer):
     item_count = serializers.IntegerField()
     watchlist_count = serializers.IntegerField()
@@ -260,48 +347,16 @@ class ProductImportSerializer(serializers.Serializer):
     colors = ProductColorSerializer(many=True)
     details = ProductDetailSerializer(many=True)
 
-    def create(self, validated_data):
-        from decimal import Decimal
-
-        category_names = validated_data.pop('category')
-        size_list = validated_data.pop('sizes')
-        color_list = validated_data.pop('colors')
-        details_list = validated_data.pop('details')
-
-        # Handle categories
-        product = Product.objects.create(
-            title=validated_data['title'],
-            description=validated_data['description'],
-            original_price=validated_data['original_price'],
-            discount_percent=validated_data['discount_percent'],
-            rating=validated_data['rating'],
-            display_product = False
-        )
-        for cat_name in category_names:
-            category_obj, _ = Category.objects.get_or_create(name=cat_name)
-            product.category.add(category_obj)
-
-        # Handle sizes
-        for size_label in size_list:
-            ProductSize.objects.create(product=product, size_label=size_label)
-
-        # Handle colors
-        for color in color_list:
-            ProductColor.objects.create(product=product, color_name=color['name'], hex_code=color.get('hex'))
-
-        # Handle details
-        for detail in details_list:
-            ProductDetail.objects.create(
-                product=product,
-                tab=detail['tab'],
-                title=detail['tab'].capitalize(),
-                content=detail['content']
-            )
-
-        return product
-
 
+class ImportJobSerializer(serializers.ModelSerializer):
+    errors = serializers.JSONField(source='row_errors', read_only=True)
 
+    class Meta:
+        model = ImportJob
+        fields = [
+            'id', 'status', 'total_rows', 'next_index', 'rows_done', 'rows_failed', 'throughput',
+            'errors', 'error', 'cancel_requested', 'created_at', 'started_at', 'finished_at',
+        ]
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -329,16 +384,22 @@ class ProductDetailByIdSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['image', 'alt_text']
+        fields = ['image', 'srcset', 'alt_text']
+
+    def get_srcset(self, obj):
+        return srcset(self.context.get('request'), obj.image, obj.variants)
         
         
 class RelatedProductSerializer(serializers.ModelSerializer):
     product_image = serializers.SerializerMethodField() 
+    product_image_srcset = serializers.SerializerMethodField()
     class Meta:
         model = Product
-        fields = ['id','title', 'product_image','current_price',]
+        fields = ['id','title', 'product_image', 'product_image_srcset', 'current_price',]
         
     def get_product_image(self, obj):
         request = self.context.get('request')
@@ -346,6 +407,9 @@ class RelatedProductSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.main_image.url)
         return None
 
+    def get_product_image_srcset(self, obj):
+        return srcset(self.context.get('request'), obj.main_image, obj.main_image_variants)
+
 
 class ProductDetailFullSerializer(serializers.ModelSerializer):
     category = CategorySerializer(many=True)
@@ -353,30 +417,41 @@ class ProductDetailFullSerializer(serializers.ModelSerializer):
     sizes = ProductSizeSerializer(many=True)
     details = ProductDetailByIdSerializer(many=True)
     images = ProductImageSerializer(many=True)
+    main_image_srcset = serializers.SerializerMethodField()
     related_products = serializers.SerializerMethodField()
     watchlisted = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
-            'id', 'product_number', 'title', 'description', 'badge', 'main_image',
+            'id', 'product_number', 'title', 'description', 'badge', 'main_image', 'main_image_srcset',
             'current_price', 'original_price', 'discount_percent',
             'rating', 'reviews_count', 'category', 'colors', 'sizes',
             'details', 'images', 'related_products', 'watchlisted', 'created_at'
         ]
         
+    def get_main_image_srcset(self, obj):
+        return srcset(self.context.get('request'), obj.main_image, obj.main_image_variants)
+
     def get_related_products(self, obj):
-        return RelatedProductSerializer(
-            Product.objects.filter(
-                category__in=obj.category.all()
+        # Precomputed by the rebuild_related_products command; ProductDetailView
+        # prefetches them as ranked_related
+        links = getattr(obj, 'ranked_related', None)
+        if links is None:
+            links = (
+                RelatedProduct.objects.filter(product=obj, related__display_product=True)
+                .select_related('related')
+                .order_by('rank')[:8]
             )
-            .exclude(id=obj.id)
-            .distinct()[:8],
+        return RelatedProductSerializer(
+            [link.related for link in links],
             many=True,
             context=self.context
         ).data
         
     def get_watchlisted(self, obj):
+        if hasattr(obj, 'is_watchlisted'):
+            return obj.is_watchlisted
         request = self.context.get("request")
         if request and request.user and request.user.is_authenticated:
             return WatchList.objects.filter(user=request.user, product=obj).exists()
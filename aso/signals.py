@@ -1,9 +1,15 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.conf import settings
+from django.utils import timezone
 from django.forms import ValidationError
-from .models import OrderTracking
+from .cache import bump_catalog_version
+from .counters import cart_items_changed, watchlist_changed
+from .images import enqueue_variants
+from .models import Cart, CartItem, Category, OrderTracking, Product, ProductCard, ProductColor, ProductDetail, ProductImage, ProductSize, Promotion, WatchList
+from .promotions import bump_promotions_version
+from .search import index_products, unindex_products
 import textwrap
 
 @receiver(post_save, sender=OrderTracking)
@@ -72,4 +78,165 @@ def enforce_order_tracking_rules(sender, instance, **kwargs):
         else:
             # First status must be 'placed'
             if instance.status != 'placed':
-                raise ValidationError("First tracking status must be 'placed'.")
\ No newline at end of file
+                raise ValidationError("First tracking status must be 'placed'.")
+
+
+
+# PRODUCT IMAGES
+# A new photo queues its resized variants (aso/images.py). The row's variants
+# must be settled before the catalog read models below copy it, so these
+# receivers are registered first.
+
+@receiver(post_save, sender=Product)
+def product_image_variants(sender, instance, raw=False, using="default", **kwargs):
+    if raw:
+        return
+    variants = enqueue_variants(instance.main_image, instance.main_image_variants)
+    if variants != instance.main_image_variants:
+        instance.main_image_variants = variants
+        Product.objects.using(using).filter(pk=instance.pk).update(main_image_variants=variants)
+
+
+@receiver(post_save, sender=ProductImage)
+def gallery_image_variants(sender, instance, raw=False, using="default", **kwargs):
+    if raw:
+        return
+    variants = enqueue_variants(instance.image, instance.variants)
+    if variants != instance.variants:
+        instance.variants = variants
+        ProductImage.objects.using(using).filter(pk=instance.pk).update(variants=variants)
+
+
+# CATALOG READ MODELS
+# The search index and the product cards are both derived from Product and its
+# categories, so they are refreshed together.
+
+def sync_catalog(product_ids, using="default"):
+    product_ids = list(product_ids)
+    index_products(product_ids, using=using)
+    ProductCard.refresh(product_ids, using=using)
+
+
+@receiver(post_save, sender=Product)
+def sync_saved_product(sender, instance, raw=False, using="default", **kwargs):
+    if not raw:
+        sync_catalog([instance.id], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, using="default", **kwargs):
+    # The card goes with the product through its cascading foreign key
+    unindex_products([instance.id], using=using)
+
+
+@receiver(post_save, sender=Category)
+def sync_category_products(sender, instance, created, raw=False, using="default", **kwargs):
+    # A new category has no products yet; a renamed one changes their documents
+    if not created and not raw:
+        sync_catalog(instance.product.values_list("id", flat=True), using=using)
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_products(sender, instance, **kwargs):
+    instance._catalog_product_ids = list(instance.product.values_list("id", flat=True))
+
+
+@receiver(post_delete, sender=Category)
+def sync_after_category_delete(sender, instance, using="default", **kwargs):
+    sync_catalog(getattr(instance, "_catalog_product_ids", []), using=using)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def sync_product_categories(sender, instance, action, reverse, pk_set, using="default", **kwargs):
+    if action == "pre_clear" and reverse:
+        # Clearing from the category side: pk_set is not sent on post_clear
+        instance._catalog_product_ids = list(instance.product.values_list("id", flat=True))
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        product_ids = [instance.id]
+    elif action == "post_clear":
+        product_ids = getattr(instance, "_catalog_product_ids", [])
+    else:
+        product_ids = pk_set or []
+    sync_catalog(product_ids, using=using)
+
+
+# CATALOG VERSION
+# Any change to what the catalog endpoints render invalidates their caches.
+
+CATALOG_MODELS = (Product, Category, ProductImage, ProductColor, ProductSize, ProductDetail)
+
+
+def catalog_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_catalog_version()
+
+
+for model in CATALOG_MODELS:
+    post_save.connect(catalog_changed, sender=model, dispatch_uid="catalog_saved_%s" % model.__name__)
+    post_delete.connect(catalog_changed, sender=model, dispatch_uid="catalog_deleted_%s" % model.__name__)
+
+
+@receiver(m2m_changed, sender=Product.category.through)
+def catalog_categories_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_catalog_version()
+
+
+# CART
+# Cart.updated_at is what the cart ETag is built from, so item changes touch it.
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def touch_cart(sender, instance, raw=False, using="default", **kwargs):
+    if not raw:
+        Cart.objects.using(using).filter(pk=instance.cart_id).update(updated_at=timezone.now())
+
+
+# HEADER COUNTERS
+# UserCounter follows every cart item and watchlist row (aso/counters.py).
+
+@receiver(post_save, sender=CartItem)
+def count_cart_item(sender, instance, created, raw=False, using="default", **kwargs):
+    if created and not raw:
+        cart_items_changed(instance.cart_id, 1, using=using)
+
+
+@receiver(post_delete, sender=CartItem)
+def uncount_cart_item(sender, instance, using="default", **kwargs):
+    cart_items_changed(instance.cart_id, -1, using=using)
+
+
+@receiver(post_save, sender=WatchList)
+def count_watchlist_item(sender, instance, created, raw=False, using="default", **kwargs):
+    if created and not raw:
+        watchlist_changed(instance.user_id, 1, using=using)
+
+
+@receiver(post_delete, sender=WatchList)
+def uncount_watchlist_item(sender, instance, using="default", **kwargs):
+    watchlist_changed(instance.user_id, -1, using=using)
+
+
+# PROMOTIONS
+# Every process rebuilds its compiled promotion index (aso/promotions.py)
+# once the version moves.
+
+def promotions_changed(sender, raw=False, **kwargs):
+    if not raw:
+        bump_promotions_version()
+
+
+post_save.connect(promotions_changed, sender=Promotion, dispatch_uid="promotion_saved")
+post_delete.connect(promotions_changed, sender=Promotion, dispatch_uid="promotion_deleted")
+
+
+@receiver(m2m_changed, sender=Promotion.products.through)
+@receiver(m2m_changed, sender=Promotion.categories.through)
+def promotion_scope_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_promotions_version()
@@ -1,3 +1,1331 @@
-from django.test import TestCase
+import base64
+import json
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO
+from unittest import mock
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from administrator.models import User
+from aso import cart_store
+from aso.cache import ResponseCache, catalog_response_cache, catalog_version
+from aso.counters import product_views
+from aso.images import file_digest, process_image_jobs
+from aso.importer import ImportFileError, insert_products, run_import_job
+from aso.models import (
+    Cart, CartItem, Category, ImageDerivativeJob, ImportJob, NumberSequence, Order, OrderItem, Product, ProductCard,
+    ProductColor, ProductDetail, ProductImage, ProductSize, Promotion, RelatedProduct, UserCounter, WatchList,
+    discounted_price,
+)
+from aso.numbers import NumberAllocator, format_number, reserve_numbers
+from aso.promotions import promotion_index, promotions_version
+from aso.repricing import create_campaign, revert_campaign
+from aso.related import rebuild_related_products, seed_related_products
+from aso.search import search_products
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
 # Create your tests here.
+
+
+class ProductDetailQueryBudgetTests(TestCase):
+    # product check behind the validators, catalog version, product +
+    # category, colors, sizes, details, images, related products
+    ANONYMOUS_BUDGET = 9
+    # ...plus the watchlist stamp behind the ETag
+    AUTHENTICATED_BUDGET = 10
+
+    def setUp(self):
+        cache.clear()
+        catalog_response_cache.clear()
+
+        category = Category.objects.create(name="Aso Oke")
+        self.products = []
+        for i in range(12):
+            product = Product.objects.create(
+                title=f"Product {i}", description="Handwoven", original_price=Decimal("25000"), discount_percent=10
+            )
+            product.category.add(category)
+            for size in ("S", "M", "L"):
+                ProductSize.objects.create(product=product, size_label=size)
+            for color in ("Red", "Gold"):
+                ProductColor.objects.create(product=product, color_name=color)
+            ProductDetail.objects.create(product=product, tab="details", title="Details", content="Cotton")
+            ProductImage.objects.create(product=product, image="products/gallery/x.jpg")
+            self.products.append(product)
+        rebuild_related_products()
+
+        self.product = self.products[0]
+        self.url = f"/aso/api/product/{self.product.id}/"
+        self.client = APIClient()
+
+    def tearDown(self):
+        product_views.flush()
+
+    def test_anonymous_detail_query_budget(self):
+        with self.assertNumQueries(self.ANONYMOUS_BUDGET):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["sizes"]), 3)
+        self.assertEqual(len(data["colors"]), 2)
+        self.assertEqual(len(data["images"]), 1)
+        self.assertEqual(len(data["related_products"]), 8)
+        self.assertFalse(data["watchlisted"])
+
+    def test_authenticated_detail_query_budget(self):
+        user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        WatchList.objects.create(user=user, product=self.product)
+        self.client.force_authenticate(user)
+
+        with self.assertNumQueries(self.AUTHENTICATED_BUDGET):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["watchlisted"])
+
+    def test_view_is_counted_without_a_write(self):
+        with self.assertNumQueries(self.ANONYMOUS_BUDGET):
+            self.client.get(self.url)
+
+        self.assertEqual(product_views.pending().get(self.product.id), 1)
+        product_views.flush()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reviews_count, 1)
+
+    def test_only_found_products_are_counted(self):
+        hidden = self.products[1]
+        Product.objects.filter(pk=hidden.pk).update(display_product=False)
+
+        self.assertEqual(self.client.get(f"/aso/api/product/{hidden.id}/").status_code, 404)
+        self.assertEqual(self.client.get("/aso/api/product/999999/").status_code, 404)
+        self.assertEqual(product_views.pending(), {})
+
+        etag = self.client.get(self.url)["ETag"]
+        self.assertEqual(self.client.get(self.url)["X-Cache"], "HIT")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A validator from a real product doesn't make other ids count
+        for path in ("/aso/api/product/999999/", f"/aso/api/product/{hidden.id}/"):
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(product_views.pending(), {self.product.id: 3})
+
+
+class SharedCatalogVersionTests(TestCase):
+    def test_bump_reaches_every_worker(self):
+        # Two worker processes, each with its own response cache
+        worker_a, worker_b = ResponseCache(10_000), ResponseCache(10_000)
+        key = ("/aso/api/products/", ())
+        version = catalog_version()
+        worker_a.set(version, key, b"[]")
+        worker_b.set(version, key, b"[]")
+
+        # A catalog write handled by worker A
+        Product.objects.create(title="New", description="Handwoven", original_price=Decimal("25000"))
+
+        # Worker B sees the new version without hearing from worker A
+        self.assertNotEqual(catalog_version(), version)
+        self.assertIsNone(worker_b.get(catalog_version(), key))
+        self.assertIsNone(worker_a.get(catalog_version(), key))
+
+    def test_promotion_change_rebuilds_the_index(self):
+        index = promotion_index()
+        promotion = Promotion.objects.create(name="Sale", kind="percent_off", percent_off=10)
+
+        # Any worker's index is stale once the shared version moves
+        self.assertFalse(index.is_current(promotions_version(), timezone.now()))
+        self.assertEqual(promotion_index().rule_ids, (promotion.id,))
+
+
+class ConditionalCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_response_cache.clear()
+        self.product = Product.objects.create(title="Gele", description="x", original_price=Decimal("25000"))
+        self.client = APIClient()
+
+    def tearDown(self):
+        product_views.flush()
+
+    def test_anonymous_listing_is_served_from_the_cache(self):
+        first = self.client.get("/aso/api/product/")
+        self.assertEqual(first["X-Cache"], "MISS")
+
+        # The shared versions are the only query left
+        with self.assertNumQueries(1):
+            second = self.client.get("/aso/api/product/")
+        self.assertEqual(second["X-Cache"], "HIT")
+        self.assertEqual(second.content, first.content)
+
+        # Query parameter order doesn't split the cache
+        self.client.get("/aso/api/product/?ordering=rating&badge=New")
+        self.assertEqual(self.client.get("/aso/api/product/?badge=New&ordering=rating")["X-Cache"], "HIT")
+
+        self.product.title = "Gold gele"
+        self.product.save()
+        third = self.client.get("/aso/api/product/")
+        self.assertEqual(third["X-Cache"], "MISS")
+        self.assertEqual(third.json()["results"][0]["title"], "Gold gele")
+
+    def test_signed_in_listing_skips_the_cache(self):
+        user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.client.force_authenticate(user)
+        self.client.get("/aso/api/product/")
+        self.assertNotIn("X-Cache", self.client.get("/aso/api/product/"))
+
+    def test_unchanged_catalog_answers_304(self):
+        response = self.client.get(f"/aso/api/product/{self.product.id}/")
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        # The product check and the shared versions
+        with self.assertNumQueries(2):
+            response = self.client.get(f"/aso/api/product/{self.product.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get(f"/aso/api/product/{self.product.id}/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        self.product.title = "Gold gele"
+        self.product.save()
+        response = self.client.get(f"/aso/api/product/{self.product.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_product_validators_are_per_product(self):
+        other = Product.objects.create(title="Fila", description="x", original_price=Decimal("25000"))
+        hidden = Product.objects.create(title="Hidden", description="x", original_price=Decimal("25000"))
+        Product.objects.filter(pk=hidden.pk).update(display_product=False)
+        response = self.client.get(f"/aso/api/product/{self.product.id}/")
+        etag, last_modified = response["ETag"], response["Last-Modified"]
+
+        response = self.client.get(f"/aso/api/product/{other.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        for path in ("/aso/api/product/999999/", f"/aso/api/product/{hidden.id}/"):
+            for headers in ({"HTTP_IF_NONE_MATCH": etag}, {"HTTP_IF_MODIFIED_SINCE": last_modified}):
+                response = self.client.get(path, **headers)
+                self.assertEqual(response.status_code, 404)
+                self.assertNotIn("ETag", response)
+
+    def test_cart_etag_follows_cart_edits(self):
+        user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.client.force_authenticate(user)
+        self.client.post("/aso/api/product/cart/batch/", {"operations": [
+            {"op": "add", "product_id": self.product.id},
+        ]}, format="json")
+        etag = self.client.get("/aso/api/product/cart/")["ETag"]
+        self.assertEqual(self.client.get("/aso/api/product/cart/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post("/aso/api/product/cart/batch/", {"operations": [
+            {"op": "set_state", "state": "Lagos"},
+        ]}, format="json")
+        response = self.client.get("/aso/api/product/cart/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_response_cache_stays_within_its_size(self):
+        responses = ResponseCache(max_bytes=10)
+        responses.set(1, "a", b"12345")
+        responses.set(1, "b", b"12345")
+        responses.get(1, "a")
+        responses.set(1, "c", b"12345")
+
+        self.assertIsNone(responses.get(1, "b"))
+        self.assertEqual(responses.get(1, "a"), b"12345")
+        self.assertIsNone(responses.get(2, "a"))
+        self.assertEqual(responses.stats()["evictions"], 1)
+
+
+class CartDetailQueryBudgetTests(TestCase):
+    # cart stamp and shared versions for the ETag, the cart, its items with
+    # products and cards, colors, sizes, promotions version for pricing
+    BUDGET = 7
+
+    def setUp(self):
+        cache.clear()
+        promotion_index()
+
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.cart = Cart.objects.create(user=self.user, state="Lagos")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_items(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                title=f"Product {i}", description="Handwoven", original_price=Decimal("25000"), discount_percent=10
+            )
+            for size in ("S", "M", "L"):
+                ProductSize.objects.create(product=product, size_label=size)
+            for color in ("Red", "Gold"):
+                ProductColor.objects.create(product=product, color_name=color)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=2)
+
+    def assert_cart_page(self, count):
+        with self.assertNumQueries(self.BUDGET):
+            response = self.client.get("/aso/api/product/cart/")
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["items"]), count)
+        self.assertEqual(sorted(data["items"][0]["product_sizes"]), ["L", "M", "S"])
+        self.assertEqual(len(data["items"][0]["product_colors"]), 2)
+        self.assertEqual(Decimal(str(data["subtotal"])), Decimal("45000") * count)
+
+    def test_query_budget_does_not_grow_with_the_cart(self):
+        self.add_items(1)
+        self.assert_cart_page(1)
+
+        self.add_items(9)
+        self.assert_cart_page(10)
+
+
+class WatchlistQueryBudgetTests(TestCase):
+    # the count, the page, and the watchlisted ids loaded once per response
+    WATCHLIST_BUDGET = 3
+    # shared versions and watchlist stamp for the ETag, the count, the page, the watchlisted ids
+    CATALOG_BUDGET = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def watch(self, count):
+        for i in range(count):
+            product = Product.objects.create(title=f"Product {i}", description="x", original_price=Decimal("25000"))
+            WatchList.objects.create(user=self.user, product=product)
+
+    def assert_pages(self, count):
+        for url, budget in [
+            ("/aso/api/product/watchlist-products/", self.WATCHLIST_BUDGET),
+            ("/aso/api/product/", self.CATALOG_BUDGET),
+        ]:
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            results = response.json()["results"]
+            self.assertEqual(len(results), count)
+            self.assertTrue(all(product["watchlisted"] for product in results))
+
+    def test_query_budget_does_not_grow_with_the_watchlist(self):
+        self.watch(1)
+        self.assert_pages(1)
+
+        self.watch(9)
+        self.assert_pages(10)
+
+
+class PromotionTests(TestCase):
+    def setUp(self):
+        self.lace = Category.objects.create(name="Lace")
+        self.blouse = Product.objects.create(title="Lace blouse", description="x", original_price=Decimal("10000"))
+        self.blouse.category.add(self.lace)
+        self.gele = Product.objects.create(title="Gele", description="x", original_price=Decimal("3000"))
+
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.cart = Cart.objects.create(user=self.user, state="Lagos")
+        CartItem.objects.create(cart=self.cart, product=self.blouse, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=self.gele, quantity=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def cart_page(self):
+        response = self.client.get("/aso/api/product/cart/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_each_line_gets_its_best_rule(self):
+        product_rule = Promotion.objects.create(name="Blouse 10%", kind="percent_off", percent_off=10)
+        product_rule.products.add(self.blouse)
+        category_rule = Promotion.objects.create(name="Lace 25%", kind="percent_off", percent_off=25)
+        category_rule.categories.add(self.lace)
+        # Storewide, so it also competes on the blouse line
+        three_for_two = Promotion.objects.create(name="3 for 2", kind="buy_x_get_y", buy_quantity=2, get_quantity=1)
+
+        data = self.cart_page()
+
+        self.assertEqual(Decimal(str(data["discount"])), Decimal("8000.00"))
+        self.assertEqual(
+            [(promotion["id"], Decimal(str(promotion["amount"]))) for promotion in data["promotions"]],
+            [(category_rule.id, Decimal("5000.00")), (three_for_two.id, Decimal("3000.00"))],
+        )
+
+    def test_rules_limited_by_state_and_subtotal(self):
+        Promotion.objects.create(name="Oyo sale", kind="percent_off", percent_off=50, states=["Oyo"])
+        shipping = Promotion.objects.create(
+            name="Free Lagos delivery", kind="free_shipping", states=["lagos"], min_subtotal=Decimal("30000")
+        )
+        self.assertEqual(Decimal(str(self.cart_page()["discount"])), Decimal("0"))
+
+        shipping.min_subtotal = Decimal("29000")
+        shipping.save()
+        data = self.cart_page()
+        self.assertEqual(Decimal(str(data["discount"])), Decimal(str(data["shipping"])))
+        self.assertEqual([promotion["name"] for promotion in data["promotions"]], ["Free Lagos delivery"])
+
+    def test_scheduled_rules_apply_inside_their_window(self):
+        starts_at = timezone.now() + timedelta(hours=1)
+        Promotion.objects.create(name="Later", kind="percent_off", percent_off=10, starts_at=starts_at)
+        Promotion.objects.create(
+            name="Over", kind="percent_off", percent_off=10, ends_at=timezone.now() - timedelta(hours=1)
+        )
+
+        index = promotion_index()
+        self.assertEqual(index.rule_ids, ())
+        self.assertEqual(index.valid_until, starts_at)
+        self.assertFalse(index.is_current(promotions_version(), starts_at))
+
+        with mock.patch("aso.promotions.timezone.now", return_value=starts_at):
+            self.assertEqual(Decimal(str(self.cart_page()["discount"])), Decimal("2900.00"))
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(title=f"Product {i}", description="x", original_price=Decimal("1000"))
+            for i in range(12)
+        ]
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.cart = Cart.objects.create(user=self.user, state="Lagos")
+        self.item = CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=1, desc={})
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, *operations):
+        return self.client.post("/aso/api/product/cart/batch/", {"operations": list(operations)}, format="json")
+
+    def test_operations_apply_in_order(self):
+        response = self.batch(
+            {"op": "add", "product_id": self.products[1].id, "quantity": 2},
+            {"op": "add", "product_id": self.products[2].id},
+            {"op": "update_quantity", "item_id": self.item.id, "quantity": 4},
+            {"op": "update_desc", "item_id": self.item.id, "desc": {"size": "M"}},
+            {"op": "add", "product_id": self.products[1].id, "quantity": 5},
+            {"op": "set_state", "state": "Oyo"},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["items"]), 3)
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.quantity, self.item.desc), (4, {"size": "M"}))
+        # Adding a product already in the batch updates it instead
+        self.assertEqual(CartItem.objects.get(cart=self.cart, product=self.products[1]).quantity, 5)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.state, "Oyo")
+
+    def test_failing_operation_rolls_back_the_batch(self):
+        response = self.batch(
+            {"op": "add", "product_id": self.products[1].id},
+            {"op": "update_quantity", "item_id": self.item.id, "quantity": 9},
+            {"op": "remove", "item_id": self.item.id},
+            {"op": "update_quantity", "item_id": self.item.id, "quantity": 2},
+        )
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"error": "Item not found.", "index": 3})
+        self.assertEqual(list(CartItem.objects.filter(cart=self.cart)), [self.item])
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 1)
+
+        response = self.batch({"op": "set_state", "state": "Oyo"}, {"op": "add", "product_id": 999999})
+        self.assertEqual(response.json(), {"error": "Product not found.", "index": 1})
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.state, "Lagos")
+
+    def test_invalid_operations_are_reported_by_index(self):
+        response = self.batch({"op": "set_state", "state": "Oyo"}, {"op": "update_quantity", "item_id": self.item.id})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()["error"]["operations"]), ["1"])
+        self.assertIn("quantity", response.json()["error"]["operations"]["1"])
+
+    def test_writes_do_not_grow_with_the_batch(self):
+        def batch_queries(products):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.batch(*({"op": "add", "product_id": product.id} for product in products))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        # The first request also builds the promotion index
+        batch_queries(self.products[1:2])
+        self.assertEqual(batch_queries(self.products[2:4]), batch_queries(self.products[4:12]))
+
+
+class CartMergeTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(title=f"Product {i}", description="x", original_price=Decimal("1000"))
+            for i in range(12)
+        ]
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=self.cart, product=self.products[0], quantity=5)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_reorder_adds_only_the_missing_products(self):
+        order = Order.objects.create(user=self.user, subtotal=0, shipping_fee=0, total=0)
+        for product, quantity in [(self.products[0], 1), (self.products[1], 2), (self.products[2], 7)]:
+            OrderItem.objects.create(order=order, product=product, quantity=quantity, price=Decimal("1000"))
+        updated_at = self.cart.updated_at
+
+        response = self.client.post(f"/aso/api/product/cart/reorder/?order_id={order.id}")
+
+        self.assertEqual(response.json(), {"items_added": 2})
+        # Products already in the cart keep their quantity
+        self.assertEqual(
+            dict(self.cart.items.values_list("product_id", "quantity")),
+            {self.products[0].id: 5, self.products[1].id: 2, self.products[2].id: 7},
+        )
+        self.cart.refresh_from_db()
+        self.assertGreater(self.cart.updated_at, updated_at)
+        self.assertEqual(self.client.get("/aso/api/product/watchlist-and-cart-count/").json()["item_count"], 3)
+
+        response = self.client.post(f"/aso/api/product/cart/reorder/?order_id={order.id}")
+        self.assertEqual(response.json(), {"items_added": 0})
+
+        stranger = User.objects.create_user(email="other@example.com", password="x", first_name="a", last_name="b")
+        self.client.force_authenticate(stranger)
+        self.assertEqual(self.client.post(f"/aso/api/product/cart/reorder/?order_id={order.id}").status_code, 404)
+
+    def test_move_all_to_cart_counts_new_items(self):
+        for product in self.products[:3]:
+            WatchList.objects.create(user=self.user, product=product)
+
+        self.assertEqual(self.client.post("/aso/api/product/move-all-to-cart/").json(), {"items_added": 2})
+        self.assertEqual(self.client.post("/aso/api/product/move-all-to-cart/").json(), {"items_added": 0})
+        self.assertEqual(self.cart.items.count(), 3)
+
+    def test_merge_queries_do_not_grow_with_the_products(self):
+        def merge_queries(products):
+            with CaptureQueriesContext(connection) as queries:
+                added = cart_store.ORMCartStore().merge(self.user, dict.fromkeys((p.id for p in products), 1))
+            self.assertEqual(added, len(products))
+            return len(queries)
+
+        self.assertEqual(merge_queries(self.products[1:3]), merge_queries(self.products[3:12]))
+
+
+def redis_test_client():
+    """fakeredis if installed, else the CART_REDIS_URL server if it answers."""
+    if fakeredis is not None:
+        return fakeredis.FakeRedis(decode_responses=True)
+    import redis
+
+    client = redis.Redis.from_url(settings.CART_REDIS_URL, decode_responses=True)
+    try:
+        client.ping()
+    except redis.ConnectionError:
+        return None
+    return client
+
+
+@override_settings(CART_STORE="aso.cart_store.RedisCartStore")
+class RedisCartStoreTests(TestCase):
+    def setUp(self):
+        client = redis_test_client()
+        if client is None:
+            self.skipTest("needs fakeredis or a Redis server at CART_REDIS_URL")
+        self.store = cart_store._store = cart_store.RedisCartStore(client=client)
+
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.products = [
+            Product.objects.create(
+                title=f"Product {i}", description="Handwoven", original_price=Decimal("25000"), discount_percent=10
+            )
+            for i in range(3)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        self.store.client.delete(*self.store._keys(self.user))
+        cart_store._store = None
+
+    def test_cart_edits_stay_out_of_the_database(self):
+        response = self.client.post("/aso/api/product/cart/batch/", {"operations": [
+            {"op": "add", "product_id": self.products[0].id, "quantity": 2},
+            {"op": "add", "product_id": self.products[1].id},
+            {"op": "set_state", "state": "Lagos"},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch("/aso/api/product/cart/update-quantity/", {"item_id": 2, "quantity": 3}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+        data = self.client.get("/aso/api/product/cart/").json()
+        self.assertEqual([(item["id"], item["quantity"]) for item in data["items"]], [(1, 2), (2, 3)])
+        self.assertEqual(Decimal(str(data["subtotal"])), Decimal("112500"))
+        self.assertEqual(self.client.get("/aso/api/product/watchlist-and-cart-count/").json()["item_count"], 2)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_checkout_materializes_the_stored_cart(self):
+        self.store.merge(self.user, {self.products[0].id: 1, self.products[2].id: 4})
+
+        cart, pricing = self.store.checkout_cart(self.user)
+        self.assertEqual([(line.item.product_id, line.quantity) for line in pricing.lines], [
+            (self.products[0].id, 1), (self.products[2].id, 4),
+        ])
+        self.assertEqual(pricing.subtotal, Decimal("112500"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.clear(self.user)
+        self.assertIsNone(self.store.checkout_cart(self.user))
+
+
+class NumberAllocationTests(TestCase):
+    def take(self, allocator, count=1):
+        # The leftovers of a block are only kept once its transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return allocator.take(count)
+
+    def test_allocators_get_disjoint_blocks(self):
+        first, second = NumberAllocator("test", block_size=5), NumberAllocator("test", block_size=5)
+        taken = []
+        for allocator, count in [(first, 3), (second, 3), (first, 4), (second, 1), (first, 7), (second, 6)]:
+            taken.extend(self.take(allocator, count))
+
+        self.assertEqual(len(taken), len(set(taken)))
+        next_value = NumberSequence.objects.get(name="test").next_value
+        self.assertLess(max(taken), next_value)
+        self.assertEqual(reserve_numbers("test", 10), next_value)
+
+    def test_rollback_leaves_gaps_not_duplicates(self):
+        allocator = NumberAllocator("test", block_size=5)
+        kept = self.take(allocator)
+        # A number from a committed block, taken by a transaction that rolls back
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            lost = allocator.take(1)
+            raise DatabaseError
+        # A block reserved by a transaction that rolls back
+        with self.assertRaises(DatabaseError), transaction.atomic():
+            allocator.take(10)
+            raise DatabaseError
+
+        later = self.take(allocator, 10)
+        self.assertEqual(lost, [kept[0] + 1])
+        # Whatever the rolled back transactions took stays unused: gaps
+        self.assertGreater(later[0], lost[0] + 1)
+        self.assertEqual(later, list(range(later[0], later[0] + 10)))
+        # The dropped block's leftovers are never handed out twice
+        self.assertEqual(self.take(NumberAllocator("test", block_size=5)), [later[-1] + 1])
+
+    def test_number_formats(self):
+        product = Product.objects.create(title="Gele", description="x", original_price=Decimal("25000"))
+        order = Order.objects.create(user=User.objects.create_user(
+            email="buyer@example.com", password="x", first_name="a", last_name="b",
+        ), subtotal=0, shipping_fee=0, total=0)
+
+        self.assertRegex(product.product_number, r"^#AO-P-\d{4,}$")
+        self.assertRegex(order.order_number, r"^#AO-OD-\d{4,}$")
+        # Both numbers of an order share one allocated number
+        self.assertEqual(order.tracking_number, order.order_number.replace("#AO-OD-", "#AO-OT-"))
+        self.assertEqual(format_number("#AO-P-", 7), "#AO-P-0007")
+        self.assertEqual(format_number("#AO-OD-", 12345), "#AO-OD-12345")
+
+    def test_migration_continues_after_the_highest_number(self):
+        seed_sequences = import_module("aso.migrations.0028_numbersequence").seed_sequences
+        user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        products = [
+            Product.objects.create(title=f"Product {i}", description="x", original_price=Decimal("25000"))
+            for i in range(3)
+        ]
+        Product.objects.filter(pk=products[0].pk).update(product_number="#AO-P-0041")
+        Product.objects.filter(pk=products[1].pk).update(product_number="#AO-P-LEGACY")
+        order = Order.objects.create(user=user, subtotal=0, shipping_fee=0, total=0)
+        Order.objects.filter(pk=order.pk).update(order_number="#AO-OD-0107")
+        NumberSequence.objects.all().delete()
+
+        seed_sequences(django_apps, None)
+
+        self.assertEqual(NumberSequence.objects.get(name="product").next_value, 42)
+        self.assertEqual(NumberSequence.objects.get(name="order").next_value, 108)
+        # Without issued numbers, the highest id (the old scheme) is the floor
+        NumberSequence.objects.all().delete()
+        Product.objects.update(product_number=None)
+        seed_sequences(django_apps, None)
+        self.assertEqual(NumberSequence.objects.get(name="product").next_value, products[-1].pk + 1)
+
+
+def import_item(i, **fields):
+    return {
+        "title": f"Imported {i}", "description": "Handwoven", "original_price": "25000", "discount_percent": 10,
+        "rating": 4.5, "category": ["Aso Oke"], "sizes": ["S", "M"], "colors": [{"name": "Gold", "hex": "#FFD700"}],
+        "details": [{"tab": "details", "content": "Cotton"}], **fields,
+    }
+
+
+class ProductImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_user(email="admin@example.com", password="x", first_name="a", last_name="b")
+        self.admin.groups.add(Group.objects.get_or_create(name="admin")[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_only_admins_import(self):
+        self.client.force_authenticate(None)
+        lines = json.dumps(import_item(0)).encode("utf-8")
+        for body, content_type in ((json.dumps([import_item(0)]), "application/json"), (lines, "application/x-ndjson")):
+            response = self.client.post("/aso/api/product/import-products/", body, content_type=content_type)
+            self.assertEqual(response.status_code, 401)
+
+        shopper = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.client.force_authenticate(shopper)
+        response = self.client.post("/aso/api/product/import-products/", lines, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Product.objects.exists())
+
+    def test_batch_is_created_with_its_relations(self):
+        Category.objects.create(name="Aso Oke")
+        items = [import_item(i) for i in range(3)]
+        items[1] = import_item(1, category=["Aso Oke", "Lace", "Lace"], sizes=["S", "S"])
+        items[2] = import_item(2, discount_percent="lots")
+
+        response = self.client.post("/aso/api/product/import-products/", items, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["products_created"], 2)
+        self.assertEqual([error["index"] for error in response.json()["errors"]], [2])
+        product = Product.objects.get(title="Imported 1")
+        self.assertFalse(product.display_product)
+        self.assertEqual(product.current_price, Decimal("22500.00"))
+        self.assertTrue(product.product_number.startswith("#AO-P-"))
+        self.assertEqual(sorted(product.category.values_list("name", flat=True)), ["Aso Oke", "Lace"])
+        self.assertEqual(list(product.sizes.values_list("size_label", flat=True)), ["S"])
+        self.assertEqual(list(product.colors.values_list("hex_code", flat=True)), ["#FFD700"])
+        self.assertEqual(list(product.details.values_list("title", flat=True)), ["Details"])
+        self.assertEqual(Category.objects.filter(name="Lace").count(), 1)
+        self.assertEqual(ProductCard.objects.get(product=product).title, "Imported 1")
+        self.assertEqual(search_products(Product.objects.all(), "Imported").count(), 2)
+
+    @override_settings(PRODUCT_IMPORT_CHUNK_SIZE=20)
+    def test_queries_do_not_grow_with_the_batch(self):
+        def import_queries(count, start):
+            items = [import_item(i) for i in range(start, start + count)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post("/aso/api/product/import-products/", items, format="json")
+            self.assertEqual(response.json()["products_created"], count)
+            return len(queries)
+
+        Category.objects.create(name="Aso Oke")
+        self.assertEqual(import_queries(5, 0), import_queries(20, 5))
+
+    def post_ndjson(self, lines):
+        response = self.client.post(
+            "/aso/api/product/import-products/", "\n".join(lines).encode("utf-8"),
+            content_type="application/x-ndjson",
+        )
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    @override_settings(PRODUCT_IMPORT_CHUNK_SIZE=2)
+    def test_ndjson_reports_each_line(self):
+        lines = [json.dumps(import_item(0)), "{not json", "", json.dumps(import_item(3, rating="high"))]
+        lines.append(json.dumps(import_item(4)))
+
+        results = self.post_ndjson(lines)
+
+        self.assertEqual([result.get("index") for result in results], [0, 1, 3, 4, None])
+        self.assertIn("id", results[0])
+        self.assertIn("line", results[1]["errors"])
+        self.assertIn("rating", results[2]["errors"])
+        self.assertEqual(results[-1], {"message": "Import finished", "products_created": 2, "products_failed": 2})
+        self.assertEqual(sorted(Product.objects.values_list("title", flat=True)), ["Imported 0", "Imported 4"])
+
+    @override_settings(PRODUCT_IMPORT_CHUNK_SIZE=1)
+    def test_ndjson_database_failure_ends_with_an_error_record(self):
+        def fail_after_first_chunk(rows, category_ids):
+            if Product.objects.exists():
+                raise DatabaseError("disk full")
+            return insert_products(rows, category_ids)
+
+        with mock.patch("aso.importer.insert_products", side_effect=fail_after_first_chunk):
+            results = self.post_ndjson([json.dumps(import_item(i)) for i in range(3)])
+
+        self.assertEqual(results[-1], {
+            "message": "Import failed", "error": "disk full", "products_created": 1, "products_failed": 0,
+        })
+        self.assertEqual(list(Product.objects.values_list("title", flat=True)), ["Imported 0"])
+
+
+class ImportJobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.admin = User.objects.create_user(email="admin@example.com", password="x", first_name="a", last_name="b")
+        self.admin.groups.add(Group.objects.get_or_create(name="admin")[0])
+        self.client = APIClient()
+
+    def test_only_admins_manage_jobs(self):
+        items = [import_item(0)]
+        self.assertEqual(self.client.post("/aso/api/product/import-jobs/", items, format="json").status_code, 401)
+        shopper = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.client.force_authenticate(shopper)
+        self.assertEqual(self.client.post("/aso/api/product/import-jobs/", items, format="json").status_code, 403)
+        self.assertFalse(ImportJob.objects.exists())
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.post("/aso/api/product/import-jobs/", items, format="json")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+
+        self.client.force_authenticate(shopper)
+        for path in (f"/aso/api/product/import-jobs/{job_id}/cancel/", f"/aso/api/product/import-jobs/{job_id}/resume/"):
+            self.assertEqual(self.client.post(path).status_code, 403)
+        self.assertEqual(self.client.get(f"/aso/api/product/import-jobs/{job_id}/").status_code, 403)
+
+    def test_job_reads_the_upload_in_chunks(self):
+        items = [import_item(i) for i in range(5)]
+        items[2] = import_item(2, original_price="free")
+        upload = SimpleUploadedFile("products.json", json.dumps(items).encode("utf-8"))
+        job = ImportJob.objects.create(upload=upload, user=self.admin, next_index=1)
+
+        self.assertEqual(run_import_job(job, chunk_size=2), "done")
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.next_index, job.total_rows), ("done", 5, 5))
+        self.assertEqual((job.rows_done, job.rows_failed), (3, 1))
+        self.assertEqual([error["index"] for error in job.row_errors], [2])
+        self.assertEqual(
+            sorted(Product.objects.values_list("title", flat=True)), ["Imported 1", "Imported 3", "Imported 4"]
+        )
+
+    def test_broken_upload_is_reported(self):
+        job = ImportJob.objects.create(upload=SimpleUploadedFile("products.json", b'[{"title": '), user=self.admin)
+        with self.assertRaises(ImportFileError):
+            run_import_job(job)
+
+
+class RelatedProductTests(TestCase):
+    def setUp(self):
+        aso_oke, lace = Category.objects.create(name="Aso Oke"), Category.objects.create(name="Lace")
+        self.products = []
+        for i in range(6):
+            product = Product.objects.create(
+                title=f"Product {i}", description="Handwoven", original_price=Decimal("25000"), display_product=True
+            )
+            product.category.add(aso_oke if i < 3 else lace)
+            self.products.append(product)
+
+        user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        order = Order.objects.create(user=user, subtotal=0, shipping_fee=0, total=0)
+        for product in (self.products[0], self.products[4]):
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.current_price)
+
+    def neighbours(self, product):
+        return list(RelatedProduct.objects.filter(product=product).order_by("rank").values_list("related_id", "score"))
+
+    def test_rebuilding_some_products_matches_a_full_rebuild(self):
+        rebuild_related_products()
+        expected = {product.id: self.neighbours(product) for product in self.products}
+        self.assertEqual(expected[self.products[0].id][0], (self.products[4].id, 2.0))
+
+        RelatedProduct.objects.all().delete()
+        self.assertEqual(rebuild_related_products([self.products[0].id, self.products[3].id]), 2)
+        self.assertEqual(self.neighbours(self.products[0]), expected[self.products[0].id])
+        self.assertEqual(self.neighbours(self.products[3]), expected[self.products[3].id])
+        self.assertFalse(RelatedProduct.objects.filter(product=self.products[1]).exists())
+
+    def test_migrate_seeds_an_empty_table(self):
+        seed_related_products()
+        self.assertEqual(len(self.neighbours(self.products[0])), 3)
+
+        # Built already: left to the scheduled rebuilds
+        RelatedProduct.objects.filter(product=self.products[0]).delete()
+        seed_related_products()
+        self.assertEqual(self.neighbours(self.products[0]), [])
+
+    def test_partial_migrate_skips_the_seed(self):
+        # e.g. `migrate aso 0022`, before the table exists
+        with mock.patch(
+            "aso.related.MigrationExecutor.migration_plan", return_value=[("aso.0025_relatedproduct", False)]
+        ), CaptureQueriesContext(connection) as queries:
+            seed_related_products()
+
+        self.assertFalse(any("aso_" in query["sql"] for query in queries))
+        self.assertFalse(RelatedProduct.objects.exists())
+
+
+class CatalogSearchTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Aso Oke")
+        self.in_title = [
+            Product.objects.create(title=f"Aso Oke wrapper {i}", description="x", original_price=Decimal("25000"))
+            for i in range(3)
+        ]
+        self.in_category = Product.objects.create(title="Gele", description="x", original_price=Decimal("25000"))
+        self.in_category.category.add(category)
+        Product.objects.create(title="Agbada", description="x", original_price=Decimal("25000"))
+
+    def test_title_matches_rank_first(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = list(search_products(ProductCard.objects.all(), "aso ok"))
+
+        # One query: the id__in filter and the rank subquery each MATCH once
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(queries[0]["sql"].count("MATCH"), 2)
+        self.assertEqual({card.product_id for card in results[:3]}, {product.id for product in self.in_title})
+        self.assertEqual(results[3].product_id, self.in_category.id)
+        self.assertEqual(len(results), 4)
+
+    def test_rank_can_be_filtered_on(self):
+        results = search_products(ProductCard.objects.all(), "aso")
+        third = list(results)[2]
+        rest = results.filter(
+            Q(search_rank__gt=third.search_rank) | Q(search_rank=third.search_rank, pk__gt=third.pk)
+        ).order_by("search_rank", "pk")
+        self.assertIn(self.in_category.id, [card.product_id for card in rest])
+
+    def test_results_compose_with_the_orm(self):
+        results = search_products(Product.objects.all(), "aso")
+        self.assertEqual(results.exclude(pk=self.in_category.pk).count(), 3)
+        self.assertEqual(
+            set(results.filter(category__name="Aso Oke").values_list("pk", flat=True)), {self.in_category.pk}
+        )
+        # As a subquery, with the rank still correlated to the outer rows
+        cards = search_products(ProductCard.objects.filter(product__in=results.values("pk")), "aso")
+        self.assertEqual(
+            {card.product_id: card.search_rank for card in cards},
+            dict(results.values_list("pk", "search_rank")),
+        )
+
+    def test_backends_without_an_index_fall_back_to_icontains(self):
+        with mock.patch("aso.search._vendor", return_value="mysql"):
+            cards = search_products(ProductCard.objects.all(), "Aso Oke")
+            products = search_products(Product.objects.all(), "Aso Oke")
+            expected = {product.id for product in self.in_title} | {self.in_category.id}
+            self.assertEqual({card.product_id for card in cards}, expected)
+            self.assertEqual({product.id for product in products}, expected)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_response_cache.clear()
+        # More than a page (21), with tied prices and search ranks
+        for i in range(25):
+            Product.objects.create(
+                title=f"Aso Oke {'gold ' * (i % 4)}{i}", description="x", original_price=Decimal(100 + i % 5)
+            )
+        self.client = APIClient()
+
+    def walk(self, url):
+        """Follow next links from ``url``; returns the ids and the response pages."""
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.json())
+            ids.extend(card["id"] for card in pages[-1]["results"])
+            url = pages[-1]["next"]
+        return ids, pages
+
+    def test_cursor_pages_follow_the_ordering(self):
+        with CaptureQueriesContext(connection) as queries:
+            ids, pages = self.walk("/aso/api/product/?ordering=-current_price&pagination=cursor")
+
+        expected = list(
+            ProductCard.objects.order_by("-current_price", "-pk").values_list("product_id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual([len(page["results"]) for page in pages], [21, 4])
+        self.assertFalse(any("COUNT(" in query["sql"] for query in queries))
+
+        previous = self.client.get(pages[-1]["previous"]).json()
+        self.assertEqual([card["id"] for card in previous["results"]], expected[:21])
+        self.assertIsNotNone(previous["next"])
+
+    def test_search_results_page_by_rank(self):
+        ids, pages = self.walk("/aso/api/product/?search=aso&pagination=cursor")
+
+        # search_rank is the key, so the cursor carries the bm25 score
+        self.assertEqual(len(pages), 2)
+        expected = list(
+            search_products(ProductCard.objects.all(), "aso")
+            .order_by("search_rank", "pk")
+            .values_list("product_id", flat=True)
+        )
+        self.assertEqual(ids, expected)
+
+    def test_page_numbers_stay_the_default(self):
+        data = self.client.get("/aso/api/product/").json()
+        self.assertEqual(data["count"], 25)
+        self.assertIn("page=2", data["next"])
+
+    def test_bad_cursor_is_not_found(self):
+        self.assertEqual(self.client.get("/aso/api/product/?cursor=bm90LWpzb24").status_code, 404)
+
+    def test_tampered_cursor_is_not_found(self):
+        def cursor(payload):
+            return base64.urlsafe_b64encode(json.dumps(payload).encode("utf-8")).decode("ascii")
+
+        for query, payload in [
+            ("ordering=created_at", {"v": "abc", "pk": 1, "r": False}),
+            ("ordering=-current_price", {"v": "abc", "pk": 1, "r": False}),
+            ("ordering=rating", {"v": None, "pk": 1, "r": False}),
+            ("ordering=rating", {"v": 4.5, "pk": "one", "r": False}),
+            ("ordering=rating", {"v": [4.5], "pk": 1, "r": False}),
+            ("ordering=rating", {"v": 4.5, "pk": 1, "r": "yes"}),
+            ("search=aso", {"v": "abc", "pk": 1, "r": False}),
+            ("ordering=rating", [4.5, 1, False]),
+        ]:
+            response = self.client.get(f"/aso/api/product/?{query}&cursor={cursor(payload)}")
+            self.assertEqual(response.status_code, 404, (query, payload))
+            self.assertEqual(response.json()["error"], "Invalid cursor")
+
+
+class CatalogFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        aso_oke, lace = Category.objects.create(name="Aso Oke"), Category.objects.create(name="Lace")
+        for title, price, badge, rating, category in [
+            ("Aso Oke wrapper", "5000", "New", 4.0, aso_oke),
+            ("Aso Oke gele", "30000", "Limited", 5.0, aso_oke),
+            ("Lace blouse", "30000", "New", 4.0, lace),
+            ("Lace agbada", "120000", "Best Seller", 5.0, lace),
+        ]:
+            product = Product.objects.create(
+                title=title, description="x", original_price=Decimal(price), badge=badge, rating=rating
+            )
+            product.category.add(category)
+        hidden = Product.objects.create(title="Aso Oke hidden", description="x", original_price=Decimal("5000"))
+        hidden.category.add(aso_oke)
+        Product.objects.filter(pk=hidden.pk).update(display_product=False)
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get("/aso/api/product/facets/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_each_facet_ignores_its_own_filter(self):
+        facets = self.facets(category="Aso Oke")
+
+        self.assertEqual(facets["total"], 2)
+        # The other categories stay selectable
+        self.assertEqual([(row["name"], row["count"]) for row in facets["category"]], [("Aso Oke", 2), ("Lace", 2)])
+        self.assertEqual({row["value"]: row["count"] for row in facets["badge"]}, {"Limited": 1, "New": 1})
+        self.assertEqual([band["count"] for band in facets["price"]], [1, 0, 1, 0, 0])
+        self.assertEqual({row["value"]: row["count"] for row in facets["rating"]}, {4.0: 1, 5.0: 1})
+
+        facets = self.facets(category="Aso Oke", badge="New")
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual({row["value"]: row["count"] for row in facets["badge"]}, {"Limited": 1, "New": 1})
+
+    def test_search_narrows_every_facet(self):
+        facets = self.facets(search="lace", min_price="10000")
+
+        self.assertEqual(facets["total"], 2)
+        self.assertEqual([(row["name"], row["count"]) for row in facets["category"]], [("Lace", 2)])
+        # The price facet ignores min_price, but not the search
+        self.assertEqual([band["count"] for band in facets["price"]], [0, 0, 1, 0, 1])
+
+    def test_numeric_filters_must_be_numbers(self):
+        for params in ({"min_price": "abc"}, {"max_price": "NaN"}, {"rating": "Infinity"}, {"min_price": "1e"}):
+            for path in ("/aso/api/product/facets/", "/aso/api/product/"):
+                response = self.client.get(path, params)
+                self.assertEqual(response.status_code, 400, (path, params))
+                self.assertEqual(response.json()["field"], next(iter(params)))
+
+        self.assertEqual(self.facets(min_price=" 30000.00 ", rating="5")["total"], 2)
+
+    def test_counts_are_cached_per_catalog_version(self):
+        self.facets(category="Aso Oke")
+        with self.assertNumQueries(1):  # the catalog version
+            self.facets(category="Aso Oke")
+
+        product = Product.objects.create(title="Aso Oke fila", description="x", original_price=Decimal("5000"))
+        product.category.add(Category.objects.get(name="Aso Oke"))
+        self.assertEqual(self.facets(category="Aso Oke")["total"], 3)
+
+
+def stored_photo(name):
+    buffer = BytesIO()
+    Image.new("RGB", (1200, 800), "gold").save(buffer, "JPEG")
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.photo = stored_photo("products/main/kente.jpg")
+        self.products = [
+            Product.objects.create(title=f"Product {i}", description="x", original_price=Decimal("25000"))
+            for i in range(2)
+        ]
+
+    def show(self, product, path):
+        with self.captureOnCommitCallbacks(execute=True):
+            product.main_image = path
+            product.save()
+        product.refresh_from_db()
+
+    def render(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            return process_image_jobs(executor, batch_size=10)
+
+    def test_saving_queues_without_reading_the_file(self):
+        with mock.patch("aso.images.file_digest") as digest:
+            self.show(self.products[0], self.photo)
+        digest.assert_not_called()
+        self.assertEqual(list(ImageDerivativeJob.objects.values_list("path", "content_hash")), [(self.photo, "")])
+
+        self.render()
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].main_image_variants["source"], self.photo)
+        self.assertEqual(ImageDerivativeJob.objects.get().content_hash, file_digest(self.photo))
+
+    def test_same_content_is_rendered_once(self):
+        self.show(self.products[0], self.photo)
+        self.render()
+
+        # The placeholder job a later save queues is answered from the first render
+        ImageDerivativeJob.objects.create(path=self.photo, content_hash="")
+        with mock.patch("aso.images.generate_variants") as generate:
+            self.render()
+        generate.assert_not_called()
+        self.assertEqual(ImageDerivativeJob.objects.count(), 1)
+
+    def test_shared_variants_are_kept_while_in_use(self):
+        for product in self.products:
+            self.show(product, self.photo)
+        self.render()
+        self.products[0].refresh_from_db()
+        variant_files = [
+            entry[image_format]
+            for entry in self.products[0].main_image_variants["variants"].values()
+            for image_format in ("webp", "jpeg")
+        ]
+
+        other = stored_photo("products/main/aso-oke.jpg")
+        self.show(self.products[0], other)
+        self.assertTrue(all(default_storage.exists(path) for path in variant_files))
+
+        self.products[1].refresh_from_db()
+        self.show(self.products[1], other)
+        self.assertFalse(any(default_storage.exists(path) for path in variant_files))
+
+
+class PriceCampaignTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Aso Oke")
+        # 10.05 at 10% off is 9.045: the half cent must round the same way everywhere
+        self.prices = [Decimal("10.05"), Decimal("25000"), Decimal("1234.55")]
+        self.products = []
+        for price in self.prices:
+            product = Product.objects.create(title="x", description="x", original_price=price, discount_percent=5)
+            product.category.add(category)
+            self.products.append(product)
+        self.other = Product.objects.create(title="y", description="y", original_price=Decimal("10.05"))
+
+    def test_campaign_prices_match_product_save(self):
+        campaign = create_campaign("Sale", 10, {"category": ["Aso Oke"]})
+        self.assertEqual((campaign.status, campaign.products_count), ("active", 3))
+
+        for product, price in zip(self.products, self.prices):
+            product.refresh_from_db()
+            self.assertEqual(product.discount_percent, 10)
+            self.assertEqual(product.current_price, discounted_price(price, 10))
+            self.assertEqual(product.card.current_price, product.current_price)
+            # Saving the row again derives the same price in Python
+            product.save()
+            product.refresh_from_db()
+            self.assertEqual(product.current_price, discounted_price(price, 10))
+        self.assertEqual(self.products[0].current_price, Decimal("9.05"))
+
+        self.other.refresh_from_db()
+        self.assertIsNone(self.other.discount_percent)
+
+    def test_revert_restores_previous_discounts(self):
+        campaign = create_campaign("Sale", 10, {"ids": [self.products[0].id, self.products[1].id]})
+        # Changed since the campaign started: keeps its own discount
+        edited = Product.objects.get(pk=self.products[1].id)
+        edited.discount_percent = 20
+        edited.save()
+
+        self.assertEqual(revert_campaign(campaign), 1)
+        first, second = Product.objects.get(pk=self.products[0].id), Product.objects.get(pk=self.products[1].id)
+        self.assertEqual((first.discount_percent, first.current_price), (5, discounted_price(self.prices[0], 5)))
+        self.assertEqual(first.card.current_price, first.current_price)
+        self.assertEqual(second.discount_percent, 20)
+
+
+class ProductCardSyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalog_response_cache.clear()
+        self.aso_oke, self.formal = Category.objects.create(name="Aso Oke"), Category.objects.create(name="Formal")
+        self.products = [
+            Product.objects.create(title=f"Product {i}", description="Handwoven", original_price=Decimal("25000"))
+            for i in range(3)
+        ]
+        self.products[0].category.add(self.aso_oke, self.formal)
+        self.products[1].category.add(self.aso_oke)
+        self.client = APIClient()
+
+    def listed(self, **params):
+        results = self.client.get("/aso/api/product/", params).json()["results"]
+        return sorted(card["id"] for card in results)
+
+    def test_category_filter_matches_whole_names(self):
+        self.assertEqual(self.listed(category="aso oke"), [self.products[0].id, self.products[1].id])
+        self.assertEqual(self.listed(category="Formal"), [self.products[0].id])
+        # Neither part of a name nor across two of them
+        self.assertEqual(self.listed(category="Aso"), [])
+        self.assertEqual(self.listed(category="Oke|Formal"), [])
+
+    def test_queryset_updates_refresh_the_cards(self):
+        Product.objects.filter(pk=self.products[0].pk).update(title="Gele", description="Long " * 40)
+        Product.objects.filter(pk__in=[p.pk for p in self.products[1:]]).update(display_product=False)
+        card = ProductCard.objects.get(pk=self.products[0].pk)
+        self.assertEqual(card.title, "Gele")
+        self.assertTrue(card.short_description.endswith("..."))
+        self.assertEqual(ProductCard.objects.filter(display_product=False).count(), 2)
+        self.assertEqual(
+            [product.pk for product in search_products(Product.objects.all(), "gele")], [self.products[0].pk]
+        )
+
+        for product in self.products:
+            product.rating = 4.5
+        Product.objects.bulk_update(self.products, ["rating"])
+        self.assertEqual(set(ProductCard.objects.values_list("rating", flat=True)), {4.5})
+
+
+class UserCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.products = [
+            Product.objects.create(title=f"Product {i}", description="x", original_price=Decimal("25000"))
+            for i in range(3)
+        ]
+        WatchList.objects.create(user=self.user, product=self.products[2])
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def badge(self):
+        return self.client.get("/aso/api/product/watchlist-and-cart-count/").json()
+
+    def stored(self):
+        return UserCounter.objects.values_list("item_count", "watchlist_count").get(user=self.user)
+
+    def test_cart_and_watchlist_edits_move_the_counter(self):
+        self.assertEqual(self.badge(), {"item_count": 0, "watchlist_count": 1})
+        for product in self.products[:2]:
+            self.client.post(f"/aso/api/product/add-to-cart/?product_id={product.id}&quantity=1")
+        self.client.put(f"/aso/api/product/toggle-watchlist/{self.products[2].id}/")
+        self.assertEqual(self.stored(), (2, 0))
+
+        item = CartItem.objects.filter(cart__user=self.user).first()
+        self.client.delete("/aso/api/product/cart/remove-item/", {"item_id": item.id}, format="json")
+        self.client.post("/aso/api/product/cart/batch/", {"operations": [
+            {"op": "add", "product_id": self.products[2].id},
+        ]}, format="json")
+        self.assertEqual(self.stored(), (2, 0))
+        self.assertEqual(self.badge(), {"item_count": 2, "watchlist_count": 0})
+
+    def test_checkout_empties_the_counter(self):
+        self.badge()  # creates the counter row
+        self.client.post("/aso/api/product/cart/batch/", {"operations": [
+            {"op": "add", "product_id": product.id} for product in self.products
+        ]}, format="json")
+        self.assertEqual(self.stored(), (3, 1))
+
+        paystack = mock.Mock(status_code=200)
+        address = {
+            "first_name": "Ada", "last_name": "Obi", "address": "1 Marina", "city": "Lagos", "state": "Lagos",
+            "phone": "08000000000", "alt_phone": "08000000001",
+        }
+        paystack.json.return_value = {
+            "data": {"status": "success", "metadata": {"user_id": self.user.id, "data": address}}
+        }
+        with mock.patch("aso.paystack.req.get", return_value=paystack):
+            response = self.client.get("/aso/api/product/paystack-confirm-subscription/ref-1/")
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Order.objects.get(user=self.user).items.count(), 3)
+        self.assertEqual(self.stored(), (0, 1))
+        self.assertEqual(self.badge(), {"item_count": 0, "watchlist_count": 1})
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(email="admin@example.com", password="x", first_name="a", last_name="b")
+        self.admin.groups.add(Group.objects.get_or_create(name="Admin")[0])
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        self.shopper = User.objects.create_user(email="buyer@example.com", password="x", first_name="a", last_name="b")
+        self.product = Product.objects.create(
+            title="Gold Agbada", description="Handwoven", original_price=Decimal("100")
+        )
+        self.product.category.add(Category.objects.create(name="Aso Oke"), Category.objects.create(name="Formal Wear"))
+        order = Order.objects.create(user=self.shopper, subtotal=200, shipping_fee=10, total=210)
+        OrderItem.objects.create(order=order, product=self.product, quantity=2, price=Decimal("100"))
+
+    def export(self, dataset, file_format="ndjson"):
+        response = self.client.get(f"/admins/api/admin/export/{dataset}/", {"file_format": file_format})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_customers_are_shoppers_only(self):
+        rider = User.objects.create_user(email="rider@example.com", password="x", first_name="a", last_name="b")
+        rider.groups.add(Group.objects.get_or_create(name="Rider")[0])
+        User.objects.create_superuser(email="root@example.com", password="x", first_name="a", last_name="b")
+
+        rows = [json.loads(line) for line in self.export("customers").splitlines()]
+
+        self.assertEqual([row["email"] for row in rows], ["buyer@example.com"])
+        self.assertEqual((rows[0]["orders_count"], Decimal(rows[0]["total_spent"])), (1, Decimal("210")))
+
+    def test_orders_have_a_row_per_line_item(self):
+        rows = [json.loads(line) for line in self.export("orders").splitlines()]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(
+            (rows[0]["customer_email"], rows[0]["status"], rows[0]["product_title"], rows[0]["quantity"]),
+            ("buyer@example.com", "placed", "Gold Agbada", 2),
+        )
+
+    def test_products_csv(self):
+        lines = self.export("products", file_format="csv").splitlines()
+
+        self.assertEqual(lines[0].split(",")[:4], ["id", "product_number", "title", "categories"])
+        self.assertIn('"Aso Oke, Formal Wear"', lines[1])
+        self.assertEqual(len(lines), 2)
+
+    def test_only_admins_export(self):
+        self.client.force_authenticate(self.shopper)
+        self.assertEqual(self.client.get("/admins/api/admin/export/customers/").status_code, 401)
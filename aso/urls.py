@@ -9,6 +9,7 @@ urlpatterns = [
                 path("", ProductListView.as_view()),
                 path('<int:id>/', ProductDetailView.as_view(), name='product-detail'),
                 path("categories/", CategoriesView.as_view()),
+                path("facets/", ProductFacetsView.as_view()),
                 path("lists/", UserOrderListView.as_view()),
                 path('order-details/<int:pk>/', OrderDetailView.as_view()),
                 path('watchlist-and-cart-count/', CartAndWatchlistCountView.as_view()),
@@ -19,6 +20,7 @@ urlpatterns = [
                 path('move-all-to-cart/', MoveAllToCartView.as_view()),
                 path('cart/', CartDetailAPIView.as_view(), name='cart-detail'),
                 path('add-to-cart/', AddToCartView.as_view()),
+                path('cart/batch/', CartBatchView.as_view()),
                 path('cart/update-quantity/', UpdateCartQuantityView.as_view()),
                 path('cart/update-desc/', UpdateCartDescView.as_view()),
                 path('cart/remove-item/', RemoveCartItemView.as_view()),
@@ -26,6 +28,10 @@ urlpatterns = [
                 path('place-orders/', PlaceOrderView.as_view(), name='place-order'),
                 path('paystack-confirm-subscription/<str:reference>/', PaystackConfirmSubscriptionView.as_view(), name='paystack-confirm-subscription'),
                 path('import-products/', ProductBulkImportView.as_view(), name='import-products'),
+                path('import-jobs/', ImportJobCreateView.as_view(), name='import-jobs'),
+                path('import-jobs/<int:pk>/', ImportJobDetailView.as_view(), name='import-job-detail'),
+                path('import-jobs/<int:pk>/cancel/', CancelImportJobView.as_view()),
+                path('import-jobs/<int:pk>/resume/', ResumeImportJobView.as_view()),
                 path('activate-products/', ActivateProductsAPIView.as_view()),
                 path('delivery-fees/', DeliveryFeeAPIView.as_view(), name='delivery-fees'),
                 
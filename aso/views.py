@@ -1,4 +1,6 @@
-from django.shortcuts import redirect, render
+from django.shortcuts import get_object_or_404, redirect, render
+from django.core.files.base import ContentFile
+from django.http import StreamingHttpResponse
 import requests as req
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny
@@ -9,14 +11,22 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import OrderingFilter
 from django.core.mail import send_mail
 from administrator.models import UserVerification
+from administrator.permissions import IsAdminGroupPermission
 from .models import *
 from administrator.swagger import TaggedAutoSchema
 from .serializers import *
 from .deliveryFee import delivery_fees
 from .paystack import *
-from django.db.models import Q
+from .cache import anonymous_catalog_cache, bump_catalog_version
+from .cart_batch import CartBatchError
+from .cart_store import cart_store
+from .counters import deferred_user_counters, product_views
+from .conditional import cart_etag, cart_last_modified, catalog_etag, catalog_last_modified, conditional, delivery_fees_etag, order_etag, product_displayed, product_etag, product_last_modified
+from .facets import catalog_facets, filter_cards, normalize_filters
+from .importer import NDJSON_CONTENT_TYPE, import_ndjson, import_products
+from django.db.models import Exists, OuterRef, Prefetch, Q
 from rest_framework.exceptions import AuthenticationFailed
-import random, textwrap
+import json, random, textwrap
 # Create your views here.
 
 class OptionalJWTAuthentication(JWTAuthentication):
@@ -58,6 +68,10 @@ class OrderDetailView(generics.RetrieveAPIView):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+
+    @conditional(etag_func=order_etag)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
     
     
 class ReorderItemsView(generics.GenericAPIView):
@@ -77,17 +91,9 @@ class ReorderItemsView(generics.GenericAPIView):
         except Order.DoesNotExist:
             return Response({"error": "Order not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        cart, _ = Cart.objects.get_or_create(user=user)
-        items_added = 0
-
-        for item in order.items.all():
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=item.product,
-                defaults={"quantity": item.quantity}
-            )
-            if created:
-                items_added += 1
+        # Order lines are unique per product
+        quantities = dict(order.items.values_list("product_id", "quantity"))
+        items_added = cart_store().merge(user, quantities)
 
         serializer = AddToCartCountResponseSerializer({"items_added": items_added})
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -127,7 +133,8 @@ class RemoveAllWatchlistView(APIView):
 
     def delete(self, request):
         user = request.user
-        deleted_count, _ = WatchList.objects.filter(user=user).delete()
+        with deferred_user_counters():
+            deleted_count, _ = WatchList.objects.filter(user=user).delete()
         return Response({"message": f"{deleted_count} items removed."}, status=status.HTTP_200_OK)
     
     
@@ -138,22 +145,11 @@ class MoveAllToCartView(generics.GenericAPIView):
 
     def post(self, request):
         user = request.user
-        watchlist_items = WatchList.objects.filter(user=user)
-        if not watchlist_items.exists():
+        product_ids = list(WatchList.objects.filter(user=user).values_list("product_id", flat=True))
+        if not product_ids:
             return Response({"items_moved": 0}, status=status.HTTP_200_OK)
 
-        cart, _ = Cart.objects.get_or_create(user=user)
-        items_moved = 0
-
-        for item in watchlist_items:
-            product = item.product
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': 1}
-            )
-            if created:
-                items_moved += 1
+        items_moved = cart_store().merge(user, dict.fromkeys(product_ids, 1))
 
         serializer = AddToCartCountResponseSerializer({"items_added": items_moved})
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -172,36 +168,22 @@ class AddToCartView(generics.GenericAPIView):
         if not product_id:
             return Response({"error": "product_id is required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
-        
         try:
             desc_data = json.loads(desc) if isinstance(desc, str) else desc
         except json.JSONDecodeError:
             return Response({"error": "Invalid desc format"}, status=status.HTTP_400_BAD_REQUEST)
 
+        # An item already in the cart gets the new quantity and desc
+        operation = {"op": "add", "product_id": product_id, "quantity": quantity, "desc": desc_data}
+        operation = CartOperationSerializer(data={key: value for key, value in operation.items() if value})
+        if not operation.is_valid():
+            return Response({'error': operation.errors}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = cart_store().apply(request.user, [operation.validated_data])
+        except CartBatchError:
+            return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        items_moved = 0
-        cart_item, created = CartItem.objects.get_or_create(
-            cart=cart,
-            product=product,
-            defaults={"quantity": int(quantity) if quantity else 1, "desc": desc_data or {}}
-        )
-
-        if not created:
-            # Update quantity and desc if already in cart
-            if quantity is not None:
-                cart_item.quantity = int(quantity)
-            if desc_data:
-                cart_item.desc = desc_data
-            cart_item.save()
-        else:
-            items_moved += 1
-
-        serializer = AddToCartCountResponseSerializer({"items_added": items_moved})
+        serializer = AddToCartCountResponseSerializer({"items_added": result["added"]})
         return Response(serializer.data, status=status.HTTP_200_OK)
         
 
@@ -211,13 +193,42 @@ class CartDetailAPIView(generics.GenericAPIView):
     serializer_class = CartDetailSerializer
     swagger_schema = TaggedAutoSchema
 
+    @conditional(etag_func=cart_etag, last_modified_func=cart_last_modified)
     def get(self, request, *args, **kwargs):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
+        cart, pricing = cart_store().priced(request.user, detail=True)
+        serializer = self.get_serializer(cart, context={**self.get_serializer_context(), 'pricing': pricing})
         return Response(serializer.data)
 
         
 
+class CartBatchView(generics.GenericAPIView):
+    """
+    Apply a list of cart edits in one transaction and return the updated
+    cart, as cart/ renders it. Operations run in order; if any fails, none
+    is applied.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = CartBatchSerializer
+    swagger_schema = TaggedAutoSchema
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({'error': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        store = cart_store()
+        try:
+            store.apply(request.user, serializer.validated_data['operations'])
+        except CartBatchError as exc:
+            return Response(
+                {'error': exc.message, 'index': exc.index}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        cart, pricing = store.priced(request.user, detail=True)
+        data = CartDetailSerializer(cart, context={**self.get_serializer_context(), 'pricing': pricing}).data
+        return Response(data, status=status.HTTP_200_OK)
+
+
 class UpdateCartQuantityView(APIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UpdateQuantitySerializer
@@ -231,15 +242,11 @@ class UpdateCartQuantityView(APIView):
         item_id = serializer.validated_data["item_id"]
         quantity = serializer.validated_data["quantity"]
         
-        print(item_id, quantity)
-
         try:
-            item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            item.quantity = quantity
-            item.save()
+            cart_store().apply(request.user, [{"op": "update_quantity", "item_id": item_id, "quantity": quantity}])
             return Response({'message:': 'Ok'}, status=status.HTTP_200_OK)
 
-        except CartItem.DoesNotExist:
+        except CartBatchError:
             return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
     
     
@@ -257,15 +264,11 @@ class UpdateCartDescView(APIView):
         item_id = serializer.validated_data["item_id"]
         desc = serializer.validated_data["desc"]
         
-        print(item_id, desc)
-
         try:
-            item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            item.desc = desc
-            item.save()
+            cart_store().apply(request.user, [{"op": "update_desc", "item_id": item_id, "desc": desc}])
             return Response({'message:': 'Ok'}, status=status.HTTP_200_OK)
 
-        except CartItem.DoesNotExist:
+        except CartBatchError:
             return Response({"detail": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
     
 
@@ -283,11 +286,10 @@ class RemoveCartItemView(APIView):
         item_id = serializer.validated_data["item_id"]
 
         try:
-            item = CartItem.objects.get(id=item_id, cart__user=request.user)
-            item.delete()
+            cart_store().apply(request.user, [{"op": "remove", "item_id": item_id}])
             return Response({'message:': 'Ok'}, status=status.HTTP_200_OK)
 
-        except CartItem.DoesNotExist:
+        except CartBatchError:
             return Response({"error": "Item not found."}, status=status.HTTP_404_NOT_FOUND)
     
 
@@ -297,12 +299,7 @@ class UpdateCartStateView(APIView):
     def post(self, request):
         state = request.data.get("state")
 
-        try:
-            cart = request.user.cart
-        except Cart.DoesNotExist:
-            pass
-        cart.state = state
-        cart.save()
+        cart_store().apply(request.user, [{"op": "set_state", "state": state}])
         return Response(status=200)
     
     
@@ -316,12 +313,12 @@ class PlaceOrderView(generics.GenericAPIView):
         
         shipping_data = serializer.validated_data
 
-        try:
-            cart = request.user.cart
-        except Cart.DoesNotExist:
+        checkout = cart_store().checkout_cart(request.user)
+        if checkout is None:
             return Response({"error": "Cart not found."}, status=status.HTTP_400_BAD_REQUEST)
+        cart, pricing = checkout
 
-        expected_total = cart.total()
+        expected_total = pricing.total
         user_total = Decimal(shipping_data["total"])
 
         if expected_total != user_total:
@@ -367,10 +364,11 @@ class PaystackConfirmSubscriptionView(APIView):
     
     
 class ProductListView(generics.ListAPIView):
-    queryset = Product.objects.filter(display_product = True)
+    # Cards carry everything the listing needs, see ProductCard
+    queryset = ProductCard.objects.filter(display_product = True)
     authentication_classes = [OptionalJWTAuthentication]
     permission_classes = [AllowAny]
-    serializer_class = WatchlistProductSerializer
+    serializer_class = ProductCardSerializer
     swagger_schema = TaggedAutoSchema
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['badge']
@@ -378,37 +376,29 @@ class ProductListView(generics.ListAPIView):
     
     def get_queryset(self):
         queryset = super().get_queryset()
-        max_price = self.request.query_params.get('max_price')
-        min_price = self.request.query_params.get('min_price')
-        rating = self.request.query_params.get('rating')
-        search = self.request.query_params.get('search')
-        cat = self.request.query_params.get('category')
-        
-        if min_price:
-            queryset = queryset.filter(current_price__gte=min_price)
-
-        if max_price:
-            queryset = queryset.filter(current_price__lte=max_price)
-
-        if rating:
-            queryset = queryset.filter(rating=rating)
-
-        if cat:
-            queryset = queryset.filter(category__name__icontains=cat)
-
-        if search:
-            queryset = queryset.filter(
-                Q(title__icontains=search) |
-                Q(product_number__icontains=search) |
-                Q(category__name__icontains=search)
-            )
-
-        return queryset
+        filters = normalize_filters(self.request.query_params)
+        # badge is handled by DjangoFilterBackend
+        return filter_cards(queryset, filters, skip=("badge",))
         
 
     
     def get_serializer_context(self):
         return {"request": self.request}
+
+    @conditional(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+    @anonymous_catalog_cache
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    
+class ProductFacetsView(APIView):
+    authentication_classes = [OptionalJWTAuthentication]
+    permission_classes = [AllowAny]
+    swagger_schema = TaggedAutoSchema
+
+    def get(self, request):
+        # Takes the same filters as ProductListView
+        return Response(catalog_facets(request.query_params), status=status.HTTP_200_OK)
     
     
     
@@ -418,23 +408,44 @@ class ProductDetailView(generics.RetrieveAPIView):
     authentication_classes = [OptionalJWTAuthentication]
     permission_classes = [AllowAny]
     lookup_field = 'id'
+
+    def get_queryset(self):
+        # Everything ProductDetailFullSerializer touches, one query per relation
+        related = (
+            RelatedProduct.objects.filter(related__display_product=True)
+            .select_related('related')
+            .order_by('rank')[:8]
+        )
+        queryset = super().get_queryset().prefetch_related(
+            'category', 'colors', 'sizes', 'details', 'images',
+            Prefetch('related_links', queryset=related, to_attr='ranked_related'),
+        )
+        user = self.request.user
+        if user.is_authenticated:
+            queryset = queryset.annotate(
+                is_watchlisted=Exists(WatchList.objects.filter(user=user, product=OuterRef('pk')))
+            )
+        return queryset
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
     
+    def get(self, request, *args, **kwargs):
+        response = self.retrieve(request, *args, **kwargs)
+        # Count the view only for a displayed product, also when the page
+        # comes from the cache or as a 304. product_displayed() was already
+        # answered for the validators. The count is buffered and written in
+        # batches, see ViewCounter.
+        if product_displayed(request, kwargs['id']):
+            product_views.record(kwargs['id'])
+        return response
+
+    @conditional(etag_func=product_etag, last_modified_func=product_last_modified)
+    @anonymous_catalog_cache
     def retrieve(self, request, *args, **kwargs):
-        # Get the product
-        instance = self.get_object()
-
-        # Increment reviews_count
-        instance.reviews_count = (instance.reviews_count or 0) + 1
-        instance.save(update_fields=['reviews_count'])
-
-        # Serialize and return response
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return super().retrieve(request, *args, **kwargs)
     
     
 
@@ -444,21 +455,8 @@ class CartAndWatchlistCountView(generics.GenericAPIView):
     swagger_schema = TaggedAutoSchema
     
     def get(self, request):
-        cart_count = 0
-        watchlist_count = 0
-
-        try:
-            cart = Cart.objects.get(user=request.user)
-            cart_count = cart.items.count()
-        except Cart.DoesNotExist:
-            pass
-
-        watchlist_count = WatchList.objects.filter(user=request.user).count()
-
-        serializer = CartAndWatchlistCountSerializer({
-            'item_count': cart_count,
-            'watchlist_count': watchlist_count
-        })
+        # One primary-key read of the user's UserCounter row (plus the Redis cart, if used)
+        serializer = CartAndWatchlistCountSerializer(cart_store().header_counts(request.user))
 
         return Response(serializer.data)
     
@@ -468,6 +466,9 @@ class CategoriesView(APIView):
 
     # @swagger_auto_schema(tags=["Categories"])
     swagger_schema = TaggedAutoSchema
+
+    @conditional(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+    @anonymous_catalog_cache
     def get(self, request):
         categories = Category.objects.all()
         serializer = self.serializer_class(categories, many=True)
@@ -476,31 +477,83 @@ class CategoriesView(APIView):
     
     
 class ProductBulkImportView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminGroupPermission]
+
     def post(self, request):
+        if request.content_type.startswith(NDJSON_CONTENT_TYPE):
+            # Read line by line instead of parsing the whole body into request.data;
+            # request.stream is None for an empty body
+            lines = request.stream or []
+            return StreamingHttpResponse(import_ndjson(lines), content_type=NDJSON_CONTENT_TYPE)
+
         if not isinstance(request.data, list):
             return Response({'error': 'Data must be a list of products'}, status=status.HTTP_400_BAD_REQUEST)
 
-        created_count = 0
-        errors = []
-
-        for idx, item in enumerate(request.data):
-            serializer = ProductImportSerializer(data=item)
-            if serializer.is_valid():
-                serializer.save()
-                created_count += 1
-            else:
-                errors.append({
-                    "index": idx,
-                    "errors": serializer.errors
-                })
+        result = import_products(request.data)
 
         return Response({
             "message": "Import finished",
-            "products_created": created_count,
-            "errors": errors
+            "products_created": result["products_created"],
+            "errors": result["errors"]
         }, status=status.HTTP_200_OK)
         
 
+class ImportJobCreateView(APIView):
+    """
+    Queue a catalog import: a JSON file in ``file`` or the same list
+    import-products/ takes as the body. Poll import-jobs/<id>/ for progress.
+    """
+    permission_classes = [IsAuthenticated, IsAdminGroupPermission]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            if not isinstance(request.data, list):
+                return Response(
+                    {'error': 'Upload a file or send a list of products'}, status=status.HTTP_400_BAD_REQUEST
+                )
+            upload = ContentFile(json.dumps(request.data).encode('utf-8'), name='products.json')
+
+        job = ImportJob.objects.create(
+            upload=upload,
+            user=request.user,
+            total_rows=len(request.data) if isinstance(request.data, list) else None,
+        )
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ImportJobDetailView(generics.RetrieveAPIView):
+    permission_classes = [IsAuthenticated, IsAdminGroupPermission]
+    queryset = ImportJob.objects.all()
+    serializer_class = ImportJobSerializer
+
+
+class CancelImportJobView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminGroupPermission]
+
+    def post(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk)
+        # A queued job stops at once; a running one after its current chunk
+        if not ImportJob.objects.filter(pk=pk, status='pending').update(status='cancelled', cancel_requested=True):
+            ImportJob.objects.filter(pk=pk, status='running').update(cancel_requested=True)
+        job.refresh_from_db()
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+class ResumeImportJobView(APIView):
+    permission_classes = [IsAuthenticated, IsAdminGroupPermission]
+
+    def post(self, request, pk):
+        job = get_object_or_404(ImportJob, pk=pk)
+        resumed = ImportJob.objects.filter(pk=pk, status__in=['cancelled', 'failed']).update(
+            status='pending', cancel_requested=False, attempts=0, error=''
+        )
+        if not resumed:
+            return Response({'error': f"A {job.status} import can't be resumed"}, status=status.HTTP_400_BAD_REQUEST)
+        job.refresh_from_db()
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
 class RiderDashboardView(generics.GenericAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = RiderDashboardSerializer
@@ -848,7 +901,9 @@ class MarkOrderAsDeliveredView(generics.GenericAPIView):
 class ActivateProductsAPIView(APIView):
     def post(self, request):
         products_to_update = Product.objects.filter(display_product=False)
+        # The product queryset's update() flips their cards too
         count = products_to_update.update(display_product=True)
+        bump_catalog_version()
         return Response({"message": f"{count} products activated."}, status=status.HTTP_200_OK)
     
     
@@ -856,5 +911,7 @@ class DeliveryFeeAPIView(APIView):
     authentication_classes = [OptionalJWTAuthentication]
     permission_classes = [AllowAny]
 
+    @conditional(etag_func=delivery_fees_etag)
+    @anonymous_catalog_cache
     def get(self, request):
         return Response({"delivery_fees": delivery_fees})
\ No newline at end of file
@@ -204,7 +204,7 @@ REST_FRAMEWORK = {
     "DEFAULT_RENDERER_CLASSES": [
         "rest_framework.renderers.JSONRenderer",
     ],
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
+    "DEFAULT_PAGINATION_CLASS": "aso.pagination.PageOrCursorPagination",
     "PAGE_SIZE": 21,
     'DEFAULT_PARSER_CLASSES': (
         'rest_framework.parsers.JSONParser',
@@ -322,3 +322,50 @@ COOKIE_SETTINGS = {
 
 
 PAYSTACK_SECRET_KEY=os.getenv('PAYSTACK_SECRET_KEY')
+
+
+# Catalog facets: price band edges (naira) and how long counts are cached
+CATALOG_PRICE_BANDS = [10000, 25000, 50000, 100000]
+CATALOG_FACETS_CACHE_TIMEOUT = int(os.getenv('CATALOG_FACETS_CACHE_TIMEOUT', 300))
+
+# Upper bound on the rendered anonymous catalog responses kept per process
+CATALOG_RESPONSE_CACHE_MAX_BYTES = int(os.getenv('CATALOG_RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Seconds between writes of buffered product page views (0 disables the timer)
+PRODUCT_VIEW_FLUSH_INTERVAL = int(os.getenv('PRODUCT_VIEW_FLUSH_INTERVAL', 30))
+
+# Widths (px) of the resized product photos generated on upload, and their encoder quality
+PRODUCT_IMAGE_VARIANTS = {
+    'card': 400,
+    'detail': 900,
+    'zoom': 1600,
+}
+PRODUCT_IMAGE_QUALITY = int(os.getenv('PRODUCT_IMAGE_QUALITY', 80))
+
+# Image variant worker (python manage.py process_image_jobs): pool size, and
+# seconds after which a job left running by a dead worker is retried
+IMAGE_WORKER_PROCESSES = int(os.getenv('IMAGE_WORKER_PROCESSES', 2))
+IMAGE_JOB_TIMEOUT = int(os.getenv('IMAGE_JOB_TIMEOUT', 600))
+
+# Product/order numbers reserved per database round trip by each process
+NUMBER_BLOCK_SIZE = int(os.getenv('NUMBER_BLOCK_SIZE', 20))
+
+# Products written per transaction by the bulk importer (aso/importer.py)
+PRODUCT_IMPORT_CHUNK_SIZE = int(os.getenv('PRODUCT_IMPORT_CHUNK_SIZE', 200))
+
+# Catalog import worker (python manage.py process_import_jobs): seconds without
+# progress before a running job is retried, and row errors kept per job
+IMPORT_JOB_TIMEOUT = int(os.getenv('IMPORT_JOB_TIMEOUT', 600))
+IMPORT_JOB_MAX_ERRORS = int(os.getenv('IMPORT_JOB_MAX_ERRORS', 1000))
+
+# Rows fetched per database round trip by the admin exports
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+
+# Operations accepted by one cart/batch/ request
+CART_BATCH_MAX_OPERATIONS = int(os.getenv('CART_BATCH_MAX_OPERATIONS', 100))
+
+# Where carts are kept: aso.cart_store.ORMCartStore (the database) or
+# aso.cart_store.RedisCartStore, with its server and the seconds an untouched cart lives
+CART_STORE = os.getenv('CART_STORE', 'aso.cart_store.ORMCartStore')
+CART_REDIS_URL = os.getenv('CART_REDIS_URL', 'redis://localhost:6379/0')
+CART_REDIS_TTL = int(os.getenv('CART_REDIS_TTL', 60 * 60 * 24 * 30))